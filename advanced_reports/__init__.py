@@ -1,6 +1,7 @@
 import datetime
 import os
 import subprocess
+import threading
 
 def get_git_version():
     git_dir = os.path.abspath(
@@ -20,22 +21,99 @@ def get_git_version():
         git_info = ('', '0000000')
     return git_time.strftime('%Y.%m.%d') + '.' + git_info[1]
 
-__version__ = get_git_version()
+def get_version():
+    '''
+    Returns the version of the installed package, or the version of the git checkout.
+    '''
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('django-advanced-reports').version
+    except Exception:
+        return get_git_version()
+
+class LazyVersion(object):
+    '''
+    Looks up the version on first use, so importing advanced_reports doesn't start a subprocess.
+    '''
+    _version = None
+
+    def __str__(self):
+        if self._version is None:
+            self._version = get_version()
+        return self._version
+
+    def __unicode__(self):
+        return unicode(str(self))
+
+    def __repr__(self):
+        return repr(str(self))
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __ne__(self, other):
+        return str(self) != other
+
+__version__ = LazyVersion()
 
 REGISTRY = {}
+'''
+Maps slugs to report instances, or to the dotted paths of report classes that are not imported yet.
+'''
 
-def register(advreport):
-    REGISTRY[advreport.slug] = advreport
+_registry_lock = threading.Lock()
+
+def register(advreport, slug=None):
+    '''
+    Registers a report class, or a report instance. One instance is shared by all requests.
+
+    You can also register the dotted path of a report class with the slug of the report, for example
+    register('shop.reports.OrderReport', slug='orders'). The module of the report is then
+    imported when the report is used for the first time. The search index of such a report is
+    only kept up to date after it has been imported.
+    '''
+    if isinstance(advreport, basestring):
+        REGISTRY[slug] = advreport
+        return
+    if isinstance(advreport, type):
+        advreport = advreport()
+    _register_instance(advreport.slug, advreport)
+
+def _register_instance(slug, advreport):
+    from advanced_reports.defaults import install_context_attributes
+    install_context_attributes(type(advreport))
+    REGISTRY[slug] = advreport
+    if advreport.search_index:
+        from advanced_reports.search_index import connect_signals
+        connect_signals(advreport)
+    if advreport.payload_cache:
+        from advanced_reports.cache import connect_signals
+        connect_signals(advreport)
 
 def get_report_for_slug(slug):
-    return REGISTRY.get(slug, lambda: None)()
+    advreport = REGISTRY.get(slug)
+    if isinstance(advreport, basestring):
+        advreport = _import_report(slug, advreport)
+    return advreport
+
+def _import_report(slug, path):
+    from django.utils.importlib import import_module
+
+    with _registry_lock:
+        advreport = REGISTRY.get(slug)
+        if isinstance(advreport, basestring):
+            module_name, class_name = path.rsplit('.', 1)
+            report_class = getattr(import_module(module_name), class_name)
+            # Importing the module may have registered the report already.
+            advreport = REGISTRY.get(slug)
+            if isinstance(advreport, basestring):
+                advreport = report_class()
+                _register_instance(slug, advreport)
+    return advreport
 
 def get_report_or_404(slug):
     advreport = get_report_for_slug(slug)
     if advreport is None:
         from django.http import Http404
         raise Http404('No AdvancedReport matches the given query.')
-
-    advreport.internal_mode = False
-    advreport.report_header_visible = True
     return advreport
@@ -0,0 +1,46 @@
+'''
+Benchmarks for Advanced Reports. Run the whole suite with advanced_reports.benchmarks.run, or
+a single benchmark module with python -m, for example:
+
+    python -m advanced_reports.benchmarks.run --rows 10000,100000 --output results.json
+    python -m advanced_reports.benchmarks.column_values
+'''
+import os
+import timeit
+
+
+def configure(**options):
+    '''
+    Configures minimal Django settings, unless a settings module is in use.
+    '''
+    from django.conf import settings
+    if settings.configured or os.environ.get('DJANGO_SETTINGS_MODULE'):
+        return
+    defaults = {
+        'DATABASES': {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        'INSTALLED_APPS': ('django.contrib.contenttypes',),
+    }
+    defaults.update(options)
+    settings.configure(**defaults)
+
+
+def measure(func, repeat=10, setup=None):
+    '''
+    Returns the best wall time of repeat calls to func, in seconds. setup is called before
+    every call to func, but is not timed.
+    '''
+    return min(measure_all(func, repeat, setup))
+
+
+def measure_all(func, repeat=10, setup=None):
+    '''
+    Returns the wall times of repeat calls to func, in seconds.
+    '''
+    timings = []
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        func()
+        timings.append(timeit.default_timer() - start)
+    return timings
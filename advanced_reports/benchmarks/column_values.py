@@ -0,0 +1,110 @@
+'''
+Measures the cost of rendering the columns of a row, with the AccessorPlan of a report
+and with the per-row method lookups that were used before it.
+
+    python -m advanced_reports.benchmarks.column_values
+'''
+from advanced_reports.benchmarks import configure, measure
+
+configure()
+
+from django.utils.safestring import mark_safe
+
+from advanced_reports.defaults import AdvancedReport
+
+
+class Customer(object):
+    def __init__(self, i):
+        self.name = u'Customer %d' % i
+        self.city = u'Ghent'
+        self.country = None
+
+
+class Item(object):
+    def __init__(self, i):
+        self.pk = i
+        self.reference = u'R%05d' % i
+        self.status = 'paid' if i % 2 else 'new'
+        self.customer = Customer(i % 10)
+        self.amount = i * 3
+        self.vat = i * 0.21
+        self.created = u'2012-01-01'
+        self.updated = u'2012-01-02'
+        self.email = u'customer%d@example.com' % i
+        self.phone = u'+32 9 000 00 00'
+        self.notes = u''
+        self.quantity = i % 7
+        self.weight = i % 13
+
+    def get_status_display(self):
+        return self.status.capitalize()
+
+
+class BenchmarkReport(AdvancedReport):
+    slug = 'benchmark_column_values'
+    fields = ('reference', 'status', 'customer__name', 'customer__city', 'customer__country',
+              'amount', 'vat', 'total', 'created', 'updated', 'email', 'phone', 'notes',
+              'quantity', 'weight')
+
+    def get_total_html(self, item):
+        return u'<strong>%s</strong>' % (item.amount + item.vat)
+
+    def get_amount_class(self, item):
+        return u'number'
+
+    def get_vat_class(self, item):
+        return u'number'
+
+    def get_reference_style(self):
+        return u'width: 80px;'
+
+    def get_email_decorator(self, item):
+        return lambda html: u'<a href="mailto:%s">%s</a>' % (html, html)
+
+
+def legacy_get_item_html(advreport, field_name, item):
+    html = getattr(advreport, 'get_%s_html' % field_name, lambda i: None)(item)
+    if html is None:
+        html = advreport.lookup_item_value(field_name, item)
+
+    decorator = getattr(advreport, 'get_%s_decorator' % field_name, lambda i: None)(item)
+    if decorator is not None:
+        html = decorator(html)
+
+    return mark_safe(html)
+
+
+def legacy_get_column_values(advreport, item):
+    for field_name in advreport.fields:
+        yield {'html': legacy_get_item_html(advreport, field_name, item),
+               'class': getattr(advreport, 'get_%s_class' % field_name, lambda i: u'')(item),
+               'style': getattr(advreport, 'get_%s_style' % field_name, lambda: None)()}
+
+
+def run(rows=100, repeat=20):
+    advreport = BenchmarkReport()
+    items = [Item(i) for i in range(rows)]
+
+    assert [list(legacy_get_column_values(advreport, item)) for item in items] == \
+           [advreport.get_column_values(item) for item in items]
+
+    legacy = measure(lambda: [list(legacy_get_column_values(advreport, item)) for item in items], repeat)
+    plan = measure(lambda: [advreport.get_column_values(item) for item in items], repeat)
+
+    return {'rows': rows,
+            'columns': len(advreport.fields),
+            'legacy_us_per_row': legacy / rows * 1000000,
+            'plan_us_per_row': plan / rows * 1000000,
+            'speedup': legacy / plan}
+
+
+def main():
+    result = run()
+    print 'Rendering %(rows)d rows of %(columns)d columns' % result
+    print '  per-row lookups: %(legacy_us_per_row)8.1f us per row' % result
+    print '  accessor plan:   %(plan_us_per_row)8.1f us per row' % result
+    print '  speedup:         %(speedup)8.2fx' % result
+
+
+if __name__ == '__main__':
+    main()
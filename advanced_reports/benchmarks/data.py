@@ -0,0 +1,62 @@
+'''
+Generates the synthetic data of the benchmark suite. Rows are inserted with executemany in
+batches, which is a lot faster than saving model instances for large datasets.
+'''
+import datetime
+import decimal
+import random
+
+from django.db import connection, transaction
+
+from advanced_reports.benchmarks.models import BenchmarkCustomer, BenchmarkOrder
+
+
+CITIES = (u'Ghent', u'Antwerp', u'Brussels', u'Leuven', u'Bruges', u'Paris', u'Amsterdam', u'Berlin')
+COUNTRIES = (u'BE', u'FR', u'NL', u'DE')
+STATUSES = ('new', 'paid', 'shipped')
+
+
+def _insert(model, fields, rows):
+    fields = [model._meta.get_field(name) for name in fields]
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (connection.ops.quote_name(model._meta.db_table),
+                                               ', '.join(connection.ops.quote_name(f.column) for f in fields),
+                                               ', '.join(['%s'] * len(fields)))
+    params = [[f.get_db_prep_save(value, connection=connection) for f, value in zip(fields, row)] for row in rows]
+    connection.cursor().executemany(sql, params)
+
+
+def clear():
+    BenchmarkOrder.objects.all().delete()
+    BenchmarkCustomer.objects.all().delete()
+
+
+@transaction.commit_on_success
+def generate(rows, customers=None, batch_size=5000, seed=0):
+    '''
+    Replaces the benchmark data with rows orders of customers customers, one customer per 50
+    orders by default. The data only depends on the arguments.
+    '''
+    rand = random.Random(seed)
+    customers = customers or max(1, rows / 50)
+    start = datetime.datetime(2012, 1, 1)
+
+    clear()
+    _insert(BenchmarkCustomer, ('id', 'name', 'city', 'country'),
+            [(i + 1, u'Customer %d' % i, rand.choice(CITIES), rand.choice(COUNTRIES)) for i in range(customers)])
+
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, rows)):
+            created = start + datetime.timedelta(minutes=i)
+            batch.append((i + 1,
+                          rand.randint(1, customers),
+                          u'R%07d' % i,
+                          rand.choice(STATUSES),
+                          decimal.Decimal(rand.randint(100, 100000)) / 100,
+                          rand.randint(1, 20),
+                          u'customer%d@example.com' % (i % customers),
+                          u'',
+                          created,
+                          created))
+        _insert(BenchmarkOrder, ('id', 'customer', 'reference', 'status', 'amount', 'quantity',
+                                 'email', 'notes', 'created', 'updated'), batch)
@@ -0,0 +1,33 @@
+'''
+Synthetic models for the benchmark suite. They are only installed by advanced_reports.benchmarks.run.
+'''
+from django.db import models
+
+
+class BenchmarkCustomer(models.Model):
+    name = models.CharField(max_length=100)
+    city = models.CharField(max_length=100)
+    country = models.CharField(max_length=2)
+
+    def __unicode__(self):
+        return self.name
+
+
+class BenchmarkOrder(models.Model):
+    STATUS_CHOICES = (
+        ('new', 'New'),
+        ('paid', 'Paid'),
+        ('shipped', 'Shipped'),
+    )
+    customer = models.ForeignKey(BenchmarkCustomer, related_name='orders')
+    reference = models.CharField(max_length=20, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.IntegerField()
+    email = models.EmailField()
+    notes = models.TextField(blank=True)
+    created = models.DateTimeField(db_index=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return self.reference
@@ -0,0 +1,68 @@
+'''
+Synthetic reports for the benchmark suite, with fake fields, relations, form actions and enrich_list.
+'''
+from django import forms
+from django.db.models import Count
+
+from advanced_reports.defaults import AdvancedReport, action
+from advanced_reports.benchmarks.models import BenchmarkOrder
+
+
+class NoteForm(forms.Form):
+    note = forms.CharField()
+
+
+class BenchmarkOrderReport(AdvancedReport):
+    slug = 'benchmark_orders'
+    models = (BenchmarkOrder,)
+    fields = ('reference', 'status', 'customer__name', 'customer__city', 'amount', 'quantity',
+              'total', 'email', 'customer_orders', 'created')
+    sortable_fields = ('reference', 'amount', 'created', 'customer__name')
+    search_fields = ('reference', 'email', 'customer__name')
+    verbose_name = 'order'
+    verbose_name_plural = 'orders'
+    title = 'Benchmark orders'
+    multiple_actions = True
+    freshness_field = 'updated'
+    item_actions = (
+        action(method='pay', verbose_name='Pay', group='new'),
+        action(method='ship', verbose_name='Ship', group='paid'),
+        action(method='note', verbose_name='Add a note', form=NoteForm),
+    )
+
+    def queryset(self):
+        return BenchmarkOrder.objects.select_related('customer')
+
+    def enrich_list(self, items):
+        customer_ids = set(item.customer_id for item in items)
+        counts = dict(BenchmarkOrder.objects.filter(customer__in=customer_ids)
+                                            .values_list('customer').annotate(Count('id')))
+        for item in items:
+            item.customer_orders = counts.get(item.customer_id, 0)
+
+    def get_total_html(self, item):
+        return u'<strong>%.2f</strong>' % (item.amount * item.quantity)
+
+    def get_amount_class(self, item):
+        return u'number'
+
+    def get_email_decorator(self, item):
+        return lambda html: u'<a href="mailto:%s">%s</a>' % (html, html)
+
+    def get_customer_orders_html(self, item):
+        return item.customer_orders
+
+    def verify_action_group(self, item, group):
+        return group is None or item.status == group
+
+    def pay(self, item):
+        item.status = 'paid'
+        item.save()
+
+    def ship(self, item):
+        item.status = 'shipped'
+        item.save()
+
+    def note(self, item, form):
+        item.notes = form.cleaned_data['note']
+        item.save()
@@ -0,0 +1,231 @@
+'''
+Runs the benchmark suite: generates synthetic orders in SQLite for every dataset size and times
+the list, the api, the csv export, search and multiple actions on them, together with the
+column_values and startup benchmarks. The results are written as JSON, so the results of two
+versions can be compared:
+
+    python -m advanced_reports.benchmarks.run --rows 10000,100000 --output before.json
+    python -m advanced_reports.benchmarks.run --rows 10000,100000 --compare before.json
+
+The data is generated in a temporary database file, unless --database is given. Large datasets
+take a while to generate, 1000000 rows take a few minutes.
+'''
+import datetime
+import optparse
+import os
+import platform
+import sys
+import tempfile
+
+from advanced_reports.benchmarks import configure, measure_all
+
+
+def setup(database):
+    configure(
+        DEBUG=False,
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': database}},
+        INSTALLED_APPS=('django.contrib.contenttypes',
+                        'django.contrib.auth',
+                        'django.contrib.sessions',
+                        'django.contrib.messages',
+                        'django_ajax',
+                        'advanced_reports',
+                        'advanced_reports.benchmarks'),
+        MIDDLEWARE_CLASSES=('django.contrib.sessions.middleware.SessionMiddleware',
+                            'django.contrib.auth.middleware.AuthenticationMiddleware',
+                            'django.contrib.messages.middleware.MessageMiddleware'),
+        TEMPLATE_CONTEXT_PROCESSORS=('django.contrib.auth.context_processors.auth',
+                                     'django.core.context_processors.request',
+                                     'django.contrib.messages.context_processors.messages'),
+        ROOT_URLCONF='advanced_reports.benchmarks.urls',
+        SECRET_KEY='advanced_reports.benchmarks',
+    )
+    from django.core.management import call_command
+    call_command('syncdb', interactive=False, verbosity=0)
+
+    import advanced_reports
+    from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+    advanced_reports.register(BenchmarkOrderReport)
+    return advanced_reports.get_report_for_slug(BenchmarkOrderReport.slug)
+
+
+def get_client():
+    from django.contrib.auth.models import User
+    from django.test.client import Client
+    if not User.objects.filter(username='benchmark').exists():
+        User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+    client = Client()
+    client.login(username='benchmark', password='benchmark')
+    return client
+
+
+def count_queries(func):
+    '''
+    Returns the number of queries func runs.
+    '''
+    from django.db import connection
+    previous = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    count = len(connection.queries)
+    try:
+        func()
+        return len(connection.queries) - count
+    finally:
+        connection.use_debug_cursor = previous
+        del connection.queries[count:]
+
+
+def get_cases(advreport, client):
+    '''
+    Returns (name, func, setup) tuples. setup is run before every call to func, but is not timed.
+    '''
+    from django.test.client import RequestFactory
+    from advanced_reports.benchmarks.models import BenchmarkOrder
+    from advanced_reports.defaults import ReportContext
+
+    url = '/reports/%s/' % advreport.slug
+    api_url = '/reports/api/%s/' % advreport.slug
+
+    def get(url, data=None):
+        def func():
+            response = client.get(url, data or {})
+            assert response.status_code == 200, response.status_code
+            # Streamed responses are only consumed here.
+            response.content
+        return func
+
+    def in_context(func):
+        def wrapper():
+            previous = advreport.activate(ReportContext(RequestFactory().get(url)))
+            try:
+                func()
+            finally:
+                advreport.activate(previous)
+        return wrapper
+
+    selected_ids = [unicode(pk) for pk in BenchmarkOrder.objects.order_by('pk').values_list('pk', flat=True)[:200]]
+
+    def reset_selected():
+        BenchmarkOrder.objects.filter(pk__in=selected_ids).update(status='new')
+
+    def search():
+        object_list = advreport.get_filtered_items(advreport._queryset(None), {'q': u'customer 1'})
+        len(object_list)
+        object_list[:advreport.items_per_page]
+
+    return (
+        ('list', get(url), None),
+        ('list_sorted', get(url, {'order': '-amount'}), None),
+        ('list_search', get(url, {'q': u'customer 1'}), None),
+        ('list_last_page', get(url, {'page': max(1, BenchmarkOrder.objects.count() / advreport.items_per_page)}), None),
+        ('api_list', get(api_url), None),
+        ('api_list_compact', get(api_url, {'compact': '1'}), None),
+        ('export_csv', get(url, {'csv': '1'}), None),
+        ('search', in_context(search), None),
+        ('count', in_context(lambda: advreport.get_item_count()), None),
+        ('multiple_actions', in_context(lambda: advreport.handle_multiple_actions('pay', selected_ids)), reset_selected),
+    )
+
+
+def run_cases(advreport, rows, repeat, only=None):
+    from advanced_reports.benchmarks.data import generate
+
+    generate(rows)
+    client = get_client()
+    results = []
+    for name, func, setup in get_cases(advreport, client):
+        if only and name not in only:
+            continue
+        # The first call warms up the caches of Django and of the report.
+        if setup is not None:
+            setup()
+        func()
+        if setup is not None:
+            setup()
+        queries = count_queries(func)
+        timings = measure_all(func, repeat, setup)
+        results.append({'name': name,
+                        'rows': rows,
+                        'queries': queries,
+                        'best': min(timings),
+                        'mean': sum(timings) / len(timings)})
+        print '  %-20s %8d rows %10.2f ms %6d queries' % (name, rows, min(timings) * 1000, queries)
+    return results
+
+
+def get_environment():
+    import django
+    import advanced_reports
+    return {'advanced_reports': str(advanced_reports.__version__),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def compare(results, previous):
+    '''
+    Prints the ratio of the best times of results to the ones of previous, for the cases in both.
+    '''
+    before = dict(((r['name'], r['rows']), r) for r in previous['results'])
+    print 'Compared to %s:' % previous['environment']['advanced_reports']
+    for result in results['results']:
+        old = before.get((result['name'], result['rows']))
+        if old is None:
+            continue
+        print '  %-20s %8d rows %10.2f ms %10.2f ms %6.2fx %+4d queries' % (
+            result['name'], result['rows'], old['best'] * 1000, result['best'] * 1000,
+            result['best'] / old['best'] if old['best'] else 0, result['queries'] - old['queries'])
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='%prog [options]')
+    parser.add_option('--rows', default='10000',
+                      help='comma separated dataset sizes, for example 10000,100000,1000000 [%default]')
+    parser.add_option('--repeat', type='int', default=5, help='timed calls per case [%default]')
+    parser.add_option('--cases', default='', help='comma separated cases to run, all by default')
+    parser.add_option('--database', default=None, help='the SQLite database file, a temporary file by default')
+    parser.add_option('--output', default=None, help='write the results to this JSON file')
+    parser.add_option('--compare', default=None, help='compare to the results in this JSON file')
+    parser.add_option('--skip-micro', action='store_true', default=False,
+                      help='skip the column_values and startup benchmarks')
+    options, args = parser.parse_args(argv)
+
+    database = options.database
+    if database is None:
+        fd, database = tempfile.mkstemp(prefix='advreport_benchmark_', suffix='.db')
+        os.close(fd)
+    try:
+        advreport = setup(database)
+        from django.utils import simplejson
+
+        results = {'environment': get_environment(), 'results': [], 'micro': {}}
+        only = [name for name in options.cases.split(',') if name]
+        for rows in [int(rows) for rows in options.rows.split(',') if rows]:
+            print 'Benchmarking %d rows' % rows
+            results['results'].extend(run_cases(advreport, rows, options.repeat, only))
+
+        if not options.skip_micro:
+            from advanced_reports.benchmarks import column_values, startup
+            results['micro']['column_values'] = column_values.run()
+            results['micro']['startup'] = startup.run()
+
+        if options.output:
+            f = open(options.output, 'w')
+            try:
+                simplejson.dump(results, f, indent=2, sort_keys=True)
+            finally:
+                f.close()
+        if options.compare:
+            f = open(options.compare)
+            try:
+                compare(results, simplejson.load(f))
+            finally:
+                f.close()
+    finally:
+        if options.database is None:
+            os.remove(database)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,53 @@
+'''
+Measures the time it takes to import advanced_reports and its urls in a fresh interpreter,
+compared to what the import did before: running git to determine the version and importing
+all views from the urls.
+
+    python -m advanced_reports.benchmarks.startup
+'''
+import os
+import subprocess
+import sys
+
+
+SETUP = '''
+import sys, timeit
+sys.path.insert(0, %(path)r)
+from django.conf import settings
+settings.configure(DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+                   INSTALLED_APPS=('django.contrib.contenttypes',))
+start = timeit.default_timer()
+%(statement)s
+sys.stdout.write(repr(timeit.default_timer() - start))
+'''
+
+CASES = (
+    ('import advanced_reports (git version)', 'import advanced_reports; advanced_reports.get_git_version()'),
+    ('import advanced_reports', 'import advanced_reports'),
+    ('import advanced_reports.urls (eager views)', 'import advanced_reports.urls, advanced_reports.views'),
+    ('import advanced_reports.urls', 'import advanced_reports.urls'),
+)
+
+
+def measure_import(statement, repeat):
+    path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    timings = []
+    for i in range(repeat):
+        output = subprocess.Popen([sys.executable, '-c', SETUP % {'path': path, 'statement': statement}],
+                                  stdout=subprocess.PIPE).communicate()[0]
+        timings.append(float(output))
+    return min(timings)
+
+
+def run(repeat=5):
+    return dict((name, measure_import(statement, repeat) * 1000) for name, statement in CASES)
+
+
+def main():
+    result = run()
+    for name, statement in CASES:
+        print '  %-45s %8.1f ms' % (name, result[name])
+
+
+if __name__ == '__main__':
+    main()
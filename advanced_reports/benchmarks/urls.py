@@ -0,0 +1,6 @@
+from django.conf.urls.defaults import *
+
+
+urlpatterns = patterns('',
+    url(r'^reports/', include('advanced_reports.urls')),
+)
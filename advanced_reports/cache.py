@@ -0,0 +1,328 @@
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.template import Context
+from django.template.defaulttags import CsrfTokenNode
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+
+ROW_CACHE_SIZE = getattr(settings, 'ADVANCED_REPORTS_ROW_CACHE_SIZE', 1000)
+'''
+The number of rendered rows every report keeps in process, in front of the Django cache.
+'''
+
+PAYLOAD_CACHE_SIZE = getattr(settings, 'ADVANCED_REPORTS_PAYLOAD_CACHE_SIZE', 1000)
+'''
+The number of enriched payloads every report keeps in process, in front of the Django cache.
+'''
+
+CSRF_PLACEHOLDER = u'advreport-csrf-token'
+
+
+class LRUCache(object):
+    '''
+    A bounded in-process cache. When it is full, the least recently used entries are dropped.
+    '''
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = {}
+        self.tick = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if entry[2] is not None and entry[2] < time.time():
+                del self.entries[key]
+                return default
+            self.tick += 1
+            entry[1] = self.tick
+            return entry[0]
+        finally:
+            self.lock.release()
+
+    def set(self, key, value, timeout=None):
+        self.lock.acquire()
+        try:
+            self.tick += 1
+            self.entries[key] = [value, self.tick, time.time() + timeout if timeout else None]
+            if len(self.entries) > self.max_size:
+                # Drop a quarter of the entries at once, so we don't have to sort on every set.
+                by_use = sorted(self.entries.iteritems(), key=lambda item: item[1][1])
+                for key, entry in by_use[:len(by_use) - self.max_size * 3 / 4]:
+                    del self.entries[key]
+        finally:
+            self.lock.release()
+
+    def delete(self, key):
+        self.lock.acquire()
+        try:
+            self.entries.pop(key, None)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+        finally:
+            self.lock.release()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CacheStats(object):
+    '''
+    Counts the hits and misses of a cache.
+    '''
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def record(self, hit):
+        self.lock.acquire()
+        try:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        finally:
+            self.lock.release()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.hits = self.misses = 0
+        finally:
+            self.lock.release()
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / total if total else None}
+
+
+class RowCache(object):
+    '''
+    Caches the rendered html of the rows of a report, see AdvancedReport.row_cache.
+
+    Rows are stored in an LRUCache of the report and in the Django cache. A row is identified by
+    the report, the id of the item, get_item_version, the action groups that apply to the item,
+    the language and the template of the report. Items of which the row is found are not enriched.
+    '''
+    def __init__(self, advreport, max_size=ROW_CACHE_SIZE):
+        self.advreport = advreport
+        self.local = LRUCache(max_size)
+        self.stats = CacheStats()
+
+    def get_key(self, item):
+        version = self.advreport.get_item_version(item)
+        if version is None:
+            return None
+        groups = sorted(group for group in self.advreport.get_action_groups()
+                        if self.advreport.has_action_group(item, group))
+        raw = repr((self.advreport.get_item_id(item), version, groups, get_language(), self.advreport.get_template()))
+        return 'advreport_row_%s_%s' % (self.advreport.slug, hashlib.md5(raw).hexdigest())
+
+    def get(self, key):
+        html = self.local.get(key)
+        if html is None:
+            html = cache.get(key)
+            if html is not None:
+                self.local.set(key, html, self.advreport.row_cache_timeout)
+        self.stats.record(html is not None)
+        return html
+
+    def set(self, key, html):
+        self.local.set(key, html, self.advreport.row_cache_timeout)
+        cache.set(key, html, self.advreport.row_cache_timeout)
+
+    def load(self, items):
+        '''
+        Looks up the rows of the given items. Returns the items of which the row must be rendered.
+        '''
+        self.advreport.prefetch_action_groups(items)
+        stale = []
+        for item in items:
+            key = self.get_key(item)
+            html = self.get(key) if key is not None else None
+            if html is None:
+                self.advreport.assign_attr(item, 'advreport_row_key', key)
+                stale.append(item)
+            else:
+                self.advreport.assign_attr(item, 'advreport_row_html', html)
+                self.advreport.assign_attr(item, 'advreport_object_id', self.advreport.get_item_id(item))
+        return stale
+
+    def render(self, item, template, context):
+        '''
+        Renders the row of an item loaded by load with the given template, from the cache when
+        possible. The csrf token isn't cached, it is filled in for every request.
+        '''
+        get = item.get if isinstance(item, dict) else lambda name: getattr(item, name, None)
+        html = get('advreport_row_html')
+        if html is None:
+            key = get('advreport_row_key')
+            if key is None:
+                return template.render(context)
+            context.update({'csrf_token': CSRF_PLACEHOLDER})
+            try:
+                html = template.render(context)
+            finally:
+                context.pop()
+            self.set(key, html)
+        return mark_safe(html.replace(_render_csrf_token(CSRF_PLACEHOLDER), CsrfTokenNode().render(context)))
+
+
+class PayloadCache(object):
+    '''
+    Caches the enriched payload of items, see AdvancedReport.payload_cache: their column values,
+    class and extra information.
+
+    Payloads are stored in an LRUCache of the report and in the Django cache. Their keys contain a
+    token of the report, a token of the item, which are kept in the Django cache, and the parts
+    returned by get_payload_cache_key_parts. Invalidating
+    deletes these tokens, so the payloads that were stored with them are never found again, in
+    any process.
+    '''
+    fields = ('advreport_column_values', 'advreport_class', 'advreport_extra_information')
+
+    def __init__(self, advreport, max_size=PAYLOAD_CACHE_SIZE):
+        self.advreport = advreport
+        self.local = LRUCache(max_size)
+        self.stats = CacheStats()
+
+    def get_token_key(self, item_id=None):
+        if item_id is None:
+            return 'advreport_payload_token_%s' % self.advreport.slug
+        return 'advreport_payload_token_%s_%s' % (self.advreport.slug, hashlib.md5(item_id.encode('utf-8')).hexdigest())
+
+    def get_tokens(self, item_ids):
+        '''
+        Returns a dict with the tokens of the given item ids and the token of the report, under None.
+        '''
+        keys = dict((self.get_token_key(item_id), item_id) for item_id in item_ids)
+        keys[self.get_token_key()] = None
+        tokens = cache.get_many(keys.keys())
+        missing = dict((key, uuid.uuid4().hex) for key in keys if key not in tokens)
+        if missing:
+            cache.set_many(missing, self.advreport.payload_cache_timeout)
+            tokens.update(missing)
+        return dict((item_id, tokens[key]) for key, item_id in keys.items())
+
+    def get_key(self, item, tokens, parts=()):
+        item_id = self.advreport.get_item_id(item)
+        raw = repr((item_id, tokens[None], tokens[item_id], self.advreport.get_item_version(item), get_language(), parts))
+        return 'advreport_payload_%s_%s' % (self.advreport.slug, hashlib.md5(raw).hexdigest())
+
+    def is_bypassed(self):
+        '''
+        Returns whether the request asked to recompute the payloads, with ?nocache or with
+        "Cache-Control: no-cache".
+        '''
+        request = self.advreport.request
+        if request is None:
+            return False
+        return 'nocache' in request.GET or 'no-cache' in request.META.get('HTTP_CACHE_CONTROL', '')
+
+    def load(self, items):
+        '''
+        Assigns the cached payloads to the given items. Returns the items of which the payload
+        must be computed, which are passed to store afterwards.
+        '''
+        if not items:
+            return []
+        tokens = self.get_tokens([self.advreport.get_item_id(item) for item in items])
+        parts = tuple(self.advreport.get_payload_cache_key_parts(self.advreport.request))
+        keys = [self.get_key(item, tokens, parts) for item in items]
+
+        bypass = self.is_bypassed()
+        payloads = {}
+        if not bypass:
+            for key in keys:
+                payload = self.local.get(key)
+                if payload is not None:
+                    payloads[key] = payload
+            for key, payload in cache.get_many([key for key in keys if key not in payloads]).items():
+                self.local.set(key, payload, self.advreport.payload_cache_timeout)
+                payloads[key] = payload
+
+        missing = []
+        for item, key in zip(items, keys):
+            payload = payloads.get(key)
+            if not bypass:
+                self.stats.record(payload is not None)
+            if payload is None:
+                self.advreport.assign_attr(item, 'advreport_payload_key', key)
+                missing.append(item)
+            else:
+                for name, value in zip(self.fields, payload):
+                    self.advreport.assign_attr(item, name, value)
+                self.advreport.assign_attr(item, 'advreport_payload_cached', True)
+        return missing
+
+    def store(self, items):
+        '''
+        Stores the payloads of enriched items that were returned by load.
+        '''
+        context = self.advreport.get_context()
+        if context.fields is not None or (context.include is not None and 'extra' not in context.include):
+            # The items are only partially enriched.
+            return
+        payloads = {}
+        for item in items:
+            key = self.advreport.get_attr(item, 'advreport_payload_key')
+            if key is not None:
+                payloads[key] = tuple(self.advreport.get_attr(item, name) for name in self.fields)
+        for key, payload in payloads.items():
+            self.local.set(key, payload, self.advreport.payload_cache_timeout)
+        if payloads:
+            cache.set_many(payloads, self.advreport.payload_cache_timeout)
+
+    def invalidate(self, item_ids=None):
+        '''
+        Invalidates the payloads of the items with the given ids, or of all items when item_ids is None.
+        '''
+        if item_ids is None:
+            cache.delete(self.get_token_key())
+        else:
+            cache.delete_many([self.get_token_key(unicode(item_id)) for item_id in item_ids])
+
+
+def connect_signals(advreport):
+    '''
+    Invalidates the payload cache of the given report when instances of its models or of its
+    cache_dependencies are saved or deleted.
+    '''
+    slug = advreport.slug
+
+    def invalidate_items(sender, instance, **kwargs):
+        from advanced_reports import get_report_for_slug
+        advreport = get_report_for_slug(slug)
+        advreport.get_payload_cache().invalidate(advreport.get_affected_item_ids(instance))
+
+    def invalidate_all(sender, instance, **kwargs):
+        from advanced_reports import get_report_for_slug
+        get_report_for_slug(slug).get_payload_cache().invalidate()
+
+    for models, handler in ((advreport.models or (), invalidate_items), (advreport.cache_dependencies, invalidate_all)):
+        for model in models:
+            dispatch_uid = 'advanced_reports_payload_cache_%s_%s' % (slug, model._meta)
+            post_save.connect(handler, sender=model, weak=False, dispatch_uid=dispatch_uid)
+            post_delete.connect(handler, sender=model, weak=False, dispatch_uid=dispatch_uid)
+
+
+def _render_csrf_token(token):
+    return CsrfTokenNode().render(Context({'csrf_token': token}))
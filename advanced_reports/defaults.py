@@ -1,18 +1,35 @@
 import datetime
+import hashlib
+import itertools
+import logging
+import re
+import threading
 import time
+import weakref
+from contextlib import contextmanager
 
 from django import forms
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
-from django.db.models import Q
+from django.db import connections, transaction
+from django.db.models import Count, Max, Q
+from django.db.models.query import QuerySet
+from django.db.models.sql import EmptyResultSet
 from django.http import Http404
 from django.template.defaultfilters import capfirst
 from django.template.loader import render_to_string
 from django.utils.safestring import mark_safe
-from django.utils.html import strip_tags
+from django.utils.html import strip_entities, strip_tags
 from django.utils.translation import ugettext_lazy as _
 
+from advanced_reports.instrumentation import QueryBudget, QueryBudgetExceeded, timed
+from advanced_reports.utils import parallel_map
+
+
+logger = logging.getLogger(__name__)
+
 
 class ActionType(object):
     LINKS = 'links'
@@ -21,6 +38,7 @@ class ActionType(object):
 
 class action(object):
     attrs_dict = None
+    lazy_form = False
 
     method = None
     '''
@@ -158,13 +176,28 @@ class action(object):
             if self.form_template:
                 new_action.response_form_template = mark_safe(render_to_string(self.form_template, {'form': new_action.form}))
 
-        if instance:
-            if new_action.confirm: new_action.confirm = new_action.confirm % Resolver({'item': instance})
-            if new_action.success: new_action.success = new_action.success % Resolver({'item': instance})
-            if new_action.verbose_name: new_action.verbose_name = new_action.verbose_name % Resolver({'item': instance})
+        new_action.resolve_texts(instance)
+        return new_action
+
+    def copy_with_lazy_form(self, instance=None):
+        '''
+        Like copy_with_instanced_form, but the form is not instantiated nor rendered. The ajax_form
+        view does that when the form is displayed. See AdvancedReport.lazy_action_forms.
+        '''
+        new_action = action(**self.attrs_dict)
+        if self.form is not None:
+            new_action.form = LazyForm(self.form)
+            new_action.lazy_form = True
 
+        new_action.resolve_texts(instance)
         return new_action
 
+    def resolve_texts(self, instance):
+        if instance:
+            if self.confirm: self.confirm = self.confirm % Resolver({'item': instance})
+            if self.success: self.success = self.success % Resolver({'item': instance})
+            if self.verbose_name: self.verbose_name = self.verbose_name % Resolver({'item': instance})
+
     def get_success_message(self):
         return self.success or _(u'Successfully executed "%s"') % self.verbose_name
 
@@ -176,6 +209,17 @@ class action(object):
             return self.form_instance(instance, *args, **kwargs) if callable(self.form_instance) else form_instance
         return instance
 
+class LazyForm(object):
+    '''
+    Takes the place of the form of an action copied with copy_with_lazy_form. Unlike a form class,
+    it is not called when it is used in a template.
+    '''
+    def __init__(self, form_class):
+        self.form_class = form_class
+
+    def as_table(self):
+        return u''
+
 class ActionException:
     def __init__(self, msg=None, form=None):
         if form is not None:
@@ -187,15 +231,102 @@ class ActionException:
         else:
             self.msg = u'%s' % msg
 
+class MultipleActionSummary(object):
+    '''
+    The outcome of an action performed on multiple items with multiple_action_workers.
+    '''
+    def __init__(self):
+        self.succeeded = []
+        self.failed = []
+
+    def add(self, item_id, error=None):
+        if error is None:
+            self.succeeded.append(item_id)
+        else:
+            self.failed.append((item_id, error))
+
+    @property
+    def count(self):
+        return len(self.succeeded)
+
+_local = threading.local()
+
+def _get_active_contexts():
+    contexts = getattr(_local, 'contexts', None)
+    if contexts is None:
+        contexts = _local.contexts = weakref.WeakKeyDictionary()
+    return contexts
+
+class ReportContext(object):
+    '''
+    The per-request state of a report. A report instance is shared by all requests and threads,
+    so the views activate a ReportContext for each request instead of storing the request on
+    the report. Store your own per-request state on it, using AdvancedReport.get_context.
+    '''
+    def __init__(self, request=None, internal_mode=None, report_header_visible=None):
+        # None means the default of the report, see ContextAttribute.
+        self.request = request
+        self.internal_mode = internal_mode
+        self.report_header_visible = report_header_visible
+        self.action_groups = {}
+        # What enrich_object computes: the fields of the column values and the extra parts
+        # ('actions', 'extra'), or None for all of them.
+        self.fields = None
+        self.include = None
+        # The QueryBudget of the page that is being enriched.
+        self.query_budget = None
+
+class ContextAttribute(object):
+    '''
+    An attribute of a report that is stored in its active ReportContext. When the context
+    doesn't have a value for it, the default is returned.
+    '''
+    def __init__(self, name, default=None):
+        self.name = name
+        self.default = default
+
+    def __get__(self, advreport, owner):
+        if advreport is None:
+            return self
+        value = getattr(advreport.get_context(), self.name)
+        return self.default if value is None else value
+
+    def __set__(self, advreport, value):
+        context = _get_active_contexts().get(advreport)
+        if context is None:
+            # Activating a context here would leave it active in the thread after the request.
+            raise RuntimeError(u'%s.%s is stored in the active ReportContext, but no context is active. '
+                               u'Set it in a "with advreport.context():" block.' % (type(advreport).__name__, self.name))
+        setattr(context, self.name, value)
+
+def install_context_attributes(report_class):
+    '''
+    A subclass of AdvancedReport may override a ContextAttribute with a plain class attribute,
+    like internal_mode = True. That would shadow the ContextAttribute, so setting the attribute
+    would change the report instance that all requests share. The plain value is made the default
+    of a new ContextAttribute instead. This is done when a report is registered.
+    '''
+    for name, attribute in AdvancedReport.__dict__.items():
+        if not isinstance(attribute, ContextAttribute):
+            continue
+        for cls in report_class.__mro__:
+            if name in cls.__dict__:
+                value = cls.__dict__[name]
+                if not isinstance(value, ContextAttribute):
+                    setattr(report_class, name, ContextAttribute(name, value))
+                break
+
 class AdvancedReport(object):
     slug = None
     '''
     Required. A unique url-friendly name for your Advanced Report
     '''
 
-    request = None
+    request = ContextAttribute('request')
     '''
-    Optional. The request
+    The request that is being handled. This is stored in the active ReportContext, as a report
+    instance is shared by all requests and threads. Don't store other per-request state on the
+    report itself, but on its context. See get_context.
     '''
 
     fields = None
@@ -260,6 +391,128 @@ class AdvancedReport(object):
     of items, your report will be paginated.
     '''
 
+    count_cache_timeout = None
+    '''
+    Optional. When set, the number of items of the report is cached in the Django cache for this
+    number of seconds, per search query. Counts taken from the cache are marked as approximate.
+    '''
+
+    estimate_count_threshold = None
+    '''
+    Optional. When set, the number of items of a report that is not being searched is estimated
+    by the query planner (PostgreSQL only) instead of running a COUNT. Estimates below this
+    threshold are replaced by an exact count. Estimated counts are marked as approximate.
+    '''
+
+    keyset_pagination = False
+    '''
+    Optional. If True, pages are fetched by seeking from the last item of the previous page instead
+    of skipping items with an OFFSET, so deep pages are as fast as the first one. The pages are then
+    navigated with opaque "next" and "previous" cursors instead of page numbers.
+    The items are ordered by the active sort order followed by the primary key, so make sure your
+    sortable fields are not nullable. When searching on fields that are not model fields, the regular
+    pagination is used.
+    '''
+
+    export_chunk_size = 500
+    '''
+    Optional. When exporting a report, items are fetched, enriched and written in chunks of this
+    size, so memory usage stays flat regardless of the number of items in the report.
+    '''
+
+    search_backend = None
+    '''
+    Optional. A search backend class, or its dotted path, that searches the search fields with the
+    full-text search of the database instead of icontains lookups. For example:
+    search_backend = 'advanced_reports.search.FullTextSearchBackend'
+
+    This uses a tsvector on PostgreSQL and an FTS5 table on SQLite. Only the search fields that are
+    fields of the model of the queryset are searched this way, and each word matches the words that
+    start with it. Unless the "order" parameter is given, the results are ordered by relevance.
+    Create the index or FTS5 table with: manage.py install_report_search <slug>
+    Searches for exact matches are not affected.
+    '''
+
+    search_weights = {}
+    '''
+    Optional. Used by search_backend. A dict that maps search fields to a weight: 'A', 'B', 'C' or
+    'D' (the default), from most to least relevant.
+    '''
+
+    search_index = False
+    '''
+    Optional. If True, the search fields that are not model fields are searched in an index instead
+    of rendering them for every item of the report. This requires "models", and
+    "advanced_reports.search_index" in INSTALLED_APPS: run syncdb after adding it. The index is updated when instances of your models are saved or deleted,
+    see get_affected_item_ids. Build it with: manage.py rebuild_report_index <slug>
+    Changes that affect all items only mark the index as stale, rebuild the stale indexes
+    periodically with: manage.py rebuild_report_index --stale
+    The indexed fields are rendered without a request.
+    '''
+
+    row_cache = False
+    '''
+    Optional. If True, the rendered rows of the report are cached, so the list only enriches and renders
+    the items that changed. Implement get_item_version to use this. A cached row is reused for the same
+    version of the item, the same action groups and the same language. The action groups are then
+    verified before enrich_list is called. See also ADVANCED_REPORTS_ROW_CACHE_SIZE.
+
+    Rows are shared by all users. Don't use this when columns or actions depend on the user in
+    another way than through the action groups, or make get_item_version depend on the user.
+    '''
+
+    row_cache_timeout = 60 * 60
+    '''
+    Optional. The number of seconds rows are kept in the row cache.
+    '''
+
+    payload_cache = False
+    '''
+    Optional. If True, the column values, the class and the extra information of the items are cached,
+    so get_FOO_html and friends only run for items that changed. The payload of an item is invalidated
+    when an instance of your models is saved or deleted, see get_affected_item_ids, and all payloads are
+    invalidated when an instance of one of cache_dependencies is. Cached items are still passed to
+    enrich_list when their actions are shown, as finding the actions may depend on it. Add ?nocache
+    to the url or send "Cache-Control: no-cache" to recompute the payloads. The column values must
+    be picklable. See also ADVANCED_REPORTS_PAYLOAD_CACHE_SIZE.
+
+    Payloads are shared by all users. When get_FOO_html, get_item_class or get_extra_information
+    depend on the user or the request, implement get_payload_cache_key_parts.
+    '''
+
+    payload_cache_timeout = 60 * 60
+    '''
+    Optional. The number of seconds payloads are kept in the payload cache.
+    '''
+
+    cache_dependencies = ()
+    '''
+    Optional. A tuple of other models the columns of your report depend on. When an instance of one of
+    them is saved or deleted, the whole payload cache of the report is invalidated.
+    '''
+
+    query_budget_per_page = None
+    '''
+    Optional. The number of queries enriching a page of items may take, from enrich_list to the
+    actions of the items. When a page takes more, a QueryBudgetExceeded is raised or a warning is
+    logged, see ADVANCED_REPORTS_QUERY_BUDGET_RAISE. By default, it is raised when DEBUG is True.
+    The message names the columns and hooks that ran queries, and the ones that did so for every
+    row.
+    '''
+
+    query_budget_per_item = None
+    '''
+    Optional. The number of queries the columns, get_item_class, get_extra_information and
+    get_object_actions may take for a single item of a page. See query_budget_per_page.
+    '''
+
+    freshness_field = None
+    '''
+    Optional. The name of a model field that changes whenever an item changes, for example a DateTimeField
+    with auto_now=True. The list and the api answer conditional GET requests with "304 Not Modified"
+    when the latest value of this field and the number of filtered items didn't change. See get_freshness.
+    '''
+
     links = ()
     '''
     Optional. A tuple of link tuples. You can define some top level links for your report.
@@ -274,6 +527,13 @@ class AdvancedReport(object):
     Advanced Reports has a nice little feature to let you export CSV files from your reports.
     Just add this link tuple:
     (u'Download CSV', '?csv')
+
+    JSON Lines and Excel exports work the same way:
+    (u'Download JSON', '?export=jsonl'),
+    (u'Download Excel', '?export=xlsx'),
+
+    Excel exports require the XlsxWriter package. Implement get_FOO_value to export a raw value
+    for a column instead of its stripped html.
     '''
 
     template = 'advanced_reports/default.html'
@@ -301,6 +561,22 @@ class AdvancedReport(object):
     function before we really know if it is implemented.
     '''
 
+    lazy_action_forms = False
+    '''
+    Optional. If True, the forms of the actions are not instantiated and rendered for every item
+    in the list. Instead, they are loaded via ajax when the actions of an item are shown. Custom
+    item templates must be based on the current "item_row.html" for this to work.
+    '''
+
+    enrich_items_for_actions = False
+    '''
+    Optional. Before an action runs on a single item, the item only goes through enrich_item, see
+    prepare_item. Its columns, class and extra information are not computed, so the
+    advreport_column_values, advreport_class and advreport_extra_information attributes are
+    missing. Set this to True when your actions read them, to fully enrich the item with
+    enrich_object like before.
+    '''
+
     multiple_actions = False
     '''
     Optional. Puts checkboxes before each item and puts a combobox with group actions on your report.
@@ -310,6 +586,15 @@ class AdvancedReport(object):
     FOO_multiple below.
     '''
 
+    multiple_action_workers = None
+    '''
+    Optional. The number of threads that perform an action on multiple items. When set, every item
+    is handled in its own transaction and an exception only fails the item it was raised for, the
+    other items are still committed. Exceptions other than ActionException are logged. The report
+    then tells how many items succeeded and which ones failed. Your action methods must be thread
+    safe. Not used for actions with a FOO_multiple method.
+    '''
+
     urlname = None
     '''
     Optional. Use this if you have a custom urlname for your report. Advanced Reports then knows how to
@@ -337,9 +622,10 @@ class AdvancedReport(object):
     Controls the visibility of the table header.
     '''
 
-    report_header_visible = True
+    report_header_visible = ContextAttribute('report_header_visible', True)
     '''
-    Controls the visibility of the report header
+    Controls the visibility of the report header. This is stored in the active ReportContext,
+    a value set in a subclass is the default.
     '''
 
     show_actions_separator = True
@@ -357,10 +643,11 @@ class AdvancedReport(object):
     Show the actions of an item only when the user hovers over the item
     '''
 
-    internal_mode = False
+    internal_mode = ContextAttribute('internal_mode', False)
     '''
     Determines if the advanced report should display a only single items. Used when you want to display
-    to report in an other template
+    to report in an other template. This is stored in the active ReportContext, a value set in a
+    subclass is the default.
     '''
 
     def queryset(self):
@@ -389,6 +676,41 @@ class AdvancedReport(object):
         '''
         return lambda s: s
 
+    def get_FOO_value(self, item):
+        '''
+        Implement this function to specify the raw, unformatted value of the field FOO in exports.
+        When you implement get_FOO_html but not this function, exports have to render the html
+        and strip the tags again, which is a lot slower.
+        '''
+        return None
+
+    def get_affected_item_ids(self, instance):
+        '''
+        Used by the search index and the payload cache. Implement this to return the ids of the items
+        that may change when the given instance of one of your models is saved or deleted.
+        Return None when any item may have changed: all payloads are invalidated and the search index
+        is marked as stale, it is not rebuilt until you run rebuild_report_index. By default, this returns
+        the primary key of instances of your first model and None for instances of your other models.
+        '''
+        if isinstance(instance, self.models[0]):
+            return [instance.pk]
+        return None
+
+    def get_item_version(self, item):
+        '''
+        Implement this to use the row cache. Returns a value that changes whenever the row of the
+        item changes, for example item.updated_at, or None when the row must not be cached.
+        '''
+        return None
+
+    def get_payload_cache_key_parts(self, request):
+        '''
+        Returns a tuple of values that are added to the key of the cached payloads, for payloads that
+        depend on the request. For example, return (request.user.pk,) to cache the payloads per
+        user. The request can be None, outside of views. By default, payloads are shared.
+        '''
+        return ()
+
     def verify_action_group(self, item, group):
         '''
         Implement this function to verify if the given group currently applies to the given item.
@@ -399,12 +721,112 @@ class AdvancedReport(object):
         '''
         return True
 
+    def verify_action_groups(self, items, groups):
+        '''
+        Implement this function to verify the action groups of several items at once, for example with
+        a single query. Returns a dict that maps the id of each item (see get_item_id) to the set of the
+        given groups that apply to it. By default, this calls verify_action_group for each item and group.
+
+        The results are remembered until the end of the request. Advanced Reports forgets them for an
+        item after running an action on it. Call forget_action_groups when you change an item otherwise.
+        '''
+        return dict((self.get_item_id(item), set(group for group in groups if self.verify_action_group(item, group)))
+                    for item in items)
+
+    def has_action_group(self, item, group):
+        '''
+        Returns whether the given group applies to the item, using verify_action_groups.
+        '''
+        action_groups = self.get_context().action_groups
+        item_id = self.get_item_id(item)
+        if item_id not in action_groups:
+            action_groups.update(self.verify_action_groups([item], self.get_action_groups()))
+        return group in action_groups.get(item_id, ())
+
+    def prefetch_action_groups(self, items):
+        '''
+        Verifies the action groups of the given items with a single call to verify_action_groups.
+        '''
+        action_groups = self.get_context().action_groups
+        items = [item for item in items if self.get_item_id(item) not in action_groups]
+        if items:
+            action_groups.update(self.verify_action_groups(items, self.get_action_groups()))
+
+    def forget_action_groups(self, item):
+        self.get_context().action_groups.pop(self.get_item_id(item), None)
+
+    def get_action_groups(self):
+        return set(a.group for a in self.item_actions)
+
     def set_request(self, request):
         '''
-        Set the request for this report.
+        Set the request for this report, in the active ReportContext. Outside of the views, activate
+        a context with context() first.
         '''
         self.request = request
 
+    def get_context(self):
+        '''
+        Returns the active ReportContext of this report in the current thread. When no context is
+        active, this returns a new empty context, so what is stored on it is lost. Use context()
+        to keep state outside of the views.
+        '''
+        context = _get_active_contexts().get(self)
+        if context is None:
+            context = ReportContext()
+        return context
+
+    @contextmanager
+    def context(self, request=None, **kwargs):
+        '''
+        Activates a new ReportContext while the code in a with block runs, for code that uses the
+        report outside of its views, and the context that was active before afterwards:
+
+            with advreport.context(request):
+                advreport.handle_multiple_actions('pay', item_ids)
+
+        The keyword arguments are passed to ReportContext. Yields the context.
+        '''
+        context = ReportContext(request, **kwargs)
+        previous = self.activate(context)
+        try:
+            yield context
+        finally:
+            self.activate(previous)
+
+    def activate(self, context):
+        '''
+        Makes the given ReportContext the active context of this report in the current thread,
+        or deactivates the active context when context is None. Returns the context that was
+        active before, so it can be activated again when you're done.
+        '''
+        contexts = _get_active_contexts()
+        previous = contexts.get(self)
+        if context is None:
+            contexts.pop(self, None)
+        else:
+            contexts[self] = context
+        return previous
+
+    def iter_in_context(self, context, iterable):
+        '''
+        Iterates over iterable with the given ReportContext activated, for responses that are
+        generated after the view has returned.
+
+        Django closes the database connections when the request finishes, before such a response
+        is streamed. The connections that are opened again while iterating are closed when the
+        iteration is done, so they don't stay open in the thread of the server.
+        '''
+        closed = [connection for connection in connections.all() if connection.connection is None]
+        previous = self.activate(context)
+        try:
+            for value in iterable:
+                yield value
+        finally:
+            self.activate(previous)
+            for connection in closed:
+                connection.close()
+
     '''
     The following two functions work both in tandem for naming and finding items.
     It is recommended to override get_item_for_id as the default implementation may be a little
@@ -428,6 +850,28 @@ class AdvancedReport(object):
         except ObjectDoesNotExist, e:
             raise Http404(u'%s' % e)
 
+    def get_items_for_ids(self, item_ids, chunk_size=500):
+        '''
+        Returns the items for the given IDs, in the same order. By default, the items are fetched with
+        one query per chunk_size IDs. When you override get_item_for_id or get_item_id, that is used
+        for each item instead, unless you override this method as well.
+        '''
+        item_ids = [unicode(item_id) for item_id in item_ids]
+        if _is_overridden(self, 'get_item_for_id') or _is_overridden(self, 'get_item_id'):
+            return [self.get_item_for_id(item_id) for item_id in item_ids]
+
+        queryset = self._queryset(request=None)
+        items = {}
+        unique_ids = list(set(item_ids))
+        for i in range(0, len(unique_ids), chunk_size):
+            for item in queryset.filter(pk__in=unique_ids[i:i + chunk_size]):
+                items[self.get_item_id(item)] = item
+
+        missing = [item_id for item_id in item_ids if item_id not in items]
+        if missing:
+            raise Http404(u'No %s found for %s.' % (self.verbose_name, u', '.join(missing)))
+        return [items[item_id] for item_id in item_ids]
+
     def get_decorator(self):
         '''
         To be used in tandem with decorate_views. Set it to True when you want to implement this function.
@@ -508,12 +952,91 @@ class AdvancedReport(object):
         '''
         pass
 
+    def enrich_item(self, item):
+        '''
+        Implement this to attach the extra information of enrich_list to a single item, for example
+        when a row is refreshed after an action. By default, this calls enrich_list with the item.
+        '''
+        self.enrich_list([item])
+
+    def reload_item(self, item):
+        '''
+        Returns a fresh copy of the item after an action was run on it. By default, the item is
+        looked up again with get_item_for_id. Return the item itself if your actions update it in place.
+        '''
+        return self.get_item_for_id(self.get_item_id(item))
+
+    def prepare_item(self, item, request=None):
+        '''
+        Prepares a single item for finding and running its actions: runs enrich_item and attaches
+        the id and the request, without rendering the columns of the item like enrich_object does,
+        unless enrich_items_for_actions is True.
+        '''
+        if self.enrich_items_for_actions:
+            with timed('enrich_object'):
+                self.enrich_object(item, request=request)
+            return
+        with timed('enrich_list'):
+            self.enrich_item(item)
+        self.assign_attr(item, 'advreport_object_id', self.get_item_id(item))
+        self.assign_attr(item, 'advreport_request', request)
+
+    def refresh_item(self, item, request=None):
+        '''
+        Returns the reloaded and enriched item, after an action was run on it.
+        '''
+        with timed('fetch'):
+            item = self.reload_item(item)
+        with timed('enrich_object'):
+            self.enrich_object(item, request=request)
+        return item
+
     def get_item_count(self):
         '''
         Implement this if you don't use Django model instances.
         Returns the number of items in the report.
         '''
-        return self._queryset(request=None).count()
+        return self.count_items(self._queryset(request=None), estimate=True)[0]
+
+    def count_items(self, queryset, estimate=False):
+        '''
+        Counts the items of the given queryset, taking count_cache_timeout and
+        estimate_count_threshold into account. When estimate is False, the count is never
+        estimated. Returns a tuple of the count and whether it is approximate.
+        '''
+        if estimate and self.estimate_count_threshold is not None:
+            count = estimate_count(queryset)
+            if count is not None and count >= self.estimate_count_threshold:
+                return count, True
+
+        if not self.count_cache_timeout:
+            return queryset.count(), False
+
+        try:
+            sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+        except EmptyResultSet:
+            return 0, False
+        key = 'advreport_count_%s_%s' % (self.slug, hashlib.md5(repr((sql, params))).hexdigest())
+        count = cache.get(key)
+        if count is not None:
+            return count, True
+        count = queryset.count()
+        cache.set(key, count, self.count_cache_timeout)
+        return count, False
+
+    def get_freshness(self, queryset):
+        '''
+        Returns a (last_modified, key) tuple for the filtered items of the report, or None when they have
+        no freshness. key must change whenever the items change. last_modified is a datetime or None.
+        By default, this looks up the latest value of freshness_field and the number of items in a single
+        query. Only clients that send If-Modified-Since without If-None-Match miss deleted items.
+        '''
+        if self.freshness_field is None or not isinstance(queryset, QuerySet):
+            return None
+        freshness = queryset.aggregate(latest=Max(self.freshness_field), count=Count('pk'))
+        latest = freshness['latest']
+        last_modified = latest if isinstance(latest, datetime.datetime) else None
+        return last_modified, (latest, freshness['count'])
 
     def get_template(self):
         '''
@@ -555,6 +1078,8 @@ class AdvancedReport(object):
         # Extract parameters
         q = params['q'].lower() if 'q' in params else None
         exact = 'exact' in params
+        search_backend = self.get_search_backend() if q and not exact else None
+        backend_fields = []
         from_date = params.get('from', '')
         to_date = params.get('to', '')
         from_date_struct = time.strptime(params['from'], '%Y-%m-%d') if from_date else None
@@ -593,14 +1118,28 @@ class AdvancedReport(object):
             if uses_model is None:
                 uses_model = False
 
+            if search_backend is not None:
+                backend_fields = [f[0] for f in search_backend.get_fields(queryset)]
+
             parts = q.split()
             filter_query = Q()
             for part in parts:
                 part_query = Q()
-                for search_field in self.search_fields:
-                    field = self.get_model_field(search_field.split('__')[0])
-                    if field is None:
-                        fake_fields.append(search_field)
+                # The fields of the backend are searched with icontains for terms the backend
+                # can't look up, like punctuation, or the term would match every item.
+                searched_fields = []
+                if backend_fields:
+                    backend_query = search_backend.get_query(queryset, part)
+                    if backend_query is not None:
+                        uses_model = True
+                        part_query = backend_query
+                        searched_fields = backend_fields
+                for search_field, is_model_field in self.get_schema().search_plan:
+                    if not is_model_field:
+                        if search_field not in fake_fields:
+                            fake_fields.append(search_field)
+                    elif search_field in searched_fields:
+                        continue
                     else:
                         uses_model = True
                         if exact:
@@ -611,13 +1150,17 @@ class AdvancedReport(object):
 
 
         fake_found = []
+        indexed = bool(self.search_index and fake_fields and self.date_range not in fake_fields)
         if len(fake_fields) > 0:
-            self.enrich_list(queryset)
-            for fake_field in fake_fields:
-                for o in queryset:
-                    test_string = strip_tags(self.get_item_html(fake_field, o)).lower().replace(u'&nbsp;', u' ')
-                    if q == test_string if exact else q in test_string:
-                        fake_found.append(int(o.pk) if uses_model else o)
+            if indexed:
+                fake_found = self.get_search_index().search(q, exact)
+            else:
+                self.enrich_list(queryset)
+                for fake_field in fake_fields:
+                    for o in queryset:
+                        test_string = self.get_search_text(fake_field, o)
+                        if q == test_string if exact else q in test_string:
+                            fake_found.append(int(o.pk) if uses_model else o)
 
         if uses_model or uses_model is None:
             # uses_model is None when none of the search parameters were found
@@ -628,13 +1171,71 @@ class AdvancedReport(object):
                     filter_query = Q(pk__in=fake_found)
 
             if filter_query:
-                return EnrichedQueryset(queryset.filter(filter_query), self)
+                queryset = queryset.filter(filter_query)
+                if backend_fields and 'order' not in params and not self.keyset_pagination:
+                    queryset = search_backend.rank(queryset, q)
+                return EnrichedQueryset(queryset, self)
             else:
                 # When no filter parameter is found then we don't apply the filter_query
-                return EnrichedQueryset(queryset, self)
+                return EnrichedQueryset(queryset, self, estimate_count=date_range_query is None)
+        elif indexed:
+            return EnrichedQueryset(queryset.filter(pk__in=fake_found), self)
         else:
             return EnrichedQueryset(fake_found, self)
 
+    def get_search_text(self, field_name, item):
+        '''
+        Returns the text of a field as it is searched when the field is not a model field.
+        '''
+        return strip_tags(self.get_item_html(field_name, item)).lower().replace(u'&nbsp;', u' ')
+
+    def get_search_backend(self):
+        '''
+        Returns an instance of the search_backend of this report, or None when it has none.
+        '''
+        if self.search_backend is None:
+            return None
+        from advanced_reports.search import get_search_backend_class
+        backend_class = self.search_backend
+        if isinstance(backend_class, basestring):
+            backend_class = get_search_backend_class(backend_class)
+        return backend_class(self)
+
+    def get_row_cache(self):
+        '''
+        Returns the RowCache of this report. See row_cache.
+        '''
+        row_cache = self.__dict__.get('_row_cache')
+        if row_cache is None:
+            from advanced_reports.cache import RowCache
+            row_cache = self._row_cache = RowCache(self)
+        return row_cache
+
+    def get_payload_cache(self):
+        '''
+        Returns the PayloadCache of this report. See payload_cache.
+        '''
+        payload_cache = self.__dict__.get('_payload_cache')
+        if payload_cache is None:
+            from advanced_reports.cache import PayloadCache
+            payload_cache = self._payload_cache = PayloadCache(self)
+        return payload_cache
+
+    def get_query_budget(self):
+        '''
+        Returns a new QueryBudget for a page of items, or None when the report has no budget.
+        '''
+        if self.query_budget_per_page is None and self.query_budget_per_item is None:
+            return None
+        return QueryBudget(self, self.query_budget_per_page, self.query_budget_per_item)
+
+    def get_search_index(self):
+        '''
+        Returns the SearchIndex of this report. See search_index.
+        '''
+        from advanced_reports.search_index import SearchIndex
+        return SearchIndex(self)
+
     def _queryset(self, request):
         if hasattr(self, 'queryset_request'):
             qs = self.queryset_request(request)
@@ -670,9 +1271,29 @@ class AdvancedReport(object):
     def get_enriched_items(self, queryset):
         return EnrichedQueryset(queryset, self)
 
-    def get_object_list(self, request, ids=None):
+    def get_order_by(self, request):
+        '''
+        Returns the active sort order: the "order" parameter or the first sortable field.
+        '''
         default_order_by = ''.join(self.sortable_fields[:1])
-        order_by = request.GET.get('order', default_order_by)
+        return request.GET.get('order', default_order_by)
+
+    def get_keyset_ordering(self, order_by):
+        '''
+        Returns the fields used for keyset pagination: the fields of the sort order, if it can be
+        applied to the queryset, followed by the primary key to make the ordering unique.
+        '''
+        ordering = []
+        if order_by:
+            field_name = order_by.split('__')[0].split(',')[0].strip('-')
+            if self.get_model_field(field_name) is not None:
+                ordering = [f.strip() for f in order_by.split(',')]
+        if not [f for f in ordering if f.strip('-') == 'pk']:
+            ordering.append('-pk' if ordering and ordering[-1].startswith('-') else 'pk')
+        return ordering
+
+    def get_object_list(self, request, ids=None):
+        order_by = self.get_order_by(request)
         context = {}
         if order_by:
             order_field = order_by.split('__')[0].split(',')[0].strip('-')
@@ -681,14 +1302,17 @@ class AdvancedReport(object):
                             'ascending': ascending,
                             'order_by': order_by.strip('-'),
                             'ordered_by': self.get_ordered_by(order_by)})
-            queryset = self.get_sorted_queryset(order_by, request=request)
+            with timed('queryset'):
+                queryset = self.get_sorted_queryset(order_by, request=request)
         else:
-            queryset = self._queryset(request)
+            with timed('queryset'):
+                queryset = self._queryset(request)
 
         # Filter
         if ids is not None:
             queryset = queryset.filter(pk__in=ids)
-        object_list = self.get_filtered_items(queryset, request.GET)
+        with timed('filter'):
+            object_list = self.get_filtered_items(queryset, request.GET)
 
         return object_list, context
 
@@ -704,34 +1328,110 @@ class AdvancedReport(object):
 #            return getattr(self, method, lambda i, f=None: False)
 #        else:
 #            return method
-        return getattr(self, method, lambda i, f=None: False)
+        func = getattr(self, method, lambda i, f=None: False)
+
+        def call(item, *args, **kwargs):
+            try:
+                with timed('action'):
+                    return func(item, *args, **kwargs)
+            finally:
+                # The action may have changed the groups that apply to the item.
+                self.forget_action_groups(item)
+        return call
 
     def handle_multiple_actions(self, method, selected_object_ids, request=None):
         action = self.find_action(method)
-        objects = [self.get_item_for_id(item_id) for item_id in selected_object_ids]
+        objects = self.get_items_for_ids(selected_object_ids)
         self.enrich_list(objects)
+        self.prefetch_action_groups(objects)
         for o in objects:
             self.enrich_object(o, list=False, request=request)
-        objects = [object for object in objects if self.verify_action_group(object, action.group)]
+        objects = [object for object in objects if self.has_action_group(object, action.group)]
         handler = getattr(self, '%s_multiple' % method, None)
         if handler:
             if len(objects) == 0:
                 return None, 0
-            return handler(objects), len(objects)
+            try:
+                return handler(objects), len(objects)
+            finally:
+                for object in objects:
+                    self.forget_action_groups(object)
+
+        if self.multiple_action_workers:
+            return None, self.run_multiple_actions(method, objects)
 
         count = 0
-        self.enrich_list(objects)
         for object in objects:
-            self.enrich_object(object, list=False, request=request)
             if self.find_object_action(object, method) is not None:
                 self.get_action_callable(method)(object)
                 count += 1
 
         return None, count
 
+    def run_multiple_actions(self, method, objects):
+        '''
+        Performs the action on the objects with a pool of multiple_action_workers threads, each
+        object in its own transaction. Returns a MultipleActionSummary.
+        '''
+        context = self.get_context()
+        action_callable = self.get_action_callable(method)
+        objects = [object for object in objects if self.find_object_action(object, method) is not None]
+
+        def run(object):
+            previous = self.activate(context)
+            try:
+                transaction.commit_on_success(action_callable)(object)
+            except ActionException, e:
+                return e.msg
+            except Exception:
+                # The items that succeeded are committed already, so this item is only reported.
+                logger.exception('Action %s failed on item %s of report %s', method, self.get_item_id(object), self.slug)
+                return _(u'An unexpected error occurred.')
+            finally:
+                self.activate(previous)
+            return None
+
+        summary = MultipleActionSummary()
+        for object, error in zip(objects, parallel_map(run, objects, self.multiple_action_workers)):
+            summary.add(self.get_item_id(object), error)
+        return summary
+
+    def get_schema(self):
+        '''
+        Returns the ReportSchema of this report. It is built once per report class, or once per
+        instance for instances that change the fields of their class.
+        '''
+        schema = type(self).__dict__.get('_schema')
+        if schema is None:
+            schema = ReportSchema(self)
+            type(self)._schema = schema
+        elif schema.source != self.get_schema_source():
+            schema = self.__dict__.get('_schema')
+            if schema is None or schema.source != self.get_schema_source():
+                schema = ReportSchema(self)
+                self._schema = schema
+        return schema
+
+    def get_schema_source(self):
+        '''
+        Returns the attributes a ReportSchema is built from.
+        '''
+        return (self.fields, self.sortable_fields, self.search_fields, self.models, self.date_range)
+
+    @classmethod
+    def invalidate_schema(cls):
+        '''
+        Throws away the ReportSchema of this report class and its subclasses, so it is built again
+        on next use. Use this when you changed the fields of a report class at runtime.
+        '''
+        if '_schema' in cls.__dict__:
+            delattr(cls, '_schema')
+        for subclass in cls.__subclasses__():
+            subclass.invalidate_schema()
+
     @property
     def column_headers(self):
-        return [self.get_field_metadata(field_name) for field_name in self.fields]
+        return [column.get_metadata(self) for column in self.get_schema().headers]
 
     @property
     def searchable_columns(self):
@@ -742,12 +1442,29 @@ class AdvancedReport(object):
         return _(u'You can search by %(fields)s') % {'fields': field_names}
 
     def get_column_values(self, item):
-        for field_name in self.fields:
-            yield {'html': self.get_item_html(field_name, item),
-                   'class': getattr(self, 'get_%s_class' % field_name, lambda i: u'')(item),
-                   'style': getattr(self, 'get_%s_style' % field_name, lambda: None)()}
+        return self.get_accessor_plan().get_column_values(item)
+
+    def get_accessor_plan(self):
+        '''
+        Returns the AccessorPlan of this report instance, which renders the columns of an item.
+        '''
+        plan = self.__dict__.get('_accessor_plan')
+        if plan is None or plan.fields != self.fields:
+            plan = AccessorPlan(self)
+            self._accessor_plan = plan
+        return plan
 
     def get_model_field(self, field_name):
+        model_fields = self.get_schema().model_fields
+        if field_name in model_fields:
+            return model_fields[field_name]
+        return self.resolve_model_field(field_name)
+
+    def resolve_model_field(self, field_name):
+        '''
+        Looks up the model field with the given name in the models of this report.
+        Use get_model_field instead, which uses the ReportSchema.
+        '''
         if self.models is None:
             return None
 
@@ -759,28 +1476,11 @@ class AdvancedReport(object):
         return None
 
     def get_field_metadata(self, field_name):
-        verbose_name = getattr(self, 'get_%s_verbose_name' % field_name, lambda: None)()
-        if verbose_name is None:
-            model_field = self.get_model_field(field_name)
-            if model_field is not None:
-                verbose_name = model_field.verbose_name
-
-        if verbose_name is None:
-            verbose_name = capfirst(field_name.replace(u'_', u' '))
-
-        sortable = False
-        order_by = ''
-        for sf in self.sortable_fields:
-            fn = sf.split('__')[0].split(',')[0].strip('-')
-            if fn == field_name.split('__')[0]:
-                sortable = True
-                order_by = sf.strip('-')
-
-        return {'name': field_name.split('__')[0],
-                'verbose_name': capfirst(verbose_name),
-                'sortable': sortable,
-                'order_by': order_by,
-                'style': getattr(self, 'get_%s_style' % field_name, lambda: None)()}
+        schema = self.get_schema()
+        column = schema.columns.get(field_name)
+        if column is None:
+            column = schema.build_column(self, field_name)
+        return column.get_metadata(self)
 
     def lookup_item_value(self, field_name, item):
         if '__' in field_name:
@@ -794,15 +1494,15 @@ class AdvancedReport(object):
         return html
 
     def get_item_html(self, field_name, item):
-        html = getattr(self, 'get_%s_html' % field_name, lambda i: None)(item)
-        if html is None:
-            html = self.lookup_item_value(field_name, item)
-
-        decorator = getattr(self, 'get_%s_decorator' % field_name, lambda i: None)(item)
-        if decorator is not None:
-            html = decorator(html)
+        return self.get_accessor_plan().get_column(field_name).get_html(item)
 
-        return mark_safe(html)
+    def get_item_export_value(self, field_name, item):
+        '''
+        Returns the value of the field for exports. This is the result of get_FOO_value when it is
+        implemented. Otherwise, fields with a get_FOO_html or get_FOO_decorator method are rendered
+        and stripped of their html, and other fields are looked up on the item.
+        '''
+        return self.get_accessor_plan().get_column(field_name).get_export_value(item)
 
     def objects(self, request=None):
         return EnrichedQueryset(self._queryset(request), self)
@@ -810,22 +1510,41 @@ class AdvancedReport(object):
     def enrich_object(self, o, list=True, request=None):
         '''
         This method adds extra metadata to an item.
-        When the list argument is True, enrich_list will be called on the item.
+        When the list argument is True, enrich_item will be called on the item.
         When calling this method multiple times, it is inefficient to call enrich_list,
         as it can be run once on the whole list, so in this case set list to False.
         If supplied, the request will be attached to the item so that you can use this
         in your actions.
         '''
         if list:
-            self.enrich_list([o])
+            with timed('enrich_list'):
+                self.enrich_item(o)
+
+        context = self.get_context()
+        budget = context.query_budget
+        if budget is not None:
+            budget.start_item()
+            count = budget.count
+        else:
+            count = _call
 
-        self.assign_attr(o, 'advreport_column_values', [v for v in self.get_column_values(o)])
-        self.assign_attr(o, 'advreport_actions', self.get_object_actions(o))
+        # The payload of the item may come from the payload cache.
+        if not self.get_attr(o, 'advreport_payload_cached', False):
+            if context.fields is None and _is_overridden(self, 'get_column_values'):
+                self.assign_attr(o, 'advreport_column_values', [v for v in count('get_column_values', self.get_column_values, o)])
+            else:
+                self.assign_attr(o, 'advreport_column_values', self.get_accessor_plan().get_column_values(o, context.fields, budget))
+            self.assign_attr(o, 'advreport_class', count('get_item_class', self.get_item_class, o))
+            if context.include is None or 'extra' in context.include:
+                self.assign_attr(o, 'advreport_extra_information', count('get_extra_information', self.get_extra_information, o) % Resolver({'item': o}))
+        if context.include is None or 'actions' in context.include:
+            self.assign_attr(o, 'advreport_actions', count('get_object_actions', self.get_object_actions, o))
         self.assign_attr(o, 'advreport_object_id', self.get_item_id(o))
-        self.assign_attr(o, 'advreport_class', self.get_item_class(o))
-        self.assign_attr(o, 'advreport_extra_information', self.get_extra_information(o) % Resolver({'item': o}))
         self.assign_attr(o, 'advreport_request', request)
 
+        if budget is not None:
+            budget.finish_item(self.get_item_id(o))
+
     def enrich_generic_relation(self, items, our_model, foreign_model, attr_name, fallback):
         '''
         This is a utility method that can be used to prefetch backwards generic foreign key relations.
@@ -898,8 +1617,11 @@ class AdvancedReport(object):
         actions = []
 
         for a in self.item_actions:
-            if self.verify_action_group(object, a.group):
-                new_action = a.copy_with_instanced_form(prefix=self.get_item_id(object), instance=object)
+            if self.has_action_group(object, a.group):
+                if self.lazy_action_forms:
+                    new_action = a.copy_with_lazy_form(instance=object)
+                else:
+                    new_action = a.copy_with_instanced_form(prefix=self.get_item_id(object), instance=object)
                 if not new_action.hidden and new_action.individual_display:
                     actions.append(new_action)
 
@@ -907,9 +1629,8 @@ class AdvancedReport(object):
 
     def find_object_action(self, object, method):
         for a in self.item_actions:
-            if self.verify_action_group(object, a.group):
-                if a.method == method:
-                    return a
+            if a.method == method and self.has_action_group(object, a.group):
+                return a
         return None
 
     def find_action(self, method):
@@ -939,17 +1660,217 @@ class AdvancedReport(object):
         else:
             setattr(object, attr_name, value)
 
+    def get_attr(self, object, attr_name, default=None):
+        '''
+        Gets the value of an attribute assigned with assign_attr.
+        '''
+        if isinstance(object, dict):
+            return object.get(attr_name, default)
+        return getattr(object, attr_name, default)
+
     def urlize(self, urlname, kwargs):
         return lambda h: u'<a href="%(l)s">%(h)s</a>' % {'l': reverse(urlname, kwargs=kwargs), 'h': h}
 
+class ReportColumn(object):
+    '''
+    The precomputed metadata of a single field of a report. The verbose name is kept as it was
+    given, often a lazy translation, and only translated in get_metadata.
+    '''
+    def __init__(self, metadata, verbose_name_method=None, style_method=None):
+        self.metadata = metadata
+        self.verbose_name_method = verbose_name_method
+        self.style_method = style_method
+
+    def get_metadata(self, advreport):
+        '''
+        Returns the metadata dict of the field. The verbose name is translated and
+        get_FOO_verbose_name and get_FOO_style are called every time, as they may depend on
+        the active language or the request.
+        '''
+        metadata = dict(self.metadata)
+        metadata['verbose_name'] = capfirst(metadata['verbose_name'])
+        if self.verbose_name_method is not None:
+            verbose_name = getattr(advreport, self.verbose_name_method)()
+            if verbose_name is not None:
+                metadata['verbose_name'] = capfirst(verbose_name)
+        if self.style_method is not None:
+            metadata['style'] = getattr(advreport, self.style_method)()
+        return metadata
+
+class ReportSchema(object):
+    '''
+    The metadata of the fields of a report: the model field of each field name, the columns,
+    the sortable fields and which search fields are model fields.
+
+    This is built once per AdvancedReport subclass, on first use. Use
+    AdvancedReport.invalidate_schema to rebuild it.
+    '''
+    def __init__(self, advreport):
+        self.source = advreport.get_schema_source()
+
+        field_names = set(advreport.fields or ())
+        for search_field in advreport.search_fields:
+            field_names.add(search_field.split('__')[0])
+            field_names.add(search_field.rsplit('__', 1)[-1])
+        for sortable_field in advreport.sortable_fields:
+            for part in sortable_field.split(','):
+                field_names.add(part.strip().strip('-').split('__')[0])
+        if advreport.date_range:
+            field_names.add(advreport.date_range)
+            field_names.add(advreport.date_range.split('__')[0])
+
+        self.model_fields = dict((field_name, advreport.resolve_model_field(field_name)) for field_name in field_names)
+
+        self.sortable = {}
+        for sf in advreport.sortable_fields:
+            self.sortable[sf.split('__')[0].split(',')[0].strip('-')] = sf.strip('-')
+
+        self.columns = dict((field_name, self.build_column(advreport, field_name)) for field_name in field_names)
+        self.headers = tuple(self.columns[field_name] for field_name in advreport.fields or ())
+        self.search_plan = tuple((search_field, self.model_fields[search_field.split('__')[0]] is not None)
+                                 for search_field in advreport.search_fields)
+
+    def build_column(self, advreport, field_name):
+        if field_name in self.model_fields:
+            model_field = self.model_fields[field_name]
+        else:
+            model_field = advreport.resolve_model_field(field_name)
+
+        verbose_name = None
+        if model_field is not None:
+            verbose_name = model_field.verbose_name
+        if verbose_name is None:
+            verbose_name = field_name.replace(u'_', u' ')
+
+        # The verbose name may be lazy, capfirst would translate it in the language of the request
+        # that happens to build the schema. See ReportColumn.get_metadata.
+        name = field_name.split('__')[0]
+        metadata = {'name': name,
+                    'verbose_name': verbose_name,
+                    'sortable': name in self.sortable,
+                    'order_by': self.sortable.get(name, ''),
+                    'style': None}
+
+        verbose_name_method = 'get_%s_verbose_name' % field_name
+        style_method = 'get_%s_style' % field_name
+        return ReportColumn(metadata,
+                            verbose_name_method if hasattr(advreport, verbose_name_method) else None,
+                            style_method if hasattr(advreport, style_method) else None)
+
+def compile_lookup(field_name):
+    '''
+    Returns a function that does what AdvancedReport.lookup_item_value does for the given
+    field name, with the __ path split up front.
+    '''
+    parts = field_name.split('__')
+    path, attr_name = parts[:-1], parts[-1]
+    display_name = 'get_%s_display' % attr_name
+
+    def lookup(item):
+        for part in path:
+            item = getattr(item, part, None)
+        get_display = getattr(item, display_name, None)
+        if get_display is not None:
+            html = get_display()
+            if html is not None:
+                return html
+        return getattr(item, attr_name, None)
+    return lookup
+
+def _is_overridden(advreport, method_name):
+    return getattr(type(advreport), method_name).im_func is not getattr(AdvancedReport, method_name).im_func
+
+def _call(name, func, *args):
+    # Stands in for QueryBudget.count when the report has no query budget.
+    return func(*args)
+
+class ColumnAccessor(object):
+    '''
+    The callables that render one column of an item, looked up once: the get_FOO_html,
+    get_FOO_decorator, get_FOO_class and get_FOO_style methods and the attribute lookup.
+    '''
+    def __init__(self, advreport, field_name):
+        self.field_name = field_name
+        self.html_method = getattr(advreport, 'get_%s_html' % field_name, None)
+        self.decorator_method = getattr(advreport, 'get_%s_decorator' % field_name, None)
+        self.class_method = getattr(advreport, 'get_%s_class' % field_name, None)
+        self.style_method = getattr(advreport, 'get_%s_style' % field_name, None)
+        self.value_method = getattr(advreport, 'get_%s_value' % field_name, None)
+
+        if _is_overridden(advreport, 'lookup_item_value'):
+            self.lookup = lambda item: advreport.lookup_item_value(field_name, item)
+        else:
+            self.lookup = compile_lookup(field_name)
+
+        if _is_overridden(advreport, 'get_item_html'):
+            self.html = lambda item: advreport.get_item_html(field_name, item)
+        else:
+            self.html = self.get_html
+
+    def get_html(self, item):
+        html = None
+        if self.html_method is not None:
+            html = self.html_method(item)
+        if html is None:
+            html = self.lookup(item)
+
+        if self.decorator_method is not None:
+            decorator = self.decorator_method(item)
+            if decorator is not None:
+                html = decorator(html)
+
+        return mark_safe(html)
+
+    def get_export_value(self, item):
+        if self.value_method is not None:
+            return self.value_method(item)
+        if self.html_method is not None or self.decorator_method is not None:
+            return strip_html(self.html(item))
+        return self.lookup(item)
+
+    def get_value(self, item):
+        return {'html': self.html(item),
+                'class': self.class_method(item) if self.class_method is not None else u'',
+                'style': self.style_method() if self.style_method is not None else None}
+
+class AccessorPlan(object):
+    '''
+    Renders the columns of items with ColumnAccessors that are built once per report instance,
+    instead of looking up the methods of each column for every item.
+    '''
+    def __init__(self, advreport):
+        self.advreport = advreport
+        self.fields = advreport.fields
+        self.columns = dict((field_name, ColumnAccessor(advreport, field_name)) for field_name in advreport.fields)
+        self.accessors = [self.columns[field_name] for field_name in advreport.fields]
+
+    def get_column(self, field_name):
+        column = self.columns.get(field_name)
+        if column is None:
+            column = ColumnAccessor(self.advreport, field_name)
+            self.columns[field_name] = column
+        return column
+
+    def get_column_values(self, item, fields=None, budget=None):
+        accessors = self.accessors if fields is None else [self.get_column(field_name) for field_name in fields]
+        if budget is None:
+            return [accessor.get_value(item) for accessor in accessors]
+        return [budget.count(accessor.field_name, accessor.get_value, item) for accessor in accessors]
+
 class EnrichedQueryset(object):
-    def __init__(self, queryset, advreport):
+    def __init__(self, queryset, advreport, estimate_count=False):
         self.queryset = queryset
         self.advreport = advreport
+        self.estimate_count = estimate_count
+        self.row_cache = None
+        self._count = None
+        self._count_is_approximate = False
 
     def __getitem__(self, k):
         if isinstance(k, slice):
-            return self._enrich_list(list(self.queryset[k.start:k.stop]))
+            with timed('fetch'):
+                items = list(self.queryset[k.start:k.stop])
+            return self._enrich_list(items)
         else:
             return self._enrich(self.queryset[k])
 
@@ -957,24 +1878,132 @@ class EnrichedQueryset(object):
         return self.queryset.__iter__()
 
     def __len__(self):
-        if type(self.queryset) in (list, tuple):
-            return len(self.queryset)
-        return self.queryset.count()
+        # The count is done only once, as it can be expensive and is needed by the paginator,
+        # the templates and the api.
+        if self._count is None:
+            if type(self.queryset) in (list, tuple):
+                self._count = len(self.queryset)
+            else:
+                with timed('count'):
+                    self._count, self._count_is_approximate = self.advreport.count_items(self.queryset, estimate=self.estimate_count)
+        return self._count
+
+    def count(self):
+        return len(self)
+
+    @property
+    def count_is_approximate(self):
+        len(self)
+        return self._count_is_approximate
+
+    def iter_chunks(self, size, enrich_objects=True):
+        '''
+        Yields enriched lists of at most size items. Unlike slicing, the underlying queryset
+        is iterated only once and its results are not cached, so this is suited for exports.
+        When enrich_objects is False, only enrich_list is run on each chunk.
+        '''
+        if hasattr(self.queryset, 'iterator'):
+            iterator = self.queryset.iterator()
+        else:
+            iterator = iter(self.queryset)
+
+        while True:
+            with timed('fetch'):
+                chunk = list(itertools.islice(iterator, size))
+            if not chunk:
+                break
+            if enrich_objects:
+                yield self._enrich_list(chunk)
+            else:
+                with timed('enrich_list'):
+                    self.advreport.enrich_list(chunk)
+                yield chunk
 
     def _enrich_list(self, l):
-        # We run enrich_list on all items in one pass.
-        self.advreport.enrich_list(l)
+        # Items of which the row is cached don't need to be enriched.
+        stale = l if self.row_cache is None else self.row_cache.load(l)
+
+        # The columns of items of which the payload is cached aren't rendered. Cached payloads
+        # have all columns, so they aren't used when only some columns are asked for.
+        context = self.advreport.get_context()
+        payload_cache = None
+        if self.advreport.payload_cache and context.fields is None:
+            payload_cache = self.advreport.get_payload_cache()
+        missing = stale if payload_cache is None else payload_cache.load(stale)
+
+        # The actions of all items are still found, and they may depend on what enrich_list attaches.
+        if context.include is None or 'actions' in context.include:
+            enrich = stale
+        else:
+            enrich = missing
 
-        for o in l:
-            # We pass list=False to prevent running enrich_list from enrich_object.
-            self.advreport.enrich_object(o, list=False)
+        # The queries of the page are counted when the report has a query budget.
+        budget = self.advreport.get_query_budget() if stale else None
+        if budget is not None:
+            # enrich_object finds the budget on the context, which is activated if it isn't yet.
+            previous = self.advreport.activate(context)
+            context.query_budget = budget
+            budget.start()
+
+        try:
+            # We run enrich_list on all items in one pass.
+            with timed('enrich_list'):
+                self.advreport.enrich_list(enrich)
+                self.advreport.prefetch_action_groups(stale)
+
+            for o in stale:
+                # We pass list=False to prevent running enrich_list from enrich_object.
+                with timed('enrich_object'):
+                    self.advreport.enrich_object(o, list=False)
+        finally:
+            if budget is not None:
+                context.query_budget = None
+                self.advreport.activate(previous)
+                budget.stop()
+
+        if budget is not None:
+            budget.check_page()
+
+        if payload_cache is not None:
+            payload_cache.store(missing)
 
         return l
 
     def _enrich(self, o):
-        self.advreport.enrich_object(o)
+        with timed('enrich_object'):
+            self.advreport.enrich_object(o)
         return o
 
+def estimate_count(queryset):
+    '''
+    Returns the number of rows the query planner expects the queryset to return, or None when
+    the database backend doesn't support estimates.
+    '''
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+    except EmptyResultSet:
+        return 0
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN %s' % sql, params)
+    match = re.search(r' rows=(\d+)', cursor.fetchone()[0])
+    if match is None:
+        return None
+    return int(match.group(1))
+
+def strip_html(html):
+    '''
+    Turns the html of a column into plain text.
+    '''
+    text = u'%s' % html
+    text = text.replace(u'&nbsp;', u' ')
+    text = text.replace(u'&euro;', u'\u20ac')
+    text = text.replace(u'<br/>', u' ')
+    text = strip_entities(text)
+    return strip_tags(text)
+
 class Resolver(object):
     def __init__(self, context):
         self.context = context
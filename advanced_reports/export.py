@@ -0,0 +1,195 @@
+import datetime
+import decimal
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404
+from django.utils import simplejson
+from django.utils.encoding import force_unicode
+from django.utils.functional import Promise
+
+
+class Exporter(object):
+    '''
+    Base class for the export formats of a report.
+
+    Items are fetched and run through enrich_list in chunks of advreport.export_chunk_size,
+    so the whole result set is never held in memory. Exporters don't need the actions and
+    the html of the items, so enrich_object is skipped and the values come from
+    advreport.get_item_export_value.
+    '''
+    content_type = None
+    extension = None
+
+    def __init__(self, advreport):
+        self.advreport = advreport
+
+    def get_filename(self):
+        return '%s.%s' % (self.advreport.slug, self.extension)
+
+    def get_values(self, item):
+        return [self.advreport.get_item_export_value(field_name, item) for field_name in self.advreport.fields]
+
+    def iter_items(self, object_list, progress=None):
+        '''
+        Yields the items of object_list. When given, progress is called with the number of
+        items in each chunk after the chunk has been exported.
+        '''
+        for chunk in object_list.iter_chunks(self.advreport.export_chunk_size, enrich_objects=False):
+            for item in chunk:
+                yield item
+            if progress is not None:
+                progress(len(chunk))
+
+    def iter_export(self, object_list, progress=None):
+        '''
+        Yields the export as byte strings. By default, the export is written to a temporary file
+        with write and streamed from there, for formats that can't be written sequentially.
+        Exporters must implement iter_export, write or both.
+        '''
+        if type(self).write.im_func is Exporter.write.im_func:
+            raise NotImplementedError(u'%s must implement iter_export or write.' % type(self).__name__)
+        f = tempfile.TemporaryFile()
+        try:
+            self.write(object_list, f, progress=progress)
+            f.seek(0)
+            while True:
+                data = f.read(64 * 1024)
+                if not data:
+                    break
+                yield data
+        finally:
+            f.close()
+
+    def join_lines(self, lines):
+        '''
+        Joins lines into blocks of export_chunk_size lines, to keep the number of writes down.
+        '''
+        block = []
+        for line in lines:
+            block.append(line)
+            if len(block) >= self.advreport.export_chunk_size:
+                yield ''.join(block)
+                block = []
+        if block:
+            yield ''.join(block)
+
+    def write(self, object_list, f, progress=None):
+        '''
+        Writes the export to the file-like object f.
+        '''
+        for data in self.iter_export(object_list, progress=progress):
+            f.write(data)
+
+
+class CSVExporter(Exporter):
+    '''
+    Exports the items of a report as semicolon separated values.
+
+    The values are the ones of get_item_export_value: columns with a get_FOO_html or
+    get_FOO_decorator method are stripped of their html, like before, but other columns hold the
+    value of the item as is, so html in these values is no longer stripped. None becomes an
+    empty value.
+    '''
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    def header(self):
+        line = u'%s\n' % u';'.join(force_unicode(c['verbose_name']) for c in self.advreport.column_headers)
+        return line.encode('utf-8')
+
+    def convert(self, value):
+        if value is None:
+            return u''
+        return force_unicode(value)
+
+    def line(self, item):
+        line = u'%s\n' % u';'.join(self.convert(value) for value in self.get_values(item))
+        return line.encode('utf-8')
+
+    def iter_export(self, object_list, progress=None):
+        yield self.header()
+        for block in self.join_lines(self.line(item) for item in self.iter_items(object_list, progress=progress)):
+            yield block
+
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, Promise):
+            return force_unicode(o)
+        try:
+            return super(ExportJSONEncoder, self).default(o)
+        except TypeError:
+            return force_unicode(o)
+
+
+class JSONLinesExporter(Exporter):
+    '''
+    Exports the items of a report as JSON Lines: one JSON object per item, keyed by field name.
+    '''
+    content_type = 'application/x-ndjson'
+    extension = 'jsonl'
+
+    def line(self, item):
+        values = dict(zip(self.advreport.fields, self.get_values(item)))
+        return '%s\n' % simplejson.dumps(values, cls=ExportJSONEncoder)
+
+    def iter_export(self, object_list, progress=None):
+        return self.join_lines(self.line(item) for item in self.iter_items(object_list, progress=progress))
+
+
+class XLSXExporter(Exporter):
+    '''
+    Exports the items of a report as an Excel workbook. This requires the XlsxWriter package.
+
+    XlsxWriter writes the rows one by one in constant memory mode. As a workbook is a zip
+    file, it is spooled to a temporary file first and streamed from there.
+
+    Strings are always written as strings: values that start with "=" don't become formulas
+    and urls don't become links.
+    '''
+    content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    extension = 'xlsx'
+
+    def convert(self, value):
+        if value is None or isinstance(value, (bool, int, long, float, basestring,
+                                               datetime.date, datetime.time)):
+            if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+                return value.replace(tzinfo=None)
+            return value
+        if isinstance(value, decimal.Decimal):
+            return float(value)
+        return force_unicode(value)
+
+    def write(self, object_list, f, progress=None):
+        try:
+            import xlsxwriter
+        except ImportError:
+            raise ImproperlyConfigured(u'Exporting to xlsx requires the XlsxWriter package.')
+
+        workbook = xlsxwriter.Workbook(f, {'constant_memory': True,
+                                           'strings_to_formulas': False,
+                                           'strings_to_urls': False,
+                                           'default_date_format': 'yyyy-mm-dd'})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, [force_unicode(c['verbose_name']) for c in self.advreport.column_headers])
+        for row, item in enumerate(self.iter_items(object_list, progress=progress)):
+            worksheet.write_row(row + 1, 0, [self.convert(value) for value in self.get_values(item)])
+        workbook.close()
+
+
+EXPORTERS = {
+    'csv': CSVExporter,
+    'jsonl': JSONLinesExporter,
+    'xlsx': XLSXExporter,
+}
+
+
+def get_exporter(format, advreport):
+    '''
+    Returns an exporter instance for the given format, or raises Http404 when the format is unknown.
+    '''
+    if format not in EXPORTERS:
+        raise Http404(u'Unknown export format "%s".' % format)
+    return EXPORTERS[format](advreport)
@@ -0,0 +1,360 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.functional import wraps
+
+from advanced_reports.signals import report_timed
+
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTATION = getattr(settings, 'ADVANCED_REPORTS_INSTRUMENTATION', False)
+'''
+When True, the views of the reports record the wall time, the number of SQL queries and the SQL
+time of every phase of the request. The timings are added to the response as a "Server-Timing"
+header, logged to the advanced_reports.instrumentation logger and sent with the report_timed signal.
+'''
+
+_local = threading.local()
+
+
+def enable_debug_cursors():
+    '''
+    Makes every connection log its queries, so they can be counted. Returns the state to pass to
+    restore_debug_cursors afterwards.
+    '''
+    state = {}
+    for connection in connections.all():
+        state[connection.alias] = (connection.use_debug_cursor, len(connection.queries))
+        connection.use_debug_cursor = True
+    return state
+
+
+def restore_debug_cursors(state):
+    for connection in connections.all():
+        if connection.alias not in state:
+            continue
+        use_debug_cursor, count = state[connection.alias]
+        connection.use_debug_cursor = use_debug_cursor
+        if not (use_debug_cursor or (use_debug_cursor is None and settings.DEBUG)):
+            # Don't keep the queries that were only logged to be counted.
+            del connection.queries[count:]
+
+
+def count_queries():
+    '''
+    Returns the number of queries logged by all connections.
+    '''
+    return sum(len(connection.queries) for connection in connections.all())
+
+
+class Phase(object):
+    '''
+    The totals of a phase of a request. Phases can be entered more than once, like enrich_object,
+    which runs for every row.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def as_dict(self):
+        return {'calls': self.calls,
+                'duration': self.duration,
+                'queries': self.queries,
+                'sql_time': self.sql_time}
+
+
+class Timeline(object):
+    '''
+    Records the phases of a request. The time and the queries of nested phases are not counted
+    in the enclosing phase, so the phases add up to the total of the request.
+
+    Queries are read from connection.queries, so the debug cursor of every connection is enabled
+    while the timeline runs.
+    '''
+    def __init__(self, view, slug):
+        self.view = view
+        self.slug = slug
+        self.phases = []
+        self.phases_by_name = {}
+        self.stack = []
+        self.seen = {}
+        self.debug_cursors = None
+        self.started = self.stopped = None
+        self.sql_started = self.sql_stopped = None
+
+    def start(self):
+        self.debug_cursors = enable_debug_cursors()
+        self.started = time.time()
+        self.sql_started = self.get_sql()
+
+    def stop(self):
+        while self.stack:
+            self.leave()
+        self.stopped = time.time()
+        self.sql_stopped = self.get_sql()
+        restore_debug_cursors(self.debug_cursors)
+
+    def get_sql(self):
+        '''
+        Returns the number of queries and the SQL time so far, over all connections.
+        '''
+        count, total = 0, 0.0
+        for connection in connections.all():
+            seen, seen_count, seen_time = self.seen.get(connection.alias, (0, 0, 0.0))
+            queries = connection.queries
+            if len(queries) < seen:
+                # The queries were reset.
+                seen = 0
+            for query in queries[seen:]:
+                seen_time += float(query.get('time') or 0)
+            seen_count += len(queries) - seen
+            self.seen[connection.alias] = (len(queries), seen_count, seen_time)
+            count += seen_count
+            total += seen_time
+        return count, total
+
+    def get_phase(self, name):
+        phase = self.phases_by_name.get(name)
+        if phase is None:
+            phase = self.phases_by_name[name] = Phase(name)
+            self.phases.append(phase)
+        return phase
+
+    def _charge(self, entry, now, sql):
+        phase, started, sql_started = entry
+        phase.duration += now - started
+        phase.queries += sql[0] - sql_started[0]
+        phase.sql_time += sql[1] - sql_started[1]
+
+    def enter(self, name):
+        now, sql = time.time(), self.get_sql()
+        if self.stack:
+            self._charge(self.stack[-1], now, sql)
+        phase = self.get_phase(name)
+        phase.calls += 1
+        self.stack.append([phase, now, sql])
+
+    def leave(self):
+        now, sql = time.time(), self.get_sql()
+        self._charge(self.stack.pop(), now, sql)
+        if self.stack:
+            self.stack[-1][1:] = [now, sql]
+
+    @property
+    def duration(self):
+        return (self.stopped or time.time()) - self.started
+
+    @property
+    def queries(self):
+        return (self.sql_stopped or self.get_sql())[0] - self.sql_started[0]
+
+    @property
+    def sql_time(self):
+        return (self.sql_stopped or self.get_sql())[1] - self.sql_started[1]
+
+    def as_dict(self):
+        return {'view': self.view,
+                'slug': self.slug,
+                'duration': self.duration,
+                'queries': self.queries,
+                'sql_time': self.sql_time,
+                'phases': dict((phase.name, phase.as_dict()) for phase in self.phases)}
+
+    def as_header(self):
+        '''
+        Returns the value of the Server-Timing header, with the durations in milliseconds.
+        '''
+        metrics = []
+        for phase in self.phases:
+            metrics.append('%s;dur=%.2f;desc="%d queries, %d calls"' % (phase.name, phase.duration * 1000, phase.queries, phase.calls))
+        metrics.append('sql;dur=%.2f;desc="%d queries"' % (self.sql_time * 1000, self.queries))
+        metrics.append('total;dur=%.2f' % (self.duration * 1000))
+        return ', '.join(metrics)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudget(object):
+    '''
+    Counts the queries of a page of a report while it is enriched, per column and per hook, and
+    checks them against the budgets of the report. Columns and hooks that run queries for every
+    row of the page are reported as N+1 queries.
+    '''
+    def __init__(self, advreport, per_page=None, per_item=None):
+        self.advreport = advreport
+        self.per_page = per_page
+        self.per_item = per_item
+        self.debug_cursors = None
+        self.started = self.total = 0
+        self.items = 0
+        self.counts = {}
+        self.rows = {}
+        self.item_counts = {}
+
+    def start(self):
+        self.debug_cursors = enable_debug_cursors()
+        self.started = count_queries()
+
+    def stop(self):
+        self.total = count_queries() - self.started
+        restore_debug_cursors(self.debug_cursors)
+
+    def count(self, name, func, *args):
+        '''
+        Returns func(*args), counting its queries for the column or hook with the given name.
+        '''
+        before = count_queries()
+        try:
+            return func(*args)
+        finally:
+            queries = count_queries() - before
+            if queries:
+                self.item_counts[name] = self.item_counts.get(name, 0) + queries
+
+    def start_item(self):
+        self.item_counts = {}
+
+    def finish_item(self, item_id):
+        self.items += 1
+        for name, queries in self.item_counts.items():
+            self.counts[name] = self.counts.get(name, 0) + queries
+            self.rows[name] = self.rows.get(name, 0) + 1
+        queries = sum(self.item_counts.values())
+        if self.per_item is not None and queries > self.per_item:
+            self.exceeded(u'Item %s of report %s ran %d queries, its budget is %d. %s' % (
+                item_id, self.advreport.slug, queries, self.per_item, self.describe(self.item_counts)))
+
+    def check_page(self):
+        if self.per_page is not None and self.total > self.per_page:
+            self.exceeded(u'A page of %d items of report %s ran %d queries, its budget is %d. %s' % (
+                self.items, self.advreport.slug, self.total, self.per_page, self.describe(self.counts)))
+
+    def get_per_row(self):
+        '''
+        Returns the names of the columns and hooks that ran queries for every row of the page.
+        '''
+        if self.items < 2:
+            return []
+        return sorted(name for name, rows in self.rows.items() if rows == self.items)
+
+    def describe(self, counts):
+        culprits = sorted(counts.items(), key=lambda (name, queries): -queries)
+        description = u'Queries per column or hook: %s.' % (
+            u', '.join(u'%s: %d' % culprit for culprit in culprits) if culprits else u'none')
+        per_row = self.get_per_row()
+        if per_row:
+            description += u' %s ran queries for every row, prefetch them in enrich_list.' % u', '.join(per_row)
+        return description
+
+    def exceeded(self, message):
+        if should_raise_query_budget():
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+def should_raise_query_budget():
+    '''
+    Returns whether a QueryBudgetExceeded is raised when a report runs more queries than its budget,
+    see AdvancedReport.query_budget_per_page. Otherwise, a warning is logged.
+
+    This is the ADVANCED_REPORTS_QUERY_BUDGET_RAISE setting, or DEBUG when it isn't set. Django's
+    test runner runs with DEBUG set to False, so set it to True in the settings of your tests.
+    The setting is read every time, so tests can change it.
+    '''
+    value = getattr(settings, 'ADVANCED_REPORTS_QUERY_BUDGET_RAISE', None)
+    if value is not None:
+        return value
+    return settings.DEBUG
+
+
+def get_timeline():
+    '''
+    Returns the Timeline of the current thread, or None when no request is instrumented.
+    '''
+    return getattr(_local, 'timeline', None)
+
+
+class timed(object):
+    '''
+    Records the code in a with block as the given phase of the current request, if it is instrumented:
+
+        with timed('enrich_list'):
+            advreport.enrich_list(items)
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.timeline = None
+
+    def __enter__(self):
+        self.timeline = get_timeline()
+        if self.timeline is not None:
+            self.timeline.enter(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.timeline is not None:
+            self.timeline.leave()
+
+
+def start_timeline(view, slug):
+    '''
+    Starts recording a Timeline for the current thread, when INSTRUMENTATION is enabled and the
+    thread isn't recorded yet. Returns the timeline, or None.
+    '''
+    if not INSTRUMENTATION or get_timeline() is not None:
+        return None
+    timeline = _local.timeline = Timeline(view, slug)
+    timeline.start()
+    return timeline
+
+
+def stop_timeline(timeline):
+    timeline.stop()
+    _local.timeline = None
+
+
+def report_timeline(timeline, advreport, request):
+    '''
+    Logs a stopped timeline and sends it with the report_timed signal.
+    '''
+    logger.info('%s of report %s took %.1fms, %d queries took %.1fms',
+                timeline.view, timeline.slug, timeline.duration * 1000, timeline.queries, timeline.sql_time * 1000,
+                extra={'advreport_timeline': timeline.as_dict()})
+    report_timed.send(sender=advreport.__class__, advreport=advreport, request=request, timeline=timeline)
+
+
+def instrument(view):
+    '''
+    Records a Timeline of the view, when INSTRUMENTATION is enabled. Views that are called while
+    another view is instrumented, like the list of a report embedded in a page, are part of the
+    timeline of the outer view.
+
+    Note that the phases of streamed responses, like csv exports, run after the timeline was
+    recorded. Background exports record a timeline of their own, see run_export_job.
+    '''
+    def wrapper(request, slug, *args, **kwargs):
+        timeline = start_timeline(view.__name__, slug)
+        if timeline is None:
+            return view(request, slug, *args, **kwargs)
+
+        try:
+            response = view(request, slug, *args, **kwargs)
+        finally:
+            stop_timeline(timeline)
+
+        if isinstance(response, HttpResponse):
+            response['Server-Timing'] = timeline.as_header()
+
+        from advanced_reports import get_report_or_404
+        report_timeline(timeline, get_report_or_404(slug), request)
+        return response
+    return wraps(view)(wrapper)
@@ -0,0 +1,268 @@
+import logging
+import os
+import Queue
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpRequest, QueryDict
+from django.utils.importlib import import_module
+
+from advanced_reports.defaults import ReportContext
+from advanced_reports.export import get_exporter
+from advanced_reports.instrumentation import report_timeline, start_timeline, stop_timeline, timed
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_TTL = getattr(settings, 'ADVANCED_REPORTS_EXPORT_TTL', 60 * 60)
+'''
+The number of seconds a background export and its spooled file are kept around.
+'''
+
+EXPORT_RUNNER = getattr(settings, 'ADVANCED_REPORTS_EXPORT_RUNNER', 'advanced_reports.jobs.ThreadRunner')
+'''
+Dotted path to the runner class that executes export jobs. A runner must implement
+submit(func, *args). Runners for external queues only need to call run_export_job(job_id)
+in the worker, as the whole job state lives in the Django cache.
+'''
+
+FILE_PREFIX = 'advreport_'
+
+
+def get_export_dir():
+    return getattr(settings, 'ADVANCED_REPORTS_EXPORT_DIR', None) or tempfile.gettempdir()
+
+
+class ExportJob(object):
+    '''
+    The state of a background export. Jobs are stored in the Django cache, so their status
+    and their file can be served by every process that shares the cache and the export directory.
+    '''
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, slug, format, query_string=u'', path=u'', user_id=None):
+        self.id = uuid.uuid4().hex
+        self.slug = slug
+        self.format = format
+        self.query_string = query_string
+        self.path = path
+        self.user_id = user_id
+        self.status = self.PENDING
+        self.rows_done = 0
+        self.rows_total = None
+        self.filename = None
+        self.content_type = None
+        self.file_path = None
+        self.error = None
+        self.created = time.time()
+
+    @staticmethod
+    def get_cache_key(job_id):
+        return 'advreport_export_job_%s' % job_id
+
+    @classmethod
+    def load(cls, job_id):
+        return cache.get(cls.get_cache_key(job_id))
+
+    def save(self):
+        cache.set(self.get_cache_key(self.id), self, EXPORT_TTL)
+
+    def advance(self, count):
+        self.rows_done += count
+        self.save()
+
+    def get_request(self):
+        '''
+        Rebuilds a GET request with the filters of the original request, to feed get_object_list.
+        '''
+        request = HttpRequest()
+        request.method = 'GET'
+        request.path = self.path
+        request.GET = QueryDict(self.query_string.encode('utf-8'))
+        request.user = self.get_user()
+        return request
+
+    def get_user(self):
+        from django.contrib.auth.models import User, AnonymousUser
+        if self.user_id is None:
+            return AnonymousUser()
+        try:
+            return User.objects.get(pk=self.user_id)
+        except User.DoesNotExist:
+            return AnonymousUser()
+
+    def as_dict(self):
+        return {'id': self.id,
+                'slug': self.slug,
+                'format': self.format,
+                'status': self.status,
+                'rows_done': self.rows_done,
+                'rows_total': self.rows_total,
+                'error': self.error}
+
+
+def run_export_job(job_id):
+    '''
+    Runs the export of the given job and spools it to a file in the export directory.
+
+    When ADVANCED_REPORTS_INSTRUMENTATION is enabled, the job records an "export_job" timeline
+    with its fetch, enrich_list and write phases, which is logged and sent with the report_timed
+    signal like the ones of the views.
+    '''
+    from advanced_reports import get_report_for_slug
+
+    job = ExportJob.load(job_id)
+    if job is None:
+        return
+
+    job.status = ExportJob.RUNNING
+    job.save()
+
+    timeline = start_timeline('export_job', job.slug)
+    advreport = request = None
+    try:
+        advreport = get_report_for_slug(job.slug)
+        request = job.get_request()
+        previous = advreport.activate(ReportContext(request))
+        try:
+            exporter = get_exporter(job.format, advreport)
+            object_list, context = advreport.get_object_list(request)
+            job.rows_total = len(object_list)
+            job.filename = exporter.get_filename()
+            job.content_type = exporter.content_type
+            job.save()
+
+            fd, file_path = tempfile.mkstemp(prefix=FILE_PREFIX, suffix='.%s' % exporter.extension, dir=get_export_dir())
+            f = os.fdopen(fd, 'wb')
+            try:
+                with timed('write'):
+                    exporter.write(object_list, f, progress=job.advance)
+            finally:
+                f.close()
+        finally:
+            advreport.activate(previous)
+
+        job.file_path = file_path
+        job.status = ExportJob.DONE
+        job.save()
+    except Exception, e:
+        logger.exception('Export job %s of report %s failed', job.id, job.slug)
+        job.status = ExportJob.FAILED
+        job.error = u'%s' % e
+        job.save()
+    finally:
+        if timeline is not None:
+            stop_timeline(timeline)
+            if advreport is not None:
+                report_timeline(timeline, advreport, request)
+
+
+def purge_expired_exports():
+    '''
+    Removes spooled export files that are older than ADVANCED_REPORTS_EXPORT_TTL.
+    '''
+    export_dir = get_export_dir()
+    expired = time.time() - EXPORT_TTL
+    for filename in os.listdir(export_dir):
+        if not filename.startswith(FILE_PREFIX):
+            continue
+        file_path = os.path.join(export_dir, filename)
+        try:
+            if os.path.getmtime(file_path) < expired:
+                os.remove(file_path)
+        except OSError:
+            pass
+
+
+class ThreadRunner(object):
+    '''
+    The default runner. It executes jobs in a bounded pool of daemon threads inside the
+    current process, so no external queue is needed.
+    '''
+    max_workers = getattr(settings, 'ADVANCED_REPORTS_EXPORT_WORKERS', 2)
+
+    def __init__(self):
+        self.queue = Queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def submit(self, func, *args):
+        self.queue.put((func, args))
+        self.lock.acquire()
+        try:
+            self.threads = [t for t in self.threads if t.is_alive()]
+            while len(self.threads) < self.max_workers:
+                thread = threading.Thread(target=self.work, name='advreport-export')
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        finally:
+            self.lock.release()
+
+    def work(self):
+        while True:
+            func, args = self.queue.get()
+            try:
+                func(*args)
+            except Exception:
+                logger.exception('Export job failed')
+            finally:
+                # Every thread gets its own database connection, don't leave it open.
+                connection.close()
+                self.queue.task_done()
+
+
+class SynchronousRunner(object):
+    '''
+    Runs jobs right away in the calling thread. Mostly useful for testing.
+    '''
+    def submit(self, func, *args):
+        func(*args)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    global _runner
+    if _runner is None:
+        _runner_lock.acquire()
+        try:
+            if _runner is None:
+                module_name, class_name = EXPORT_RUNNER.rsplit('.', 1)
+                _runner = getattr(import_module(module_name), class_name)()
+        finally:
+            _runner_lock.release()
+    return _runner
+
+
+def start_export_job(advreport, request, format):
+    '''
+    Creates a job that exports the report with the filters of the given request,
+    and hands it to the configured runner.
+    '''
+    purge_expired_exports()
+
+    query_string = request.GET.copy()
+    for key in ('csv', 'export', 'page'):
+        if key in query_string:
+            del query_string[key]
+
+    user = getattr(request, 'user', None)
+    job = ExportJob(slug=advreport.slug,
+                    format=format,
+                    query_string=query_string.urlencode(),
+                    path=request.path,
+                    user_id=user.pk if user is not None and user.is_authenticated() else None)
+    job.save()
+    get_runner().submit(run_export_job, job.id)
+    return ExportJob.load(job.id) or job
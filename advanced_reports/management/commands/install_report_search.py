@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from advanced_reports import REGISTRY, get_report_for_slug
+
+
+class Command(BaseCommand):
+    args = '[slug slug ...]'
+    help = 'Creates the database objects of the search backend of the given reports, or of all reports that use one.'
+
+    def handle(self, *slugs, **options):
+        if not slugs:
+            slugs = sorted(slug for slug in REGISTRY if get_report_for_slug(slug).search_backend)
+
+        for slug in slugs:
+            advreport = get_report_for_slug(slug)
+            if advreport is None:
+                raise CommandError('No AdvancedReport with slug "%s".' % slug)
+            if not advreport.search_backend:
+                raise CommandError('The report "%s" does not use a search backend.' % slug)
+
+            transaction.commit_on_success(advreport.get_search_backend().install)()
+            self.stdout.write('Installed the search backend of %s.\n' % slug)
@@ -0,0 +1,146 @@
+import base64
+import datetime
+import operator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.utils import simplejson
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # Keep the microseconds, or the seek would return the last item of the page again.
+        if isinstance(o, datetime.datetime):
+            return o.strftime('%Y-%m-%d %H:%M:%S.%f')
+        return super(CursorEncoder, self).default(o)
+
+
+def encode_cursor(ordering, values):
+    '''
+    Encodes the sort key of an item into an opaque, url-safe cursor.
+    '''
+    return base64.urlsafe_b64encode(simplejson.dumps([ordering, values], cls=CursorEncoder)).rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    '''
+    Decodes a cursor made by encode_cursor. Returns None when the cursor is invalid or
+    when it was made for another ordering.
+    '''
+    try:
+        cursor = str(cursor)
+        cursor_ordering, values = simplejson.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if cursor_ordering != ordering or not isinstance(values, list) or len(values) != len(ordering):
+        return None
+    return values
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-%s' % field for field in ordering]
+
+
+def get_item_key(item, ordering):
+    '''
+    Returns the values of the ordering fields for the given item. For a relation, like customer,
+    the value is its key, customer_id. The items are then ordered by the key as well, unless the
+    related model has a default ordering, which isn't supported.
+    '''
+    values = []
+    for field in ordering:
+        value = item
+        parts = field.lstrip('-').split('__')
+        for part in parts[:-1]:
+            value = getattr(value, part, None)
+        values.append(get_field_key(value, parts[-1]))
+    return values
+
+
+def get_field_key(obj, name):
+    '''
+    Returns the value of the field with the given name of obj, or the key of the related object
+    when the field is a relation, as a model instance can't be put in a cursor.
+    '''
+    try:
+        field = obj._meta.get_field(name)
+    except (AttributeError, FieldDoesNotExist):
+        return getattr(obj, name, None)
+    if field.rel is not None:
+        return getattr(obj, field.attname)
+    return getattr(obj, name)
+
+
+def get_seek_query(ordering, values):
+    '''
+    Returns a Q object that matches the items that come after the given key in the given ordering:
+    (a > 1) OR (a = 1 AND b > 2) OR (a = 1 AND b = 2 AND c > 3) ...
+    '''
+    queries = []
+    for i, field in enumerate(ordering):
+        lookup = '%s__%s' % (field.lstrip('-'), 'lt' if field.startswith('-') else 'gt')
+        query = Q(**{lookup: values[i]})
+        for previous_field, previous_value in zip(ordering[:i], values[:i]):
+            query &= Q(**{previous_field.lstrip('-'): previous_value})
+        queries.append(query)
+    return reduce(operator.or_, queries)
+
+
+class KeysetPage(object):
+    '''
+    A page of a report that was paginated with keyset pagination.
+    '''
+    keyset = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def keyset_paginate(request, object_list, ordering, num_per_page):
+    '''
+    Returns a KeysetPage of the given EnrichedQueryset.
+
+    Instead of skipping items with an OFFSET, the page seeks from the key of the last item of
+    the previous page (the "after" parameter) or from the first item of the next page
+    (the "before" parameter). The ordering must end with a unique field, like the primary key.
+    '''
+    queryset = object_list.queryset
+    after = decode_cursor(request.GET.get('after', ''), ordering)
+    before = decode_cursor(request.GET.get('before', ''), ordering)
+
+    backwards = False
+    if after is not None:
+        queryset = queryset.order_by(*ordering).filter(get_seek_query(ordering, after))
+    elif before is not None:
+        backwards = True
+        reversed_ordering = reverse_ordering(ordering)
+        queryset = queryset.order_by(*reversed_ordering).filter(get_seek_query(reversed_ordering, before))
+    else:
+        queryset = queryset.order_by(*ordering)
+
+    items = list(queryset[:num_per_page + 1])
+    has_more = len(items) > num_per_page
+    items = items[:num_per_page]
+    if backwards:
+        items.reverse()
+
+    next_cursor = previous_cursor = None
+    if items:
+        if backwards or has_more:
+            next_cursor = encode_cursor(ordering, get_item_key(items[-1], ordering))
+        if (backwards and has_more) or (not backwards and after is not None):
+            previous_cursor = encode_cursor(ordering, get_item_key(items[0], ordering))
+
+    return KeysetPage(object_list._enrich_list(items), next_cursor, previous_cursor)
@@ -0,0 +1,277 @@
+import re
+
+from django.db import connections
+from django.db.models import AutoField, IntegerField, Q
+from django.db.models.query import QuerySet
+from django.utils.importlib import import_module
+
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+CONFIG_RE = re.compile(r'^\w+$')
+
+WEIGHTS = ('A', 'B', 'C', 'D')
+
+
+class SearchBackend(object):
+    '''
+    Compiles the search fields of a report into database queries. This base class doesn't handle
+    any field, so all model fields are searched with icontains lookups.
+
+    A backend handles the search fields that are columns of the model of the queryset and leaves
+    the others, like fields of related models (field__subfield), to the icontains lookups.
+    Searches for exact matches don't use the backend.
+    '''
+    def __init__(self, advreport):
+        self.advreport = advreport
+
+    def get_fields(self, queryset):
+        '''
+        Returns a list of (search_field, column, weight) tuples of the search fields this backend
+        handles for the given queryset.
+        '''
+        return []
+
+    def get_candidate_fields(self, queryset):
+        fields = []
+        if not isinstance(queryset, QuerySet):
+            return fields
+        local_fields = dict((f.name, f) for f in queryset.model._meta.fields)
+        weights = self.advreport.search_weights
+        for search_field, is_model_field in self.advreport.get_schema().search_plan:
+            if is_model_field and search_field in local_fields:
+                weight = weights.get(search_field, 'D')
+                if weight not in WEIGHTS:
+                    weight = 'D'
+                fields.append((search_field, local_fields[search_field].column, weight))
+        return fields
+
+    def get_query(self, queryset, term):
+        '''
+        Returns a Q object matching the items of which the fields of this backend contain the
+        given search term, or None when there is nothing to look up.
+        '''
+        return None
+
+    def rank(self, queryset, q):
+        '''
+        Orders the queryset by relevance for the search query q.
+        '''
+        return queryset
+
+    def install(self, using=None):
+        '''
+        Creates the database objects the backend needs, like indexes. Run it with
+        manage.py install_report_search <slug>
+        '''
+        pass
+
+    def get_model_queryset(self, using=None):
+        return self.advreport.models[0]._default_manager.db_manager(using).all()
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    '''
+    Searches the fields with a tsvector of their concatenated values. Each word of a search term
+    matches the words that start with it. install creates a GIN index on the tsvector.
+    '''
+    config = 'simple'
+    '''
+    The text search configuration, for example 'english'.
+    '''
+
+    def get_fields(self, queryset):
+        return self.get_candidate_fields(queryset)
+
+    def get_document(self, queryset, fields, qualify=True):
+        qn = connections[queryset.db].ops.quote_name
+        if not CONFIG_RE.match(self.config):
+            raise ValueError(u'Invalid text search configuration "%s".' % self.config)
+        table = qn(queryset.model._meta.db_table)
+        parts = []
+        for search_field, column, weight in fields:
+            column = '%s.%s' % (table, qn(column)) if qualify else qn(column)
+            parts.append("setweight(to_tsvector('%s'::regconfig, coalesce(%s::text, '')), '%s')"
+                         % (self.config, column, weight))
+        return ' || '.join(parts)
+
+    def get_tsquery(self, q):
+        words = WORD_RE.findall(q.lower())
+        if not words:
+            return None
+        return ' & '.join('%s:*' % word for word in words)
+
+    def get_query(self, queryset, term):
+        fields = self.get_fields(queryset)
+        tsquery = self.get_tsquery(term)
+        if not fields or tsquery is None:
+            return None
+        # The columns are not qualified, so they refer to the table of the subquery.
+        where = "(%s) @@ to_tsquery('%s'::regconfig, %%s)" % (self.get_document(queryset, fields, qualify=False),
+                                                              self.config)
+        matches = queryset.model._default_manager.using(queryset.db).extra(where=[where], params=[tsquery])
+        return Q(pk__in=matches.values('pk'))
+
+    def rank(self, queryset, q):
+        fields = self.get_fields(queryset)
+        tsquery = self.get_tsquery(q)
+        if not fields or tsquery is None:
+            return queryset
+        select = "ts_rank(%s, to_tsquery('%s'::regconfig, %%s))" % (self.get_document(queryset, fields), self.config)
+        return queryset.extra(select={'search_rank': select}, select_params=[tsquery],
+                              order_by=['-search_rank'])
+
+    def install(self, using=None):
+        queryset = self.get_model_queryset(using)
+        fields = self.get_fields(queryset)
+        if not fields:
+            return
+        connection = connections[queryset.db]
+        qn = connection.ops.quote_name
+        index_name = 'advreport_%s_search' % self.advreport.slug
+        cursor = connection.cursor()
+        cursor.execute('SELECT 1 FROM pg_indexes WHERE indexname = %s', [index_name])
+        if cursor.fetchone() is None:
+            cursor.execute('CREATE INDEX %s ON %s USING gin ((%s))'
+                           % (qn(index_name), qn(queryset.model._meta.db_table),
+                              self.get_document(queryset, fields, qualify=False)))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    '''
+    Searches the fields with an FTS5 table that uses the table of the model as external content.
+    install creates the FTS5 table, fills it and creates the triggers that keep it up to date.
+    Until then, the fields are searched with icontains lookups. The model needs an integer
+    primary key. Whether the table exists is looked up once, so restart your processes after
+    installing it.
+    '''
+    bm25_weights = {'A': 1.0, 'B': 0.4, 'C': 0.2, 'D': 0.1}
+
+    def get_table_name(self):
+        return 'advreport_%s_fts' % self.advreport.slug
+
+    def get_fields(self, queryset):
+        fields = self.get_candidate_fields(queryset)
+        if not fields or not isinstance(queryset.model._meta.pk, (AutoField, IntegerField)):
+            return []
+        if not self.is_installed(queryset.db):
+            return []
+        return fields
+
+    def is_installed(self, using):
+        key = (using, self.get_table_name())
+        if key not in _installed_tables:
+            cursor = connections[using].cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.get_table_name()])
+            _installed_tables[key] = cursor.fetchone() is not None
+        return _installed_tables[key]
+
+    def get_match(self, q):
+        words = WORD_RE.findall(q.lower())
+        if not words:
+            return None
+        return ' '.join('"%s"*' % word for word in words)
+
+    def get_query(self, queryset, term):
+        match = self.get_match(term)
+        if not self.get_fields(queryset) or match is None:
+            return None
+        qn = connections[queryset.db].ops.quote_name
+        opts = queryset.model._meta
+        # The primary key is not qualified, so it refers to the table of the subquery.
+        where = '%s IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (
+            qn(opts.pk.column), qn(self.get_table_name()), qn(self.get_table_name()))
+        matches = queryset.model._default_manager.using(queryset.db).extra(where=[where], params=[match])
+        return Q(pk__in=matches.values('pk'))
+
+    def rank(self, queryset, q):
+        fields = self.get_fields(queryset)
+        match = self.get_match(q)
+        if not fields or match is None:
+            return queryset
+        qn = connections[queryset.db].ops.quote_name
+        opts = queryset.model._meta
+        table = qn(self.get_table_name())
+        weights = ', '.join(repr(self.bm25_weights[weight]) for search_field, column, weight in fields)
+        # bm25 scores are negative, the best matches come first.
+        select = '(SELECT bm25(%s, %s) FROM %s WHERE %s MATCH %%s AND rowid = %s.%s)' % (
+            table, weights, table, table, qn(opts.db_table), qn(opts.pk.column))
+        return queryset.extra(select={'search_rank': select}, select_params=[match],
+                              order_by=['search_rank'])
+
+    def install(self, using=None):
+        queryset = self.get_model_queryset(using)
+        fields = self.get_candidate_fields(queryset)
+        if not fields or not isinstance(queryset.model._meta.pk, (AutoField, IntegerField)):
+            return
+        qn = connections[queryset.db].ops.quote_name
+        opts = queryset.model._meta
+        table = qn(self.get_table_name())
+        columns = [qn(column) for search_field, column, weight in fields]
+        values = lambda prefix: ', '.join('%s.%s' % (prefix, column) for column in columns)
+        statements = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content=%s, content_rowid=%s)"
+                % (table, ', '.join(columns), qn(opts.db_table), qn(opts.pk.column)),
+            "CREATE TRIGGER IF NOT EXISTS %s AFTER INSERT ON %s BEGIN "
+                "INSERT INTO %s(rowid, %s) VALUES (new.%s, %s); END"
+                % (qn(self.get_table_name() + '_ai'), qn(opts.db_table),
+                   table, ', '.join(columns), qn(opts.pk.column), values('new')),
+            "CREATE TRIGGER IF NOT EXISTS %s AFTER DELETE ON %s BEGIN "
+                "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.%s, %s); END"
+                % (qn(self.get_table_name() + '_ad'), qn(opts.db_table),
+                   table, table, ', '.join(columns), qn(opts.pk.column), values('old')),
+            "CREATE TRIGGER IF NOT EXISTS %s AFTER UPDATE ON %s BEGIN "
+                "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.%s, %s); "
+                "INSERT INTO %s(rowid, %s) VALUES (new.%s, %s); END"
+                % (qn(self.get_table_name() + '_au'), qn(opts.db_table),
+                   table, table, ', '.join(columns), qn(opts.pk.column), values('old'),
+                   table, ', '.join(columns), qn(opts.pk.column), values('new')),
+            "INSERT INTO %s(%s) VALUES ('rebuild')" % (table, table),
+        ]
+        cursor = connections[queryset.db].cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        _installed_tables[(queryset.db, self.get_table_name())] = True
+
+_installed_tables = {}
+'''
+Maps (database alias, table name) to whether the FTS5 table exists, so it is only looked up once
+per process.
+'''
+
+
+class FullTextSearchBackend(SearchBackend):
+    '''
+    Uses the full-text search backend of the database of the queryset: PostgreSQLSearchBackend
+    or SQLiteSearchBackend. Other databases are searched with icontains lookups.
+    '''
+    backends = {
+        'postgresql': PostgreSQLSearchBackend,
+        'sqlite': SQLiteSearchBackend,
+    }
+
+    def get_backend(self, using):
+        backend_class = self.backends.get(connections[using].vendor, SearchBackend)
+        return backend_class(self.advreport)
+
+    def get_fields(self, queryset):
+        if not isinstance(queryset, QuerySet):
+            return []
+        return self.get_backend(queryset.db).get_fields(queryset)
+
+    def get_query(self, queryset, term):
+        return self.get_backend(queryset.db).get_query(queryset, term)
+
+    def rank(self, queryset, q):
+        return self.get_backend(queryset.db).rank(queryset, q)
+
+    def install(self, using=None):
+        self.get_backend(self.get_model_queryset(using).db).install(using)
+
+
+def get_search_backend_class(path):
+    '''
+    Imports a search backend class from a dotted path.
+    '''
+    module_name, class_name = path.rsplit('.', 1)
+    return getattr(import_module(module_name), class_name)
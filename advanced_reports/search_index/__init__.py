@@ -0,0 +1,195 @@
+import logging
+import re
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_save, post_delete
+
+from advanced_reports.search_index.models import SearchIndexEntry, SearchIndexToken
+
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+MAX_TOKEN_LENGTH = 100
+
+STALE_FIELD_NAME = u'__stale__'
+'''
+The field name of the entry that marks an index as stale. It is removed when the index is rebuilt.
+'''
+
+
+def tokenize(text):
+    '''
+    Splits normalized text into words. Words that are too long to be stored are truncated.
+    '''
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(text)]
+
+def _chunks(l, size):
+    l = list(l)
+    for i in range(0, len(l), size):
+        yield l[i:i + size]
+
+def _create(model, objects):
+    if hasattr(model.objects, 'bulk_create'):
+        model.objects.bulk_create(objects)
+    else:
+        for o in objects:
+            o.save()
+
+
+class SearchIndex(object):
+    '''
+    An inverted index of the search fields of a report that are not model fields.
+
+    Searching such a field used to render get_item_html for every item of the report. The index
+    stores the normalized text of these fields per item, along with the words in it. A search
+    looks up the items that contain all words of the query, and then checks the stored text of
+    those items only.
+    '''
+    chunk_size = 500
+
+    def __init__(self, advreport):
+        self.advreport = advreport
+        self.report = advreport.slug
+        self.field_names = [search_field for search_field, is_model_field in advreport.get_schema().search_plan
+                            if not is_model_field]
+
+    def remove(self, item_ids=None):
+        '''
+        Removes the items with the given ids from the index, or all items when item_ids is None.
+        '''
+        for model in (SearchIndexEntry, SearchIndexToken):
+            queryset = model.objects.filter(report=self.report)
+            if item_ids is None:
+                queryset.delete()
+            else:
+                for chunk in _chunks(item_ids, self.chunk_size):
+                    queryset.filter(item_id__in=chunk).delete()
+
+    def index_items(self, items):
+        self.advreport.enrich_list(items)
+
+        entries = []
+        tokens = []
+        for item in items:
+            item_id = unicode(item.pk)
+            for field_name in self.field_names:
+                text = self.advreport.get_search_text(field_name, item)
+                entries.append(SearchIndexEntry(report=self.report, field_name=field_name,
+                                                item_id=item_id, text=text))
+                for token in set(tokenize(text)):
+                    tokens.append(SearchIndexToken(report=self.report, field_name=field_name,
+                                                   item_id=item_id, token=token))
+        _create(SearchIndexEntry, entries)
+        _create(SearchIndexToken, tokens)
+
+    def mark_stale(self):
+        '''
+        Records that the whole index must be rebuilt, see is_stale.
+        '''
+        SearchIndexEntry.objects.create(report=self.report, field_name=STALE_FIELD_NAME, item_id=u'', text=u'')
+
+    def is_stale(self):
+        '''
+        Returns whether a change was made that requires to rebuild the whole index, with
+        manage.py rebuild_report_index. The index is not rebuilt while handling such a change.
+        '''
+        return SearchIndexEntry.objects.filter(report=self.report, field_name=STALE_FIELD_NAME).exists()
+
+    def update(self, item_ids=None):
+        '''
+        Indexes the items with the given ids again, or rebuilds the whole index when item_ids is None.
+        Items that no longer exist are removed from the index.
+        '''
+        self.remove(item_ids)
+
+        queryset = self.advreport._queryset(request=None)
+        if item_ids is None:
+            for chunk in self.advreport.get_enriched_items(queryset).iter_chunks(self.chunk_size, enrich_objects=False):
+                self.index_items(chunk)
+        else:
+            for chunk in _chunks(item_ids, self.chunk_size):
+                self.index_items(list(queryset.filter(pk__in=chunk)))
+
+    def find_candidates(self, q, exact=False):
+        '''
+        Returns the ids of the items that contain every word of q, or None when q has no words
+        to look up. The last word of q may be the start of a word, the first word may be the end
+        of one and a single word may be any part of a word.
+        '''
+        candidates = None
+        tokens = tokenize(q)
+        for position, token in enumerate(tokens):
+            if len(token) >= MAX_TOKEN_LENGTH:
+                continue
+            if exact or 0 < position < len(tokens) - 1:
+                lookup = {'token': token}
+            elif len(tokens) == 1:
+                lookup = {'token__contains': token}
+            elif position == 0:
+                lookup = {'token__endswith': token}
+            else:
+                lookup = {'token__startswith': token}
+
+            item_ids = set(SearchIndexToken.objects.filter(report=self.report, field_name__in=self.field_names,
+                                                           **lookup).values_list('item_id', flat=True))
+            candidates = item_ids if candidates is None else candidates & item_ids
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, q, exact=False):
+        '''
+        Returns the primary keys of the items of which one of the indexed fields contains q,
+        or equals q when exact is True. q must be normalized like AdvancedReport.get_search_text.
+        '''
+        entries = SearchIndexEntry.objects.filter(report=self.report, field_name__in=self.field_names)
+        if exact:
+            entries = entries.filter(text=q)
+        else:
+            entries = entries.filter(text__contains=q)
+
+        candidates = self.find_candidates(q, exact)
+        if candidates is None:
+            found = set(entries.values_list('item_id', flat=True))
+        else:
+            found = set()
+            for chunk in _chunks(candidates, self.chunk_size):
+                found.update(entries.filter(item_id__in=chunk).values_list('item_id', flat=True))
+
+        to_python = self.advreport.models[0]._meta.pk.to_python
+        return [to_python(item_id) for item_id in found]
+
+
+def connect_signals(advreport):
+    '''
+    Keeps the search index of the given report class up to date when instances of its models
+    are saved or deleted. When get_affected_item_ids returns None, the whole index would have to
+    be rebuilt. That is too expensive to do while saving, so the index is marked as stale instead.
+    '''
+    if 'advanced_reports.search_index' not in settings.INSTALLED_APPS:
+        raise ImproperlyConfigured('The report "%s" uses a search index. Add "advanced_reports.search_index" '
+                                   'to INSTALLED_APPS and run syncdb.' % advreport.slug)
+    slug = advreport.slug
+
+    def update_search_index(sender, instance, **kwargs):
+        if kwargs.get('raw', False):
+            return
+        from advanced_reports import get_report_for_slug
+        advreport = get_report_for_slug(slug)
+        index = advreport.get_search_index()
+        item_ids = advreport.get_affected_item_ids(instance)
+        if item_ids is None:
+            if not index.is_stale():
+                logger.warning('The search index of report %s is stale after a change to %s, '
+                               'run manage.py rebuild_report_index %s', slug, sender._meta, slug)
+                index.mark_stale()
+        elif item_ids:
+            index.update(item_ids)
+
+    for model in advreport.models or ():
+        dispatch_uid = 'advanced_reports_search_index_%s_%s' % (slug, model._meta)
+        post_save.connect(update_search_index, sender=model, weak=False, dispatch_uid=dispatch_uid)
+        post_delete.connect(update_search_index, sender=model, weak=False, dispatch_uid=dispatch_uid)
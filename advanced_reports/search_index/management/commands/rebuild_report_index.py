@@ -0,0 +1,31 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from advanced_reports import REGISTRY, get_report_for_slug
+
+
+class Command(BaseCommand):
+    args = '[slug slug ...]'
+    help = 'Rebuilds the search index of the given reports, or of all reports that use a search index.'
+    option_list = BaseCommand.option_list + (
+        make_option('--stale', action='store_true', dest='stale', default=False,
+                    help='Only rebuild the indexes that are marked as stale.'),
+    )
+
+    def handle(self, *slugs, **options):
+        if not slugs:
+            slugs = sorted(slug for slug in REGISTRY if get_report_for_slug(slug).search_index)
+
+        for slug in slugs:
+            advreport = get_report_for_slug(slug)
+            if advreport is None:
+                raise CommandError('No AdvancedReport with slug "%s".' % slug)
+            if not advreport.search_index:
+                raise CommandError('The report "%s" does not use a search index.' % slug)
+            if options.get('stale') and not advreport.get_search_index().is_stale():
+                continue
+
+            transaction.commit_on_success(advreport.get_search_index().update)()
+            self.stdout.write('Rebuilt the search index of %s.\n' % slug)
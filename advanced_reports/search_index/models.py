@@ -0,0 +1,34 @@
+from django.db import models
+
+
+class SearchIndexEntry(models.Model):
+    '''
+    The normalized text of a search field that is not a model field, for one item of a report.
+    '''
+    report = models.CharField(max_length=100, db_index=True)
+    field_name = models.CharField(max_length=100)
+    item_id = models.CharField(max_length=64, db_index=True)
+    text = models.TextField()
+
+    class Meta:
+        db_table = 'advanced_reports_searchindexentry'
+
+    def __unicode__(self):
+        return u'%s %s %s' % (self.report, self.item_id, self.field_name)
+
+
+class SearchIndexToken(models.Model):
+    '''
+    A word of the text of a SearchIndexEntry. Searches look up tokens first and only check
+    the text of the entries that contain all words of the search query.
+    '''
+    report = models.CharField(max_length=100)
+    field_name = models.CharField(max_length=100)
+    item_id = models.CharField(max_length=64, db_index=True)
+    token = models.CharField(max_length=100, db_index=True)
+
+    class Meta:
+        db_table = 'advanced_reports_searchindextoken'
+
+    def __unicode__(self):
+        return self.token
@@ -0,0 +1,8 @@
+from django.dispatch import Signal
+
+
+report_timed = Signal(providing_args=['advreport', 'request', 'timeline'])
+'''
+Sent after an instrumented view of a report ran, with its advanced_reports.instrumentation.Timeline.
+The sender is the class of the report. See ADVANCED_REPORTS_INSTRUMENTATION.
+'''
@@ -131,6 +131,51 @@ $(function(){
                 });
             },
 
+            handle_lazy_forms: function(container) {
+                var instance = this;
+                var lazy_forms = container.find('.lazy-form');
+                if (lazy_forms.length == 0)
+                    return;
+
+                var ids = [], methods = [];
+                lazy_forms.each(function(){
+                    var lazy_form = $(this);
+                    lazy_form.removeClass('lazy-form').addClass('lazy-form-loading');
+                    lazy_form.html('<img class="loader" src="' + JS_STATIC_URL + 'advanced_reports/img/modybox/loading.gif" alt=""/>');
+                    lazy_form.find('.loader').show();
+                    if ($.inArray(lazy_form.attr('data-object-id'), ids) == -1)
+                        ids.push(lazy_form.attr('data-object-id'));
+                    if ($.inArray(lazy_form.attr('data-method'), methods) == -1)
+                        methods.push(lazy_form.attr('data-method'));
+                });
+
+                $.ajax({
+                    'type': 'GET',
+                    'url': this.adv_url + 'forms/',
+                    'data': {'ids': ids.join(','), 'methods': methods.join(',')},
+                    'dataType': 'json',
+                    'success': function(forms) {
+                        lazy_forms.each(function(){
+                            var lazy_form = $(this);
+                            var html = (forms[lazy_form.attr('data-object-id')] || {})[lazy_form.attr('data-method')];
+                            if (html === undefined) {
+                                lazy_form.remove();
+                                return;
+                            }
+                            var form = $('<div/>').html(html).children();
+                            var action_row = lazy_form.closest('.action-row');
+                            lazy_form.replaceWith(form);
+                            form.filter('.collapse-form').addClass('inline').removeClass('limit-width');
+                            instance.connect_form(form.filter('.action-form'), action_row, action_row.prev());
+                        });
+                    },
+                    'error': function(x) {
+                        lazy_forms.find('.loader').hide();
+                        lazy_forms.text('error');
+                    }
+                });
+            },
+
             connect_row: function(action_row, initialHide, noLazy) {
                 var data_row        = action_row.prev();
                 var show_options    = data_row.find('.show-options');
@@ -172,6 +217,7 @@ $(function(){
 
                     if (!noLazy)
                         instance.handle_lazy(action_row);
+                    instance.handle_lazy_forms(action_row);
                 }
 
                 function collapse_row()
@@ -331,6 +377,7 @@ $(function(){
                             next_action_row.find('input:text').eq(0).focus();
                         }, 100);
                         instance.handle_lazy(next_action_row);
+                        instance.handle_lazy_forms(next_action_row);
                         new_action_row.hide();
                         new_data_row.find('.show-options').show();
                         new_data_row.find('.hide-options').hide();
@@ -1,9 +1,7 @@
 from django import template
+from django.conf import settings
 from django.template.context import RequestContext
-from django.template.loader import render_to_string
-
-from advanced_reports.views import list as advreport_list
-from advanced_reports import get_report_or_404
+from django.template.loader import get_template, render_to_string
 
 register = template.Library()
              
@@ -41,6 +39,7 @@ class AdvReportNode(template.Node):
                 ids = [o.pk for o in obj_list]
             else:
                 ids = [obj_list.id,]
+            from advanced_reports.views import list as advreport_list
             return advreport_list(request, slug, ids, internal_mode, report_header_visible)
         except Exception, e:
              return e
@@ -67,4 +66,44 @@ class AdvReportCSSNode(template.Node):
 
     def render(self, context):
         request = self.request.resolve(context)
-        return render_to_string('advanced_reports/inc_css.html', {}, context_instance=RequestContext(request))
\ No newline at end of file
+        return render_to_string('advanced_reports/inc_css.html', {}, context_instance=RequestContext(request))
+
+@register.tag(name='advreport_row')
+def advreport_row(parser, token):
+    try:
+        tag_name, template_name = token.split_contents()
+    except ValueError:
+        raise template.TemplateSyntaxError, "%s tag requires exactly 1 argument" % token.contents.split()[0]
+    return AdvReportRowNode(template_name[1:-1])
+
+class AdvReportRowNode(template.Node):
+    '''
+    Renders the row of the current object of a report with the given template, like an include.
+    Rows are taken from the row cache of the report, when it has one. The template is loaded when
+    the first row is rendered, so a missing template doesn't break loading the enclosing template.
+    Like include, a template that can't be loaded renders nothing, unless TEMPLATE_DEBUG is True.
+    '''
+    def __init__(self, template_name):
+        self.template_name = template_name
+        self.template = None
+        self.advreport = template.Variable('advreport')
+        self.object = template.Variable('object')
+
+    def get_template(self):
+        if self.template is None:
+            try:
+                self.template = get_template(self.template_name)
+            except Exception:
+                if settings.TEMPLATE_DEBUG:
+                    raise
+                self.template = False
+        return self.template
+
+    def render(self, context):
+        row_template = self.get_template()
+        if not row_template:
+            return ''
+        advreport = self.advreport.resolve(context)
+        if not advreport.row_cache:
+            return row_template.render(context)
+        return advreport.get_row_cache().render(self.object.resolve(context), row_template, context)
@@ -0,0 +1,21 @@
+'''
+The tests of advanced_reports. They use the synthetic models and report of
+advanced_reports.benchmarks, run them with runtests.py.
+'''
+from advanced_reports.tests.actions import *
+from advanced_reports.tests.api import *
+from advanced_reports.tests.benchmarks import *
+from advanced_reports.tests.budget import *
+from advanced_reports.tests.columns import *
+from advanced_reports.tests.conditional import *
+from advanced_reports.tests.context import *
+from advanced_reports.tests.count import *
+from advanced_reports.tests.export import *
+from advanced_reports.tests.instrumentation import *
+from advanced_reports.tests.jobs import *
+from advanced_reports.tests.pagination import *
+from advanced_reports.tests.registry import *
+from advanced_reports.tests.schema import *
+from advanced_reports.tests.search import *
+from advanced_reports.tests.search_index import *
+from advanced_reports.tests.templatetags import *
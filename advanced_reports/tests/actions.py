@@ -0,0 +1,349 @@
+from django import forms
+from django.http import Http404
+from django.utils import simplejson
+
+from advanced_reports.benchmarks.models import BenchmarkOrder
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.defaults import action
+from advanced_reports.tests.base import ReportTestCase
+
+
+class ActionQueryCountTest(ReportTestCase):
+    '''
+    Pins the number of queries of an action click: fetching the item, enriching it, the action
+    itself and the refresh of the row.
+    '''
+    def test_ajax(self):
+        order = self.orders[0]
+        # Fetch, enrich_item, the save of the action (2), reload, enrich_item.
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url('advanced_reports_ajax', method='pay', object_id=order.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BenchmarkOrder.objects.get(pk=order.pk).status, 'paid')
+
+    def test_ajax_form_post(self):
+        order = self.orders[0]
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url('advanced_reports_form', method='note', object_id=order.pk),
+                                        {'%s-note' % order.pk: u'Call back'})
+        self.assertEqual(simplejson.loads(response.content)['status'], 'SUCCESS')
+        self.assertEqual(BenchmarkOrder.objects.get(pk=order.pk).notes, u'Call back')
+
+    def test_ajax_form_post_invalid(self):
+        order = self.orders[0]
+        # The invalid form is shown again without refreshing the item.
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url('advanced_reports_form', method='note', object_id=order.pk),
+                                        {'%s-note' % order.pk: u''})
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_action(self):
+        order = self.orders[0]
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url('advanced_reports_api_action', method='pay', object_id=order.pk))
+        self.assertEqual(simplejson.loads(response.content)['item']['item_id'], unicode(order.pk))
+
+
+class TagForm(forms.Form):
+    tags = forms.MultipleChoiceField(choices=(('urgent', 'Urgent'), ('gift', 'Gift'), ('fragile', 'Fragile')))
+
+
+class TaggedOrderReport(BenchmarkOrderReport):
+    slug = 'tagged_orders'
+    item_actions = BenchmarkOrderReport.item_actions + (
+        action(method='tag', verbose_name='Tag', form=TagForm),
+        action(method='cancel', verbose_name='Cancel'),
+    )
+
+    def tag(self, item, form):
+        item.notes = u','.join(form.cleaned_data['tags'])
+        item.save()
+
+    def cancel(self, item):
+        raise RuntimeError('cancelling is broken')
+
+
+class ApiActionsTest(ReportTestCase):
+    report_class = TaggedOrderReport
+
+    def post(self, entries):
+        response = self.client.post(self.url('advanced_reports_api_actions'), simplejson.dumps(entries),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return simplejson.loads(response.content)
+
+    def test_list_values(self):
+        order = self.orders[0]
+        result = self.post([{'item_id': unicode(order.pk), 'method': 'tag', 'data': {'tags': ['urgent', 'fragile']}}])
+        self.assertTrue('success' in result['results'][0])
+        self.assertEqual(BenchmarkOrder.objects.get(pk=order.pk).notes, u'urgent,fragile')
+
+    def test_missing_item(self):
+        result = self.post([{'item_id': u'9999', 'method': 'pay'},
+                            {'item_id': unicode(self.orders[0].pk), 'method': 'pay'}])
+        self.assertEqual(result['results'][0]['item_id'], u'9999')
+        self.assertTrue('error' in result['results'][0])
+        self.assertTrue('success' in result['results'][1])
+        self.assertEqual([item['item_id'] for item in result['items']], [unicode(self.orders[0].pk)])
+        self.assertEqual(BenchmarkOrder.objects.get(pk=self.orders[0].pk).status, 'paid')
+
+    def test_unexpected_error(self):
+        result = self.post([{'item_id': unicode(self.orders[0].pk), 'method': 'pay'},
+                            {'item_id': unicode(self.orders[1].pk), 'method': 'cancel'},
+                            {'item_id': unicode(self.orders[2].pk), 'method': 'pay'}])
+        self.assertEqual([sorted(r.keys()) for r in result['results']],
+                         [['item_id', 'method', 'success'], ['error', 'item_id', 'method'], ['item_id', 'method', 'success']])
+        self.assertEqual(len(result['items']), 2)
+
+
+class FailingOrderReport(BenchmarkOrderReport):
+    '''
+    Pays its orders one by one, but can't pay the second order.
+    '''
+    slug = 'failing_orders'
+    multiple_action_workers = 1
+
+    def pay(self, item):
+        if item.reference == u'R00001':
+            raise RuntimeError('payment provider unavailable')
+        super(FailingOrderReport, self).pay(item)
+
+
+class MultipleActionsTest(ReportTestCase):
+    report_class = FailingOrderReport
+
+    def test_mixed_success_and_failure(self):
+        ids = [unicode(order.pk) for order in self.orders]
+        response, summary = self.advreport.handle_multiple_actions('pay', ids)
+        self.assertEqual(response, None)
+        self.assertEqual(summary.succeeded, [ids[0], ids[2]])
+        self.assertEqual([item_id for item_id, error in summary.failed], [ids[1]])
+        self.assertEqual(list(BenchmarkOrder.objects.order_by('reference').values_list('status', flat=True)),
+                         [u'paid', u'new', u'paid'])
+
+
+class CopyingOrderReport(BenchmarkOrderReport):
+    '''
+    Copies the rendered total of an order into its notes.
+    '''
+    slug = 'copying_orders'
+    enrich_items_for_actions = True
+    item_actions = (action(method='copy', verbose_name='Copy'),)
+
+    def copy(self, item):
+        item.notes = dict(zip(self.fields, item.advreport_column_values))['total']['html']
+        item.save()
+
+
+class EnrichedActionTest(ReportTestCase):
+    report_class = CopyingOrderReport
+
+    def test_action_reads_column_values(self):
+        order = self.orders[0]
+        response = self.client.post(self.url('advanced_reports_ajax', method='copy', object_id=order.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(BenchmarkOrder.objects.get(pk=order.pk).notes, u'<strong>10.00</strong>')
+
+    def test_prepared_items_are_not_rendered(self):
+        self.advreport.enrich_items_for_actions = False
+        order = self.orders[0]
+        self.advreport.prepare_item(order)
+        self.assertFalse(hasattr(order, 'advreport_column_values'))
+        self.assertEqual(order.advreport_object_id, unicode(order.pk))
+
+
+class CountingForm(forms.Form):
+    instances = []
+    note = forms.CharField()
+
+    def __init__(self, *args, **kwargs):
+        super(CountingForm, self).__init__(*args, **kwargs)
+        self.instances.append(self)
+
+
+class LazyFormOrderReport(BenchmarkOrderReport):
+    slug = 'lazy_form_orders'
+    lazy_action_forms = True
+    item_actions = BenchmarkOrderReport.item_actions + (
+        action(method='refund', verbose_name='Refund', form=CountingForm, group='paid'),
+    )
+
+
+class LazyActionFormsTest(ReportTestCase):
+    report_class = LazyFormOrderReport
+
+    def setUp(self):
+        super(LazyActionFormsTest, self).setUp()
+        self.orders[1].status = 'paid'
+        self.orders[1].save()
+        del CountingForm.instances[:]
+
+    def forms(self, ids, methods=None):
+        params = {'ids': u','.join(unicode(order.pk) for order in ids)}
+        if methods is not None:
+            params['methods'] = methods
+        response = self.client.get(self.url('advanced_reports_forms'), params)
+        return simplejson.loads(response.content)
+
+    def test_list_does_not_render_forms(self):
+        self.client.get(self.url('advanced_reports_list'))
+        # The header checks the forms of the multiple actions once, the rows don't instantiate any.
+        header_forms = len(CountingForm.instances)
+        for i in range(3, 6):
+            self.create_order(i, status='paid')
+        del CountingForm.instances[:]
+        response = self.client.get(self.url('advanced_reports_list'))
+        self.assertEqual(len(CountingForm.instances), header_forms)
+        self.assertFalse([form for form in CountingForm.instances if form.prefix])
+        self.assertTrue('class="lazy-form" data-method="refund"' in response.content)
+        self.assertFalse('name="%s-note"' % self.orders[0].pk in response.content)
+
+    def test_api_list_has_form_urls(self):
+        response = self.client.get(self.url('advanced_reports_api_list'))
+        items = simplejson.loads(response.content)['items']
+        actions = dict((a['method'], a) for a in items[1]['actions'])
+        self.assertEqual(actions['refund']['form'], None)
+        self.assertEqual(actions['refund']['form_url'],
+                         self.url('advanced_reports_form', method='refund', object_id=self.orders[1].pk))
+        self.assertFalse('form_url' in actions['ship'])
+
+    def test_forms_of_several_items(self):
+        first, paid = unicode(self.orders[0].pk), unicode(self.orders[1].pk)
+        forms = self.forms([self.orders[0], self.orders[1]])
+        # Forms of actions of which the group doesn't match are left out.
+        self.assertEqual(sorted(forms[first].keys()), ['note'])
+        self.assertEqual(sorted(forms[paid].keys()), ['note', 'refund'])
+        self.assertTrue('name="%s-note"' % paid in forms[paid]['refund'])
+        self.assertEqual(len(CountingForm.instances), 1)
+
+    def test_forms_of_some_methods(self):
+        forms = self.forms([self.orders[1]], methods='refund')
+        self.assertEqual(forms.keys(), [unicode(self.orders[1].pk)])
+        self.assertEqual(forms[unicode(self.orders[1].pk)].keys(), ['refund'])
+
+    def test_no_items(self):
+        self.assertEqual(self.forms([]), {})
+
+    def test_invalid_post_is_rendered_inline(self):
+        order = self.orders[1]
+        response = self.client.post(self.url('advanced_reports_form', method='refund', object_id=order.pk),
+                                    {'%s-note' % order.pk: u''})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('errorlist' in response.content)
+        self.assertFalse('class="lazy-form" data-method="refund"' in response.content)
+
+
+class GroupCountingOrderReport(BenchmarkOrderReport):
+    slug = 'group_counting_orders'
+
+    def __init__(self):
+        super(GroupCountingOrderReport, self).__init__()
+        self.verified = []
+
+    def verify_action_groups(self, items, groups):
+        self.verified.append(sorted(self.get_item_id(item) for item in items))
+        return super(GroupCountingOrderReport, self).verify_action_groups(items, groups)
+
+    def pay_multiple(self, items):
+        for item in items:
+            self.pay(item)
+
+
+class ActionGroupsTest(ReportTestCase):
+    report_class = GroupCountingOrderReport
+
+    def ids(self, orders):
+        return sorted(unicode(order.pk) for order in orders)
+
+    def test_list_verifies_the_page_once(self):
+        response = self.client.get(self.url('advanced_reports_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.advreport.verified, [self.ids(self.orders)])
+
+    def test_remembered_per_context(self):
+        order = self.orders[0]
+        with self.advreport.context():
+            self.assertTrue(self.advreport.has_action_group(order, 'new'))
+            self.assertFalse(self.advreport.has_action_group(order, 'paid'))
+            self.assertTrue(self.advreport.has_action_group(order, None))
+            self.advreport.prefetch_action_groups(self.orders)
+            self.assertEqual(self.advreport.verified, [self.ids([order]), self.ids(self.orders[1:])])
+        with self.advreport.context():
+            self.advreport.has_action_group(order, 'new')
+        self.assertEqual(len(self.advreport.verified), 3)
+
+    def test_action_forgets_the_groups(self):
+        order = self.orders[0]
+        # The refreshed row shows the actions of the new status.
+        response = self.client.post(self.url('advanced_reports_ajax', method='pay', object_id=order.pk))
+        self.assertTrue('>Ship<' in response.content)
+        self.assertFalse('>Pay<' in response.content)
+
+    def test_find_object_action(self):
+        with self.advreport.context():
+            self.assertEqual(self.advreport.find_object_action(self.orders[0], 'ship'), None)
+            self.assertEqual(self.advreport.find_object_action(self.orders[0], 'pay').method, 'pay')
+            self.assertEqual(self.advreport.find_object_action(self.orders[0], 'unknown'), None)
+
+    def test_multiple_actions(self):
+        self.orders[1].status = 'paid'
+        self.orders[1].save()
+        ids = [unicode(order.pk) for order in self.orders]
+        with self.advreport.context():
+            response, count = self.advreport.handle_multiple_actions('pay', ids)
+            self.assertEqual(count, 2)
+            self.assertEqual(self.advreport.verified, [sorted(ids)])
+            # The handler forgot the groups of the items it paid.
+            order = BenchmarkOrder.objects.get(pk=self.orders[0].pk)
+            self.assertTrue(self.advreport.has_action_group(order, 'paid'))
+            self.assertEqual(len(self.advreport.verified), 2)
+
+    def test_missing_items_have_no_groups(self):
+        self.advreport.verify_action_groups = lambda items, groups: {}
+        with self.advreport.context():
+            self.assertFalse(self.advreport.has_action_group(self.orders[0], None))
+
+
+class ItemsForIdsTest(ReportTestCase):
+    def test_order_of_the_ids(self):
+        ids = [self.orders[2].pk, unicode(self.orders[0].pk), self.orders[2].pk]
+        with self.assertNumQueries(1):
+            items = self.advreport.get_items_for_ids(ids)
+        self.assertEqual([item.pk for item in items], [self.orders[2].pk, self.orders[0].pk, self.orders[2].pk])
+
+    def test_chunks(self):
+        with self.assertNumQueries(2):
+            items = self.advreport.get_items_for_ids([order.pk for order in self.orders], chunk_size=2)
+        self.assertEqual(items, self.orders)
+
+    def test_no_ids(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.advreport.get_items_for_ids([]), [])
+
+    def test_missing_id(self):
+        try:
+            self.advreport.get_items_for_ids([self.orders[0].pk, 9999])
+        except Http404, e:
+            self.assertTrue(u'9999' in unicode(e))
+        else:
+            self.fail('Http404 not raised')
+
+    def test_overridden_get_item_for_id(self):
+        class ReferencedOrderReport(BenchmarkOrderReport):
+            def get_item_for_id(self, item_id):
+                return BenchmarkOrder.objects.get(reference=item_id)
+
+            def get_item_id(self, item):
+                return item.reference
+
+        items = ReferencedOrderReport().get_items_for_ids([u'R00001', u'R00000'])
+        self.assertEqual([item.reference for item in items], [u'R00001', u'R00000'])
+
+    def test_multiple_actions_enrich_once(self):
+        calls = []
+        enrich_list = self.advreport.enrich_list
+        self.advreport.enrich_list = lambda items: calls.append(len(items)) or enrich_list(items)
+        with self.advreport.context():
+            response, count = self.advreport.handle_multiple_actions('pay', [order.pk for order in self.orders])
+        self.assertEqual(count, 3)
+        self.assertEqual(calls, [3])
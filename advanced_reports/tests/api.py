@@ -0,0 +1,158 @@
+import zlib
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+
+import advanced_reports
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.tests.base import ReportTestCase
+
+
+class CachedOrderReport(BenchmarkOrderReport):
+    slug = 'cached_orders'
+    payload_cache = True
+
+
+class CompactApiTest(ReportTestCase):
+    report_class = CachedOrderReport
+
+    def get_compact(self, **params):
+        response = self.client.get(self.url('advanced_reports_api_list'), params)
+        return simplejson.loads(response.content)
+
+    def test_fields_with_relations(self):
+        report = self.get_compact(fields='reference,customer__name')
+        self.assertEqual([h['name'] for h in report['header']], [u'reference', u'customer'])
+        self.assertEqual(len(report['items'][0]['values']), 2)
+
+    def test_fields_with_cached_payloads(self):
+        # Fill the payload cache with complete rows first.
+        self.client.get(self.url('advanced_reports_api_list'))
+        report = self.get_compact(fields='reference')
+        self.assertEqual(set(len(item['values']) for item in report['items']), set([1]))
+
+    def test_actions_and_extra_are_left_out(self):
+        report = self.get_compact(compact='1')
+        self.assertEqual(sorted(report['items'][0].keys()), ['item_id', 'values'])
+        self.assertEqual(len(report['items'][0]['values']), len(self.advreport.fields))
+
+    def test_include(self):
+        report = self.get_compact(include='actions,unknown')
+        self.assertEqual(sorted(report['items'][0].keys()), ['actions', 'item_id', 'values'])
+        report = self.get_compact(include='extra,actions')
+        self.assertEqual(sorted(report['items'][0].keys()), ['actions', 'extra_information', 'item_id', 'values'])
+
+    def test_unknown_and_empty_fields(self):
+        report = self.get_compact(fields='unknown,reference')
+        self.assertEqual([h['name'] for h in report['header']], [u'reference'])
+        report = self.get_compact(fields='')
+        self.assertEqual(len(report['header']), len(self.advreport.fields))
+
+    def test_partial_items_are_not_cached(self):
+        cache.clear()
+        self.get_compact(include='actions')
+        self.client.get(self.url('advanced_reports_api_list'))
+        self.assertEqual(self.advreport.get_payload_cache().stats.hits, 0)
+
+    def test_gzip(self):
+        response = self.client.get(self.url('advanced_reports_api_list'), {'compact': '1'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue('Accept-Encoding' in response['Vary'])
+        content = zlib.decompress(response.content, zlib.MAX_WBITS | 16)
+        self.assertEqual(simplejson.loads(content), self.get_compact(compact='1'))
+        self.assertFalse('\n' in content)
+
+    def test_without_compact(self):
+        response = self.client.get(self.url('advanced_reports_api_list'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertTrue('\n  ' in response.content)
+        self.assertTrue('extra_information' in simplejson.loads(response.content)['items'][0])
+
+
+class GroupedOrderReport(CachedOrderReport):
+    '''
+    Finds the action groups of an item with an attribute that enrich_list attaches.
+    '''
+    slug = 'grouped_orders'
+
+    def enrich_list(self, items):
+        super(GroupedOrderReport, self).enrich_list(items)
+        for item in items:
+            item.group = item.status
+
+    def verify_action_group(self, item, group):
+        return group is None or item.group == group
+
+
+class PayloadCacheActionsTest(ReportTestCase):
+    report_class = GroupedOrderReport
+
+    def test_actions_of_cached_items(self):
+        url = self.url('advanced_reports_api_list')
+        first = simplejson.loads(self.client.get(url).content)
+        second = simplejson.loads(self.client.get(url).content)
+        self.assertEqual(self.advreport.get_payload_cache().stats.hits, len(self.orders))
+        self.assertEqual([item['actions'] for item in first['items']],
+                         [item['actions'] for item in second['items']])
+
+
+class PersonalOrderReport(CachedOrderReport):
+    '''
+    Shows the user in a column, so its payloads are cached per user.
+    '''
+    slug = 'personal_orders'
+
+    def get_total_html(self, item):
+        return u'%s for %s' % (item.amount * item.quantity, self.request.user.username)
+
+    def get_payload_cache_key_parts(self, request):
+        return (request.user.pk,)
+
+
+class PayloadCacheUsersTest(ReportTestCase):
+    report_class = PersonalOrderReport
+
+    def get_totals(self, username):
+        User.objects.create_user(username, '%s@example.com' % username, 'secret')
+        self.client.login(username=username, password='secret')
+        report = simplejson.loads(self.client.get(self.url('advanced_reports_api_list')).content)
+        index = list(self.advreport.fields).index('total')
+        return set(item['values'][index]['html'] for item in report['items'])
+
+    def test_payloads_per_user(self):
+        self.assertEqual(self.get_totals('alice'), set([u'10 for alice']))
+        self.assertEqual(self.get_totals('bob'), set([u'10 for bob']))
+        self.assertEqual(self.advreport.get_payload_cache().stats.hits, 0)
+
+
+class BrokenOrderReport(BenchmarkOrderReport):
+    slug = 'broken_orders'
+
+    def get_total_html(self, item):
+        raise RuntimeError('broken')
+
+
+class BatchTest(ReportTestCase):
+    def setUp(self):
+        super(BatchTest, self).setUp()
+        advanced_reports.register(BrokenOrderReport)
+
+    def batch(self, specs):
+        return self.client.post(reverse('advanced_reports_api_batch'), simplejson.dumps(specs),
+                                content_type='application/json')
+
+    def test_failing_specs(self):
+        response = self.batch([{'slug': self.advreport.slug, 'count': True},
+                               {'slug': 'broken_orders'},
+                               {'slug': 'orders/1'},
+                               {'slug': 'unknown'}])
+        self.assertEqual(response.status_code, 200)
+        results = simplejson.loads(response.content)
+        self.assertEqual([r['status'] for r in results], [200, 500, 400, 404])
+        self.assertEqual(results[0]['data'], len(self.orders))
+
+    def test_invalid_specs(self):
+        self.assertEqual(self.batch([{'slug': 1}]).status_code, 400)
+        self.assertEqual(self.batch([{'slug': self.advreport.slug, 'filters': []}]).status_code, 400)
@@ -0,0 +1,49 @@
+import datetime
+import decimal
+
+from django.test import TestCase, TransactionTestCase
+
+import advanced_reports
+from advanced_reports.benchmarks.models import BenchmarkCustomer, BenchmarkOrder
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+
+
+class ReportTestMixin(object):
+    '''
+    Registers a fresh instance of report_class and creates a few orders for it.
+    '''
+    report_class = BenchmarkOrderReport
+    urls = 'advanced_reports.benchmarks.urls'
+
+    def setUp(self):
+        self.advreport = self.report_class()
+        advanced_reports.register(self.advreport)
+        self.customer = BenchmarkCustomer.objects.create(name=u'Customer 1', city=u'Ghent', country=u'BE')
+        self.orders = [self.create_order(i) for i in range(3)]
+
+    def create_order(self, i, status='new', **kwargs):
+        values = {'customer': self.customer,
+                  'reference': u'R%05d' % i,
+                  'status': status,
+                  'amount': decimal.Decimal('10.00'),
+                  'quantity': 1,
+                  'email': u'customer@example.com',
+                  'created': datetime.datetime(2012, 1, 1) + datetime.timedelta(minutes=i)}
+        values.update(kwargs)
+        return BenchmarkOrder.objects.create(**values)
+
+    def url(self, view, **kwargs):
+        from django.core.urlresolvers import reverse
+        kwargs.setdefault('slug', self.advreport.slug)
+        return reverse(view, kwargs=kwargs)
+
+
+class ReportTestCase(ReportTestMixin, TestCase):
+    pass
+
+
+class ReportTransactionTestCase(ReportTestMixin, TransactionTestCase):
+    '''
+    For tests that change the schema. SQLite commits before those statements, so they can't be
+    rolled back by TestCase.
+    '''
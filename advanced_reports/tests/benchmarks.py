@@ -0,0 +1,143 @@
+import StringIO
+import sys
+
+from django.db import connection
+from django.test import TestCase
+
+from advanced_reports.benchmarks import configure, measure, measure_all, run
+from advanced_reports.benchmarks.data import generate
+from advanced_reports.benchmarks.models import BenchmarkCustomer, BenchmarkOrder
+from advanced_reports.tests.base import ReportTestCase
+
+
+def capture(func, *args):
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    try:
+        func(*args)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+
+class MeasureTest(TestCase):
+    def test_setup_before_every_call(self):
+        calls = []
+        timings = measure_all(lambda: calls.append('func'), 3, lambda: calls.append('setup'))
+        self.assertEqual(len(timings), 3)
+        self.assertEqual(calls, ['setup', 'func'] * 3)
+
+    def test_best_time(self):
+        calls = []
+        self.assertTrue(measure(lambda: calls.append('func'), 4) >= 0)
+        self.assertEqual(len(calls), 4)
+
+    def test_configure_when_configured(self):
+        # The settings of the tests are already configured, so they are left alone.
+        from django.conf import settings
+        configure(ROOT_URLCONF='other.urls')
+        self.assertEqual(settings.ROOT_URLCONF, 'advanced_reports.benchmarks.urls')
+
+    def test_count_queries(self):
+        before = len(connection.queries)
+        count = run.count_queries(lambda: list(BenchmarkOrder.objects.all()[:1]) + list(BenchmarkCustomer.objects.all()))
+        self.assertEqual(count, 2)
+        self.assertEqual(len(connection.queries), before)
+
+
+class DataTest(TestCase):
+    def test_batches(self):
+        # The last batch is smaller than the others.
+        generate(23, batch_size=10)
+        self.assertEqual(BenchmarkOrder.objects.count(), 23)
+        self.assertEqual(BenchmarkCustomer.objects.count(), 1)
+        self.assertEqual(list(BenchmarkOrder.objects.order_by('pk').values_list('pk', flat=True)), range(1, 24))
+        self.assertEqual(BenchmarkOrder.objects.get(pk=23).reference, u'R0000022')
+
+    def test_customers(self):
+        generate(120, customers=7)
+        self.assertEqual(BenchmarkCustomer.objects.count(), 7)
+        customer_ids = set(BenchmarkOrder.objects.values_list('customer', flat=True))
+        self.assertTrue(customer_ids <= set(range(1, 8)))
+        generate(120)
+        self.assertEqual(BenchmarkCustomer.objects.count(), 2)
+
+    def test_replaces_the_data(self):
+        generate(10)
+        generate(5)
+        self.assertEqual(BenchmarkOrder.objects.count(), 5)
+
+    def test_deterministic(self):
+        def values():
+            return list(BenchmarkOrder.objects.order_by('pk').values_list('customer', 'status', 'amount', 'quantity'))
+
+        generate(30, customers=3, seed=1)
+        first = values()
+        generate(30, customers=3, seed=1)
+        self.assertEqual(values(), first)
+        generate(30, customers=3, seed=2)
+        self.assertNotEqual(values(), first)
+
+    def test_no_rows(self):
+        generate(0)
+        self.assertEqual(BenchmarkOrder.objects.count(), 0)
+        self.assertEqual(BenchmarkCustomer.objects.count(), 1)
+
+
+class CompareTest(TestCase):
+    def results(self, *cases):
+        return {'environment': {'advanced_reports': '0.2'},
+                'results': [{'name': name, 'rows': rows, 'best': best, 'queries': queries}
+                            for name, rows, best, queries in cases]}
+
+    def test_ratios(self):
+        output = capture(run.compare, self.results(('list', 100, 0.002, 3)), self.results(('list', 100, 0.004, 5)))
+        lines = output.splitlines()
+        self.assertEqual(lines[0], 'Compared to 0.2:')
+        self.assertTrue('0.50x' in lines[1] and '-2 queries' in lines[1], lines[1])
+
+    def test_missing_cases(self):
+        # Cases and dataset sizes that aren't in the previous results are skipped.
+        output = capture(run.compare,
+                         self.results(('list', 100, 0.002, 3), ('list', 1000, 0.02, 3), ('count', 100, 0.001, 1)),
+                         self.results(('list', 100, 0.002, 3)))
+        self.assertEqual(len(output.splitlines()), 2)
+
+    def test_zero_time(self):
+        output = capture(run.compare, self.results(('list', 100, 0.002, 3)), self.results(('list', 100, 0, 3)))
+        self.assertTrue('0.00x' in output)
+
+    def test_environment(self):
+        import advanced_reports
+        environment = run.get_environment()
+        self.assertEqual(environment['advanced_reports'], str(advanced_reports.__version__))
+        for key in ('django', 'python', 'platform', 'date'):
+            self.assertTrue(environment[key], key)
+
+
+class RunCasesTest(ReportTestCase):
+    def test_run_cases(self):
+        results = []
+        capture(lambda: results.extend(run.run_cases(self.advreport, 20, 2)))
+        self.assertEqual([result['name'] for result in results],
+                         [name for name, func, setup in run.get_cases(self.advreport, run.get_client())])
+        for result in results:
+            self.assertEqual(result['rows'], 20)
+            self.assertTrue(0 <= result['best'] <= result['mean'], result)
+            self.assertTrue(result['queries'] > 0, result)
+
+    def test_multiple_actions_are_reset(self):
+        generate(20)
+        cases = dict((name, (func, setup)) for name, func, setup in run.get_cases(self.advreport, run.get_client()))
+        func, setup = cases['multiple_actions']
+        # Only new orders can be paid, so every call needs a reset first.
+        setup()
+        func()
+        self.assertEqual(BenchmarkOrder.objects.filter(status='paid').count(), 20)
+        setup()
+        self.assertEqual(BenchmarkOrder.objects.filter(status='new').count(), 20)
+
+    def test_only(self):
+        results = []
+        capture(lambda: results.extend(run.run_cases(self.advreport, 5, 1, ['count', 'unknown'])))
+        self.assertEqual([result['name'] for result in results], ['count'])
@@ -0,0 +1,71 @@
+import logging
+
+from django.conf import settings
+
+from advanced_reports.benchmarks.models import BenchmarkCustomer
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.instrumentation import QueryBudgetExceeded
+from advanced_reports.tests.base import ReportTestCase
+
+
+class BudgetOrderReport(BenchmarkOrderReport):
+    '''
+    Fetches the customer of every row in the total column.
+    '''
+    slug = 'budget_orders'
+    query_budget_per_page = 3
+
+    def get_total_html(self, item):
+        customer = BenchmarkCustomer.objects.get(pk=item.customer_id)
+        return u'%s %s' % (customer.name, super(BudgetOrderReport, self).get_total_html(item))
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class QueryBudgetTest(ReportTestCase):
+    report_class = BudgetOrderReport
+
+    def get_with_settings(self, **values):
+        '''
+        Requests the api list with the given settings, which are restored afterwards.
+        '''
+        previous = dict((name, getattr(settings, name, None)) for name in values)
+        for name, value in values.items():
+            setattr(settings, name, value)
+        try:
+            return self.client.get(self.url('advanced_reports_api_list'))
+        finally:
+            for name, value in previous.items():
+                setattr(settings, name, value)
+
+    def test_raises_with_the_setting(self):
+        try:
+            self.get_with_settings(ADVANCED_REPORTS_QUERY_BUDGET_RAISE=True)
+        except QueryBudgetExceeded, e:
+            self.assertTrue(u'total: 3' in unicode(e))
+            self.assertTrue(u'total ran queries for every row' in unicode(e))
+        else:
+            self.fail('QueryBudgetExceeded was not raised')
+
+    def test_raises_when_debugging(self):
+        self.assertRaises(QueryBudgetExceeded, self.get_with_settings,
+                          ADVANCED_REPORTS_QUERY_BUDGET_RAISE=None, DEBUG=True)
+
+    def test_logs_when_disabled(self):
+        handler = RecordingHandler()
+        logger = logging.getLogger('advanced_reports.instrumentation')
+        logger.addHandler(handler)
+        try:
+            response = self.get_with_settings(ADVANCED_REPORTS_QUERY_BUDGET_RAISE=None, DEBUG=False)
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(handler.messages), 1)
+        self.assertTrue(u'total ran queries for every row' in handler.messages[0])
@@ -0,0 +1,81 @@
+from django.test import TestCase
+
+from advanced_reports.benchmarks.models import BenchmarkCustomer, BenchmarkOrder
+from advanced_reports.defaults import AdvancedReport
+
+
+class Item(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class ItemReport(AdvancedReport):
+    slug = 'items'
+    fields = ('name', 'note', 'owner__name')
+
+    def get_note_html(self, item):
+        # None falls back to the value of the item.
+        if item.note:
+            return u'<em>%s</em>' % item.note
+
+    def get_name_decorator(self, item):
+        if item.name != u'plain':
+            return lambda html: u'<b>%s</b>' % html
+
+    def get_name_class(self, item):
+        return u'name'
+
+
+class AccessorPlanTest(TestCase):
+    def html(self, advreport, item):
+        return [value['html'] for value in advreport.get_column_values(item)]
+
+    def test_column_values(self):
+        item = Item(name=u'first', note=u'', owner=Item(name=u'owner'))
+        values = ItemReport().get_column_values(item)
+        self.assertEqual([value['html'] for value in values], [u'<b>first</b>', u'', u'owner'])
+        self.assertEqual([value['class'] for value in values], [u'name', u'', u''])
+
+    def test_fallbacks(self):
+        item = Item(name=u'plain', note=u'a note', owner=None)
+        # A decorator of None leaves the html alone, a missing related object renders None.
+        self.assertEqual(self.html(ItemReport(), item), [u'plain', u'<em>a note</em>', u'None'])
+
+    def test_display_of_choices(self):
+        class OrderReport(AdvancedReport):
+            fields = ('status', 'customer__name')
+
+        order = BenchmarkOrder(status='shipped', customer=BenchmarkCustomer(name=u'Customer'))
+        self.assertEqual(self.html(OrderReport(), order), [u'Shipped', u'Customer'])
+
+    def test_overridden_lookups(self):
+        class LookupReport(ItemReport):
+            def lookup_item_value(self, field_name, item):
+                return field_name.upper()
+
+        class HtmlReport(ItemReport):
+            def get_item_html(self, field_name, item):
+                return u'html of %s' % field_name
+
+        item = Item(name=u'plain', note=u'', owner=None)
+        self.assertEqual(self.html(LookupReport(), item), [u'NAME', u'NOTE', u'OWNER__NAME'])
+        self.assertEqual(self.html(HtmlReport(), item), [u'html of name', u'html of note', u'html of owner__name'])
+
+    def test_fields_change(self):
+        advreport = ItemReport()
+        item = Item(name=u'plain', note=u'', owner=None)
+        self.assertEqual(len(advreport.get_column_values(item)), 3)
+        advreport.fields = ('name',)
+        self.assertEqual(self.html(advreport, item), [u'plain'])
+
+    def test_export_values(self):
+        class ExportReport(ItemReport):
+            def get_owner__name_value(self, item):
+                return 42
+
+        advreport = ExportReport()
+        item = Item(name=u'first', note=u'', owner=None)
+        self.assertEqual(advreport.get_item_export_value('name', item), u'first')
+        self.assertEqual(advreport.get_item_export_value('owner__name', item), 42)
+        # Fields that aren't columns of the report are looked up as well.
+        self.assertEqual(advreport.get_item_export_value('email', Item(email=None)), None)
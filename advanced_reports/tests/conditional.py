@@ -0,0 +1,59 @@
+from django.utils import translation
+
+from advanced_reports.benchmarks.models import BenchmarkOrder
+from advanced_reports.tests.base import ReportTestCase
+
+
+class ConditionalTest(ReportTestCase):
+    def get(self, view='advanced_reports_api_list', params=None, **headers):
+        return self.client.get(self.url(view), params or {}, **headers)
+
+    def test_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('Cookie' in response['Vary'] and 'Accept-Language' in response['Vary'])
+        response = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+
+    def test_last_modified(self):
+        response = self.get()
+        response = self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_items(self):
+        etag = self.get()['ETag']
+        self.orders[0].save()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_deleted_items(self):
+        etag = self.get()['ETag']
+        # The latest item is the same, but the number of items changed.
+        BenchmarkOrder.objects.filter(pk=self.orders[0].pk).delete()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_the_request(self):
+        etag = self.get()['ETag']
+        self.assertNotEqual(self.get(params={'q': u'R00001'})['ETag'], etag)
+        translation.activate('nl')
+        try:
+            self.assertNotEqual(self.get()['ETag'], etag)
+        finally:
+            translation.deactivate()
+        self.assertNotEqual(self.get('advanced_reports_list')['ETag'], etag)
+
+    def test_list(self):
+        response = self.get('advanced_reports_list')
+        self.assertEqual(self.get('advanced_reports_list', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_pending_messages(self):
+        etag = self.get('advanced_reports_list')['ETag']
+        # Posting without a method leaves a warning for the next page.
+        self.client.post(self.url('advanced_reports_list'), {'method': ''})
+        self.assertEqual(self.get('advanced_reports_list', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_without_freshness(self):
+        self.advreport.freshness_field = None
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
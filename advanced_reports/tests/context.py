@@ -0,0 +1,52 @@
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.defaults import ContextAttribute, ReportContext, _get_active_contexts
+from advanced_reports.tests.base import ReportTestCase
+
+
+class HeaderlessOrderReport(BenchmarkOrderReport):
+    slug = 'headerless_orders'
+    report_header_visible = False
+
+
+class ContextAttributeTest(ReportTestCase):
+    report_class = HeaderlessOrderReport
+
+    def test_class_attribute_is_the_default(self):
+        self.assertTrue(isinstance(HeaderlessOrderReport.__dict__['report_header_visible'], ContextAttribute))
+        self.assertEqual(self.advreport.report_header_visible, False)
+        previous = self.advreport.activate(ReportContext(report_header_visible=True))
+        try:
+            self.assertEqual(self.advreport.report_header_visible, True)
+        finally:
+            self.advreport.activate(previous)
+        self.assertEqual(BenchmarkOrderReport().report_header_visible, True)
+
+    def test_setting_stays_in_the_context(self):
+        previous = self.advreport.activate(ReportContext())
+        try:
+            self.advreport.report_header_visible = True
+            self.assertEqual(self.advreport.report_header_visible, True)
+        finally:
+            self.advreport.activate(previous)
+        self.assertFalse('report_header_visible' in self.advreport.__dict__)
+        self.assertEqual(self.advreport.report_header_visible, False)
+
+    def test_setting_outside_a_context(self):
+        def set_request():
+            self.advreport.set_request(object())
+        self.assertRaises(RuntimeError, set_request)
+        self.assertEqual(self.advreport.request, None)
+        self.assertEqual(_get_active_contexts().get(self.advreport), None)
+
+    def test_scoped_context(self):
+        request = object()
+        with self.advreport.context(request) as context:
+            self.advreport.internal_mode = True
+            self.advreport.prefetch_action_groups(self.orders)
+            self.assertEqual(context.internal_mode, True)
+            self.assertEqual(len(self.advreport.get_context().action_groups), len(self.orders))
+            self.assertTrue(self.advreport.request is request)
+        self.assertEqual(self.advreport.internal_mode, False)
+        self.assertEqual(self.advreport.request, None)
+        self.assertEqual(self.advreport.get_context().action_groups, {})
+        self.assertEqual(_get_active_contexts().get(self.advreport), None)
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.utils import simplejson
+
+from advanced_reports import defaults
+from advanced_reports.benchmarks.models import BenchmarkOrder
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.defaults import EnrichedQueryset
+from advanced_reports.tests.base import ReportTestCase
+
+
+class CountedOrderReport(BenchmarkOrderReport):
+    slug = 'counted_orders'
+    count_cache_timeout = 60
+
+
+class CountTest(ReportTestCase):
+    report_class = CountedOrderReport
+
+    def setUp(self):
+        super(CountTest, self).setUp()
+        cache.clear()
+        self.estimate_count = defaults.estimate_count
+
+    def tearDown(self):
+        defaults.estimate_count = self.estimate_count
+
+    def api_list(self, **params):
+        response = self.client.get(self.url('advanced_reports_api_list'), params)
+        data = simplejson.loads(response.content)
+        return data['item_count'], data['item_count_approximate']
+
+    def test_counted_once(self):
+        object_list = EnrichedQueryset(BenchmarkOrder.objects.all(), self.advreport)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(object_list), 3)
+            self.assertEqual(object_list.count(), 3)
+            self.assertFalse(object_list.count_is_approximate)
+
+    def test_lists_are_not_counted(self):
+        object_list = EnrichedQueryset(list(BenchmarkOrder.objects.all()), self.advreport)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(object_list), 3)
+            self.assertFalse(object_list.count_is_approximate)
+
+    def test_cached_count(self):
+        self.assertEqual(self.api_list(), (3, False))
+        self.create_order(3)
+        # The cached count is stale until it expires, so it is approximate.
+        self.assertEqual(self.api_list(), (3, True))
+        # Every search has its own count.
+        self.assertEqual(self.api_list(q=u'R00003'), (1, False))
+
+    def test_empty_queryset_is_not_cached(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.advreport.count_items(BenchmarkOrder.objects.filter(pk__in=[])), (0, False))
+
+    def test_estimate(self):
+        self.advreport.count_cache_timeout = None
+        self.advreport.estimate_count_threshold = 1000
+        defaults.estimate_count = lambda queryset: 5000
+        queryset = BenchmarkOrder.objects.all()
+        self.assertEqual(self.advreport.count_items(queryset, estimate=True), (5000, True))
+        self.assertEqual(self.advreport.count_items(queryset), (3, False))
+        # Searches are never estimated.
+        self.assertEqual(self.api_list(), (5000, True))
+        self.assertEqual(self.api_list(q=u'R00001'), (1, False))
+
+    def test_small_estimate_is_counted(self):
+        self.advreport.count_cache_timeout = None
+        self.advreport.estimate_count_threshold = 1000
+        defaults.estimate_count = lambda queryset: 10
+        self.assertEqual(self.api_list(), (3, False))
+
+    def test_no_estimate_on_sqlite(self):
+        self.assertEqual(self.estimate_count(BenchmarkOrder.objects.all()), None)
@@ -0,0 +1,125 @@
+import StringIO
+import zipfile
+
+from django.db import connection
+
+from advanced_reports import instrumentation
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.defaults import ReportContext
+from advanced_reports.export import Exporter, XLSXExporter
+from advanced_reports.jobs import ExportJob, run_export_job
+from advanced_reports.signals import report_timed
+from advanced_reports.tests.base import ReportTestCase
+
+
+class ExportTest(ReportTestCase):
+    def test_export_parameter(self):
+        response = self.client.get(self.url('advanced_reports_list'), {'export': 'jsonl'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(response.content.splitlines()), len(self.orders))
+
+    def test_format_is_not_an_export(self):
+        # Reports may have a filter or a field called "format".
+        response = self.client.get(self.url('advanced_reports_list'), {'format': 'xlsx'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Disposition'))
+
+    def test_xlsx_strings_stay_strings(self):
+        try:
+            import xlsxwriter
+        except ImportError:
+            return
+        self.orders[0].email = u'=HYPERLINK("http://example.com")'
+        self.orders[0].save()
+        self.orders[1].email = u'http://example.com/'
+        self.orders[1].save()
+
+        f = StringIO.StringIO()
+        object_list, context = self.advreport.get_object_list(_request())
+        XLSXExporter(self.advreport).write(object_list, f)
+        workbook = zipfile.ZipFile(StringIO.StringIO(f.getvalue()))
+        sheet = workbook.read('xl/worksheets/sheet1.xml')
+        self.assertFalse('<f>' in sheet)
+        self.assertFalse('hyperlink' in sheet)
+
+    def test_exporter_with_write_only(self):
+        class TextExporter(Exporter):
+            def write(self, object_list, f, progress=None):
+                f.write('text')
+
+        self.assertEqual(''.join(TextExporter(self.advreport).iter_export([])), 'text')
+        self.assertRaises(NotImplementedError, lambda: list(Exporter(self.advreport).iter_export([])))
+
+    def test_export_job_is_timed(self):
+        timelines = []
+
+        def receiver(sender, timeline, **kwargs):
+            timelines.append(timeline)
+
+        job = ExportJob(slug=self.advreport.slug, format='csv')
+        job.save()
+        report_timed.connect(receiver)
+        instrumentation.INSTRUMENTATION = True
+        try:
+            run_export_job(job.id)
+        finally:
+            instrumentation.INSTRUMENTATION = False
+            report_timed.disconnect(receiver)
+
+        self.assertEqual(ExportJob.load(job.id).status, ExportJob.DONE)
+        self.assertEqual(len(timelines), 1)
+        phases = timelines[0].as_dict()['phases']
+        self.assertEqual(timelines[0].view, 'export_job')
+        self.assertTrue(phases['fetch']['queries'] > 0)
+        self.assertEqual(phases['enrich_list']['calls'], 1)
+        self.assertEqual(phases['write']['calls'], 1)
+
+    def test_streaming_closes_reopened_connections(self):
+        # The connection is closed when the request finishes, before the export is streamed.
+        closed = []
+        real = connection.connection
+        connection.connection = None
+        connection.close = lambda: closed.append(True)
+        try:
+            self.assertEqual(list(self.advreport.iter_in_context(ReportContext(), ['a', 'b'])), ['a', 'b'])
+        finally:
+            del connection.close
+            connection.connection = real
+        self.assertEqual(closed, [True])
+
+    def test_streaming_keeps_open_connections(self):
+        closed = []
+        connection.cursor()
+        connection.close = lambda: closed.append(True)
+        try:
+            list(self.advreport.iter_in_context(ReportContext(), ['a', 'b']))
+        finally:
+            del connection.close
+        self.assertEqual(closed, [])
+
+
+class ShippingOrderReport(BenchmarkOrderReport):
+    slug = 'shipping_orders'
+    fields = ('reference', 'status', 'total', 'email', 'shipped')
+
+    def enrich_list(self, items):
+        for item in items:
+            item.shipped = None
+
+
+class CSVExportTest(ReportTestCase):
+    report_class = ShippingOrderReport
+
+    def test_content(self):
+        response = self.client.get(self.url('advanced_reports_list'), {'csv': '1'})
+        lines = ''.join(response).splitlines()
+        self.assertEqual(len(lines), len(self.orders) + 1)
+        # Html columns are stripped, plain columns hold their value and None is left empty.
+        self.assertEqual(lines[1], 'R00000;New;10.00;customer@example.com;')
+        # The decorator of the email column is stripped as well.
+        self.assertFalse('<' in ''.join(lines))
+
+
+def _request():
+    from django.test.client import RequestFactory
+    return RequestFactory().get('/')
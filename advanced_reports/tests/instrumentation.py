@@ -0,0 +1,109 @@
+from django.db import connection, reset_queries
+from django.http import Http404
+from django.test.client import RequestFactory
+
+from advanced_reports import instrumentation, views
+from advanced_reports.benchmarks.models import BenchmarkOrder
+from advanced_reports.instrumentation import get_timeline, start_timeline, stop_timeline, timed
+from advanced_reports.signals import report_timed
+from advanced_reports.tests.base import ReportTestCase
+
+
+class TimelineTest(ReportTestCase):
+    def setUp(self):
+        super(TimelineTest, self).setUp()
+        instrumentation.INSTRUMENTATION = True
+
+    def tearDown(self):
+        instrumentation.INSTRUMENTATION = False
+
+    def query(self, count=1):
+        for i in range(count):
+            list(BenchmarkOrder.objects.all()[:1])
+
+    def test_nested_phases(self):
+        timeline = start_timeline('test', self.advreport.slug)
+        try:
+            with timed('outer'):
+                self.query()
+                with timed('inner'):
+                    self.query(2)
+                with timed('inner'):
+                    self.query()
+                self.query()
+        finally:
+            stop_timeline(timeline)
+        phases = timeline.as_dict()['phases']
+        # The queries of inner are not counted in outer.
+        self.assertEqual((phases['outer']['calls'], phases['outer']['queries']), (1, 2))
+        self.assertEqual((phases['inner']['calls'], phases['inner']['queries']), (2, 3))
+        self.assertEqual(timeline.queries, 5)
+
+    def test_queries_are_not_kept(self):
+        before = len(connection.queries)
+        timeline = start_timeline('test', self.advreport.slug)
+        self.query()
+        stop_timeline(timeline)
+        self.assertEqual(timeline.queries, 1)
+        self.assertEqual(len(connection.queries), before)
+        self.assertFalse(connection.use_debug_cursor)
+
+    def test_reset_queries(self):
+        timeline = start_timeline('test', self.advreport.slug)
+        try:
+            self.query(2)
+            with timed('phase'):
+                reset_queries()
+                self.query()
+        finally:
+            stop_timeline(timeline)
+        self.assertEqual(timeline.get_phase('phase').queries, 1)
+        self.assertEqual(timeline.queries, 3)
+
+    def test_open_phases_are_closed(self):
+        timeline = start_timeline('test', self.advreport.slug)
+        timeline.enter('outer')
+        timeline.enter('inner')
+        stop_timeline(timeline)
+        self.assertEqual(timeline.stack, [])
+        self.assertEqual(get_timeline(), None)
+
+    def test_nested_timelines(self):
+        timeline = start_timeline('outer', self.advreport.slug)
+        try:
+            self.assertEqual(start_timeline('inner', self.advreport.slug), None)
+            self.assertTrue(get_timeline() is timeline)
+        finally:
+            stop_timeline(timeline)
+
+    def test_disabled(self):
+        instrumentation.INSTRUMENTATION = False
+        self.assertEqual(start_timeline('test', self.advreport.slug), None)
+        response = self.client.get(self.url('advanced_reports_api_list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_view(self):
+        timelines = []
+
+        def receiver(sender, advreport, request, timeline, **kwargs):
+            timelines.append(timeline)
+
+        report_timed.connect(receiver)
+        try:
+            response = self.client.get(self.url('advanced_reports_api_list'))
+        finally:
+            report_timed.disconnect(receiver)
+
+        self.assertEqual(len(timelines), 1)
+        self.assertEqual(timelines[0].view, 'api_list')
+        phases = timelines[0].as_dict()['phases']
+        for name in ('queryset', 'count', 'fetch', 'enrich_list', 'render'):
+            self.assertTrue(name in phases, name)
+        self.assertEqual(phases['enrich_object']['calls'], len(self.orders))
+        self.assertTrue(response['Server-Timing'].startswith('queryset;dur='))
+        self.assertTrue('total;dur=' in response['Server-Timing'])
+
+    def test_view_that_raises(self):
+        request = RequestFactory().post('/')
+        self.assertRaises(Http404, views.ajax, request, self.advreport.slug, 'pay', '9999')
+        self.assertEqual(get_timeline(), None)
@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+from django.test.client import RequestFactory
+from django.utils import simplejson
+
+from advanced_reports import jobs, views
+from advanced_reports.jobs import ExportJob, SynchronousRunner, purge_expired_exports, run_export_job
+from advanced_reports.tests.base import ReportTestCase
+
+
+class ExportJobTest(ReportTestCase):
+    def setUp(self):
+        super(ExportJobTest, self).setUp()
+        self.runner = jobs._runner
+        jobs._runner = SynchronousRunner()
+        self.export_dir = tempfile.mkdtemp()
+        settings.ADVANCED_REPORTS_EXPORT_DIR = self.export_dir
+
+    def tearDown(self):
+        jobs._runner = self.runner
+        del settings.ADVANCED_REPORTS_EXPORT_DIR
+        shutil.rmtree(self.export_dir)
+
+    def start(self, data=None, query_string=''):
+        response = self.client.post(self.url('advanced_reports_export') + query_string, data or {})
+        self.assertEqual(response.status_code, 202)
+        return simplejson.loads(response.content)
+
+    def call(self, view, job_id, user=None):
+        request = RequestFactory().get('/')
+        request.user = user or AnonymousUser()
+        return view(request, self.advreport.slug, job_id)
+
+    def test_export(self):
+        job = self.start()
+        self.assertEqual(job['status'], ExportJob.DONE)
+        self.assertEqual((job['rows_done'], job['rows_total']), (3, 3))
+
+        response = self.client.get(job['download_url'])
+        content = ''.join(response)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="%s"' % ExportJob.load(job['id']).filename)
+        self.assertEqual(len(content.splitlines()), 4)
+        self.assertEqual(int(response['Content-Length']), len(content))
+
+    def test_filters_are_kept(self):
+        # The export and page parameters of the list are not filters.
+        job = ExportJob.load(self.start({'format': 'jsonl'}, '?q=R00001&page=2&export=csv')['id'])
+        self.assertEqual(job.format, 'jsonl')
+        self.assertEqual(job.query_string, 'q=R00001')
+        self.assertEqual(job.rows_total, 1)
+
+    def test_get_is_not_allowed(self):
+        response = self.client.get(self.url('advanced_reports_export'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_unknown_format(self):
+        request = RequestFactory().post('/', {'format': 'pdf'})
+        request.user = AnonymousUser()
+        self.assertRaises(Http404, views.export, request, self.advreport.slug)
+
+    def test_job_of_another_user(self):
+        job = ExportJob(slug=self.advreport.slug, format='csv', user_id=1)
+        job.save()
+        self.assertRaises(Http404, self.call, views.export_status, job.id)
+        self.assertRaises(Http404, self.call, views.export_download, job.id)
+
+    def test_job_of_another_report(self):
+        job = ExportJob(slug='other', format='csv')
+        job.save()
+        self.assertRaises(Http404, self.call, views.export_status, job.id)
+
+    def test_download_before_done(self):
+        job = ExportJob(slug=self.advreport.slug, format='csv')
+        job.save()
+        response = self.call(views.export_download, job.id)
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse('download_url' in simplejson.loads(response.content))
+
+    def test_download_of_a_purged_file(self):
+        job = self.start()
+        os.remove(ExportJob.load(job['id']).file_path)
+        self.assertRaises(Http404, self.call, views.export_download, job['id'])
+
+    def test_failed_job(self):
+        job = ExportJob(slug=self.advreport.slug, format='pdf')
+        job.save()
+        run_export_job(job.id)
+        job = ExportJob.load(job.id)
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertTrue(job.error)
+        self.assertEqual(job.file_path, None)
+
+    def test_purge_expired_exports(self):
+        expired = os.path.join(self.export_dir, jobs.FILE_PREFIX + 'expired.csv')
+        recent = os.path.join(self.export_dir, jobs.FILE_PREFIX + 'recent.csv')
+        other = os.path.join(self.export_dir, 'other.csv')
+        for file_path in (expired, recent, other):
+            open(file_path, 'w').close()
+        old = time.time() - jobs.EXPORT_TTL - 1
+        os.utime(expired, (old, old))
+        os.utime(other, (old, old))
+
+        purge_expired_exports()
+        self.assertEqual(sorted(os.listdir(self.export_dir)), ['advreport_recent.csv', 'other.csv'])
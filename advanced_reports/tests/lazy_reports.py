@@ -0,0 +1,15 @@
+'''
+Reports that are registered by dotted path in the registry tests. Don't import this module elsewhere.
+'''
+import advanced_reports
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+
+
+class LazyOrderReport(BenchmarkOrderReport):
+    slug = 'lazy_orders'
+
+
+class SelfRegisteringOrderReport(BenchmarkOrderReport):
+    slug = 'self_registering_orders'
+
+advanced_reports.register(SelfRegisteringOrderReport)
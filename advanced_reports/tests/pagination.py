@@ -0,0 +1,30 @@
+from django.utils import simplejson
+
+from advanced_reports.benchmarks.models import BenchmarkCustomer
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.tests.base import ReportTestCase
+
+
+class KeysetOrderReport(BenchmarkOrderReport):
+    slug = 'keyset_orders'
+    sortable_fields = ('customer', 'created')
+    keyset_pagination = True
+    items_per_page = 2
+
+
+class KeysetPaginationTest(ReportTestCase):
+    report_class = KeysetOrderReport
+
+    def get_page(self, **params):
+        response = self.client.get(self.url('advanced_reports_api_list'), params)
+        return simplejson.loads(response.content)
+
+    def test_order_by_relation(self):
+        other = BenchmarkCustomer.objects.create(name=u'Customer 2', city=u'Bruges', country=u'BE')
+        self.create_order(3, customer=other)
+        first = self.get_page(order='customer')
+        second = self.get_page(order='customer', after=first['next_cursor'])
+        ids = [item['item_id'] for item in first['items'] + second['items']]
+        self.assertEqual(ids, [unicode(order.pk) for order in self.orders] + [ids[-1]])
+        self.assertEqual(len(set(ids)), 4)
+        self.assertEqual(second['next_cursor'], None)
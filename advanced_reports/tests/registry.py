@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+
+from django.http import Http404
+from django.test import TestCase
+
+import advanced_reports
+from advanced_reports import REGISTRY, LazyVersion, get_report_for_slug, get_report_or_404
+
+
+class RegistryTest(TestCase):
+    def setUp(self):
+        sys.modules.pop('advanced_reports.tests.lazy_reports', None)
+
+    def tearDown(self):
+        for slug in ('lazy_orders', 'self_registering_orders'):
+            REGISTRY.pop(slug, None)
+
+    def test_dotted_path(self):
+        advanced_reports.register('advanced_reports.tests.lazy_reports.LazyOrderReport', slug='lazy_orders')
+        self.assertFalse('advanced_reports.tests.lazy_reports' in sys.modules)
+
+        advreport = get_report_for_slug('lazy_orders')
+        self.assertEqual(type(advreport).__name__, 'LazyOrderReport')
+        self.assertTrue(get_report_for_slug('lazy_orders') is advreport)
+        self.assertTrue(REGISTRY['lazy_orders'] is advreport)
+
+    def test_module_registers_the_report(self):
+        advanced_reports.register('advanced_reports.tests.lazy_reports.SelfRegisteringOrderReport',
+                                  slug='self_registering_orders')
+        advreport = get_report_for_slug('self_registering_orders')
+        # The instance that was registered while importing the module is kept.
+        from advanced_reports.tests.lazy_reports import SelfRegisteringOrderReport
+        self.assertTrue(isinstance(advreport, SelfRegisteringOrderReport))
+        self.assertTrue(get_report_for_slug('self_registering_orders') is advreport)
+
+    def test_unknown_slug(self):
+        self.assertEqual(get_report_for_slug('unknown'), None)
+        self.assertRaises(Http404, get_report_or_404, 'unknown')
+
+    def test_dotted_path_that_does_not_import(self):
+        advanced_reports.register('advanced_reports.tests.missing_reports.OrderReport', slug='lazy_orders')
+        self.assertRaises(ImportError, get_report_for_slug, 'lazy_orders')
+        # The report can still be imported later on.
+        self.assertEqual(REGISTRY['lazy_orders'], 'advanced_reports.tests.missing_reports.OrderReport')
+
+
+class LazyVersionTest(TestCase):
+    def setUp(self):
+        self.get_version = advanced_reports.get_version
+
+    def tearDown(self):
+        advanced_reports.get_version = self.get_version
+
+    def test_looked_up_once(self):
+        calls = []
+        advanced_reports.get_version = lambda: calls.append(True) or '1.0'
+        version = LazyVersion()
+        self.assertEqual(calls, [])
+        self.assertEqual(str(version), '1.0')
+        self.assertEqual(unicode(version), u'1.0')
+        self.assertTrue(version == '1.0')
+        self.assertFalse(version != '1.0')
+        self.assertEqual(calls, [True])
+
+
+class ImportTest(TestCase):
+    def test_urls_do_not_import_views(self):
+        path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        script = ('import sys; sys.path.insert(0, %r)\n'
+                  'from django.conf import settings; settings.configure()\n'
+                  'import subprocess; subprocess.Popen = None\n'
+                  'import advanced_reports.urls, advanced_reports.templatetags.advreport_utils\n'
+                  'sys.stdout.write(repr(sorted(m for m in sys.modules if m.startswith("advanced_reports.views"))))') % path
+        output = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE).communicate()[0]
+        self.assertEqual(output, '[]')
@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import translation
+
+from advanced_reports.defaults import AdvancedReport
+
+
+class UserReport(AdvancedReport):
+    slug = 'users'
+    models = (User,)
+    fields = ('username', 'email')
+
+
+class SchemaTest(TestCase):
+    def test_headers_follow_the_language(self):
+        advreport = UserReport()
+        advreport.invalidate_schema()
+        translation.activate('en')
+        try:
+            self.assertEqual(advreport.column_headers[0]['verbose_name'], u'Username')
+            translation.activate('nl')
+            self.assertEqual(advreport.column_headers[0]['verbose_name'], u'Gebruikersnaam')
+        finally:
+            translation.deactivate()
+
+    def test_built_once_per_class(self):
+        UserReport.invalidate_schema()
+        schema = UserReport().get_schema()
+        self.assertTrue(UserReport().get_schema() is schema)
+
+    def test_subclasses_have_their_own_schema(self):
+        class StaffReport(UserReport):
+            fields = ('username', 'is_staff')
+
+        UserReport.invalidate_schema()
+        self.assertEqual([c['name'] for c in UserReport().column_headers], ['username', 'email'])
+        self.assertEqual([c['name'] for c in StaffReport().column_headers], ['username', 'is_staff'])
+
+        schema = StaffReport().get_schema()
+        UserReport.invalidate_schema()
+        self.assertFalse(StaffReport().get_schema() is schema)
+
+    def test_instance_with_other_fields(self):
+        UserReport.invalidate_schema()
+        schema = UserReport().get_schema()
+        advreport = UserReport()
+        advreport.fields = ('email',)
+        self.assertEqual([c['name'] for c in advreport.column_headers], ['email'])
+        self.assertTrue(advreport.get_schema() is advreport.get_schema())
+        self.assertTrue(UserReport().get_schema() is schema)
+
+    def test_methods_are_called_every_time(self):
+        class NamedUserReport(UserReport):
+            suffix = u'1'
+
+            def get_email_verbose_name(self):
+                return u'e-mail %s' % self.suffix
+
+            def get_email_style(self):
+                return u'width: %sem' % self.suffix
+
+        advreport = NamedUserReport()
+        self.assertEqual(advreport.column_headers[1]['verbose_name'], u'E-mail 1')
+        advreport.suffix = u'2'
+        self.assertEqual(advreport.column_headers[1]['verbose_name'], u'E-mail 2')
+        self.assertEqual(advreport.column_headers[1]['style'], u'width: 2em')
+
+    def test_search_plan(self):
+        class SearchedUserReport(UserReport):
+            search_fields = ('username', 'groups__name', 'full_name')
+            sortable_fields = ('-last_name,first_name',)
+
+        schema = SearchedUserReport().get_schema()
+        self.assertEqual(schema.search_plan, (('username', True), ('groups__name', True), ('full_name', False)))
+        self.assertEqual(schema.sortable, {'last_name': 'last_name,first_name'})
@@ -0,0 +1,69 @@
+from django.db import connection
+from django.utils import simplejson
+
+from advanced_reports import search
+from advanced_reports.benchmarks.models import BenchmarkOrder
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.tests.base import ReportTransactionTestCase
+
+
+class FullTextOrderReport(BenchmarkOrderReport):
+    slug = 'fulltext_orders'
+    search_fields = ('reference', 'email')
+    search_backend = 'advanced_reports.search.FullTextSearchBackend'
+
+
+def uninstall(backend):
+    table = backend.get_table_name()
+    cursor = connection.cursor()
+    for trigger in ('_ai', '_ad', '_au'):
+        cursor.execute('DROP TRIGGER IF EXISTS %s' % connection.ops.quote_name(table + trigger))
+    cursor.execute('DROP TABLE IF EXISTS %s' % connection.ops.quote_name(table))
+    search._installed_tables.pop(('default', table), None)
+
+
+class SearchBackendTest(ReportTransactionTestCase):
+    report_class = FullTextOrderReport
+
+    def setUp(self):
+        super(SearchBackendTest, self).setUp()
+        self.backend = self.advreport.get_search_backend()
+        self.backend.install()
+
+    def tearDown(self):
+        uninstall(self.backend.get_backend('default'))
+
+    def search(self, q):
+        response = self.client.get(self.url('advanced_reports_api_list'), {'q': q})
+        return simplejson.loads(response.content)['item_count']
+
+    def test_terms_without_words(self):
+        self.assertEqual(self.search(u'R00001'), 1)
+        # The backend can't look up punctuation, so it is looked up with icontains.
+        self.assertEqual(self.search(u'R00001 @'), 1)
+        self.assertEqual(self.search(u'R00001 -'), 0)
+
+
+class UninstalledSearchBackendTest(ReportTransactionTestCase):
+    report_class = FullTextOrderReport
+
+    def setUp(self):
+        super(UninstalledSearchBackendTest, self).setUp()
+        self.backend = self.advreport.get_search_backend().get_backend('default')
+
+    def tearDown(self):
+        uninstall(self.backend)
+
+    def test_missing_table_is_looked_up_once(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(self.backend.is_installed('default'))
+        with self.assertNumQueries(0):
+            self.assertFalse(self.backend.is_installed('default'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_fields(BenchmarkOrder.objects.all()), [])
+
+    def test_install_after_lookup(self):
+        self.assertFalse(self.backend.is_installed('default'))
+        self.backend.install()
+        with self.assertNumQueries(0):
+            self.assertTrue(self.backend.is_installed('default'))
@@ -0,0 +1,77 @@
+import decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.utils import simplejson
+
+import advanced_reports
+from advanced_reports.benchmarks.models import BenchmarkCustomer, BenchmarkOrder
+from advanced_reports.benchmarks.reports import BenchmarkOrderReport
+from advanced_reports.search_index.models import SearchIndexEntry
+from advanced_reports.tests.base import ReportTestCase
+
+
+class IndexedOrderReport(BenchmarkOrderReport):
+    slug = 'indexed_orders'
+    models = (BenchmarkOrder, BenchmarkCustomer)
+    search_fields = ('reference', 'total')
+    search_index = True
+
+
+class SearchIndexSignalTest(ReportTestCase):
+    report_class = IndexedOrderReport
+
+    def setUp(self):
+        super(SearchIndexSignalTest, self).setUp()
+        self.index = self.advreport.get_search_index()
+        self.index.update()
+
+    def test_item_is_reindexed(self):
+        order = self.orders[0]
+        order.quantity = 7
+        order.save()
+        entry = SearchIndexEntry.objects.get(report=self.advreport.slug, item_id=unicode(order.pk))
+        self.assertTrue(u'70.00' in entry.text)
+        self.assertFalse(self.index.is_stale())
+
+    def test_other_model_marks_index_stale(self):
+        entries = SearchIndexEntry.objects.filter(report=self.advreport.slug).count()
+        # Saving a customer may affect every order, but the index isn't rebuilt while saving.
+        with self.assertNumQueries(4):
+            self.customer.save()
+        self.assertTrue(self.index.is_stale())
+        self.assertEqual(SearchIndexEntry.objects.filter(report=self.advreport.slug).count(), entries + 1)
+
+        self.index.update()
+        self.assertFalse(self.index.is_stale())
+
+
+class UnindexedOrderReport(BenchmarkOrderReport):
+    slug = 'unindexed_orders'
+    search_fields = ('reference', 'total')
+
+
+class UnindexedSearchTest(ReportTestCase):
+    report_class = UnindexedOrderReport
+
+    def test_index_is_not_used(self):
+        order = self.create_order(3, amount=decimal.Decimal('12.34'))
+        connection.use_debug_cursor = True
+        try:
+            response = self.client.get(self.url('advanced_reports_api_list'), {'q': u'12.34'})
+            queries = [query['sql'] for query in connection.queries]
+        finally:
+            connection.use_debug_cursor = None
+        items = simplejson.loads(response.content)['items']
+        self.assertEqual([item['item_id'] for item in items], [unicode(order.pk)])
+        self.assertTrue(queries)
+        self.assertFalse([sql for sql in queries if 'searchindex' in sql])
+
+    def test_requires_the_app(self):
+        installed_apps = settings.INSTALLED_APPS
+        settings.INSTALLED_APPS = [app for app in installed_apps if app != 'advanced_reports.search_index']
+        try:
+            self.assertRaises(ImproperlyConfigured, advanced_reports.register, IndexedOrderReport)
+        finally:
+            settings.INSTALLED_APPS = installed_apps
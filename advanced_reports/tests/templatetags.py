@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.template import Context, Template, TemplateSyntaxError
+from django.test import TestCase
+
+
+class Report(object):
+    row_cache = False
+
+
+class AdvReportRowTest(TestCase):
+    def setUp(self):
+        self.template_debug = settings.TEMPLATE_DEBUG
+
+    def tearDown(self):
+        settings.TEMPLATE_DEBUG = self.template_debug
+
+    def render(self, template_name):
+        template = Template('{%% load advreport_utils %%}{%% advreport_row "%s" %%}' % template_name)
+        return template.render(Context({'advreport': Report()}))
+
+    def test_missing_template(self):
+        settings.TEMPLATE_DEBUG = False
+        self.assertEqual(self.render('advanced_reports/missing_row.html'), u'')
+
+    def test_missing_template_when_debugging(self):
+        settings.TEMPLATE_DEBUG = True
+        # Templates that are compiled while debugging wrap the TemplateDoesNotExist.
+        self.assertRaises(TemplateSyntaxError, self.render, 'advanced_reports/missing_row.html')
@@ -1,14 +1,19 @@
 from django.conf.urls.defaults import *
-from advanced_reports.views import *
 
-urlpatterns = patterns('',
-    url(r'^(?P<slug>[^/]+)/$', list, name='advanced_reports_list'),
-    url(r'^(?P<slug>[^/]+)/form/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', ajax_form, name='advanced_reports_form'),
-    url(r'^(?P<slug>[^/]+)/form/(?P<method>[^/]+)/(?P<object_id>[^/]+)/(?P<param>[^/]+)/$', ajax_form, name='advanced_reports_form'),
-    url(r'^(?P<slug>[^/]+)/action/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', action, name='advanced_reports_action'),
-    url(r'^(?P<slug>[^/]+)/ajax/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', ajax, name='advanced_reports_ajax'),
-    url(r'^(?P<slug>[^/]+)/count/$', count, name='advanced_reports_count'),
+urlpatterns = patterns('advanced_reports.views',
+    url(r'^(?P<slug>[^/]+)/$', 'list', name='advanced_reports_list'),
+    url(r'^(?P<slug>[^/]+)/form/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', 'ajax_form', name='advanced_reports_form'),
+    url(r'^(?P<slug>[^/]+)/form/(?P<method>[^/]+)/(?P<object_id>[^/]+)/(?P<param>[^/]+)/$', 'ajax_form', name='advanced_reports_form'),
+    url(r'^(?P<slug>[^/]+)/forms/$', 'ajax_forms', name='advanced_reports_forms'),
+    url(r'^(?P<slug>[^/]+)/action/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', 'action', name='advanced_reports_action'),
+    url(r'^(?P<slug>[^/]+)/ajax/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', 'ajax', name='advanced_reports_ajax'),
+    url(r'^(?P<slug>[^/]+)/count/$', 'count', name='advanced_reports_count'),
+    url(r'^(?P<slug>[^/]+)/export/$', 'export', name='advanced_reports_export'),
+    url(r'^(?P<slug>[^/]+)/export/(?P<job_id>[0-9a-f]+)/$', 'export_status', name='advanced_reports_export_status'),
+    url(r'^(?P<slug>[^/]+)/export/(?P<job_id>[0-9a-f]+)/download/$', 'export_download', name='advanced_reports_export_download'),
 
-    url(r'^api/(?P<slug>[^/]+)/$', api_list, name='advanced_reports_api_list'),
-    url(r'^api/(?P<slug>[^/]+)/action/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', api_action, name='advanced_reports_api_action'),
+    url(r'^api/batch/$', 'api_batch', name='advanced_reports_api_batch'),
+    url(r'^api/(?P<slug>[^/]+)/$', 'api_list', name='advanced_reports_api_list'),
+    url(r'^api/(?P<slug>[^/]+)/actions/$', 'api_actions', name='advanced_reports_api_actions'),
+    url(r'^api/(?P<slug>[^/]+)/action/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', 'api_action', name='advanced_reports_api_action'),
 )
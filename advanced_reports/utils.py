@@ -0,0 +1,58 @@
+import Queue
+import sys
+import threading
+
+from django.db import connections
+
+
+def close_connections():
+    '''
+    Closes the database connections of the current thread.
+    '''
+    for connection in connections.all():
+        connection.close()
+
+
+def parallel_map(func, items, workers):
+    '''
+    Returns [func(item) for item in items], computed by a pool of at most the given number of
+    threads. With a single worker or a single item, everything runs in the calling thread.
+
+    Every thread gets its own database connections, which are closed when the thread is done.
+    If func raises an exception for an item, the other items are still processed and the first
+    exception is raised again in the calling thread afterwards.
+    '''
+    items = list(items)
+    if not workers or workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+    queue = Queue.Queue()
+    for position, item in enumerate(items):
+        queue.put((position, item))
+
+    def work():
+        try:
+            while True:
+                try:
+                    position, item = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[position] = func(item)
+                except Exception:
+                    errors.append((position, sys.exc_info()))
+        finally:
+            close_connections()
+
+    threads = [threading.Thread(target=work, name='advreport-worker') for i in range(min(workers, len(items)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        position, (exc_type, exc_value, exc_traceback) = min(errors)
+        raise exc_type, exc_value, exc_traceback
+    return results
@@ -1,23 +1,49 @@
 # -*- coding: utf-8 -*-
+import copy
+import hashlib
+import logging
+import os
+import zlib
+
 from django import forms
 from django.contrib import messages
-from django.core.urlresolvers import reverse
-from django.http import HttpResponse, Http404
+from django.core.servers.basehttp import FileWrapper
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, Http404, QueryDict
 from django.shortcuts import render_to_response, redirect
 from django.template.context import RequestContext
 from django.template.loader import render_to_string
-from django.utils.html import strip_entities, strip_tags
+from django.utils.functional import wraps
 from django.utils.safestring import mark_safe
-from django.utils.translation import ugettext as _
-from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils import translation
+from django.utils.translation import get_language, ugettext as _
+from django.views.decorators.http import condition
+from django.db import connections, transaction
+
+from django.db.models.query import QuerySet
 
 from django_ajax.pagination import paginate
 
 from advanced_reports import get_report_or_404
-from advanced_reports.defaults import ActionException
+from advanced_reports.defaults import ActionException, MultipleActionSummary, ReportContext
+from advanced_reports.export import get_exporter
+from advanced_reports.instrumentation import instrument, timed
+from advanced_reports.jobs import ExportJob, start_export_job
+from advanced_reports.pagination import keyset_paginate
+from advanced_reports.utils import parallel_map
 
 from django.utils import simplejson
 
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = getattr(settings, 'ADVANCED_REPORTS_BATCH_WORKERS', 4)
+'''
+The number of threads that fetch the reports of a batch.
+'''
+
 def _get_redirect(advreport, next=None, querystring=None):
     if next:
         return redirect(next)
@@ -28,12 +54,51 @@ def _get_redirect(advreport, next=None, querystring=None):
         suffix = u'?%s' % querystring
     return redirect(reverse('advanced_reports_list', kwargs={'slug': advreport.slug}) + suffix)
 
+def _report_view(view):
+    '''
+    Activates a ReportContext with the request on the report, while the view runs.
+    '''
+    def wrapper(request, slug, *args, **kwargs):
+        advreport = get_report_or_404(slug)
+        previous = advreport.activate(ReportContext(request))
+        try:
+            return view(request, slug, *args, **kwargs)
+        finally:
+            advreport.activate(previous)
+    return wraps(view)(wrapper)
+
+def _paginate(request, advreport, object_list):
+    if advreport.keyset_pagination and isinstance(object_list.queryset, QuerySet):
+        ordering = advreport.get_keyset_ordering(advreport.get_order_by(request))
+        return keyset_paginate(request, object_list, ordering, advreport.items_per_page)
+    return paginate(request, object_list, num_per_page=advreport.items_per_page, use_get_parameters=True)
+
+def _conditional(request, advreport, object_list, render):
+    '''
+    Returns the response of render, or "304 Not Modified" when the client already has it according
+    to AdvancedReport.get_freshness. The ETag depends on the url, the user and the language.
+    '''
+    if request.method not in ('GET', 'HEAD'):
+        return render()
+    with timed('freshness'):
+        freshness = advreport.get_freshness(object_list.queryset)
+    if freshness is None:
+        return render()
+
+    last_modified, key = freshness
+    user = getattr(request, 'user', None)
+    etag = hashlib.md5(repr((advreport.slug, key, last_modified, request.get_full_path(),
+                             getattr(user, 'pk', None), get_language()))).hexdigest()
+    response = condition(etag_func=lambda request: etag,
+                         last_modified_func=lambda request: last_modified)(lambda request: render())(request)
+    patch_vary_headers(response, ('Cookie', 'Accept-Language'))
+    return response
+
+@instrument
 @transaction.autocommit
-def list(request, slug, ids=None, internal_mode=False, report_header_visible=True):
+def list(request, slug, ids=None, internal_mode=None, report_header_visible=None):
     advreport = get_report_or_404(slug)
-    advreport.set_request(request)
-    advreport.internal_mode = internal_mode
-    advreport.report_header_visible = report_header_visible
+    report_context = ReportContext(request, internal_mode, report_header_visible)
 
     def inner(request, slug, ids):
         context = {}
@@ -60,11 +125,20 @@ def list(request, slug, ids=None, internal_mode=False, report_header_visible=Tru
                 if response:
                     return response
 
+                failed = []
+                if isinstance(count, MultipleActionSummary):
+                    count, failed = count.count, count.failed
+
                 if count > 0:
                     messages.success(request, _(u'Successfully executed action on %(count)d %(objects)s')
                                                     % {'count': count,
                                                        'objects': advreport.verbose_name_plural if count != 1 else advreport.verbose_name})
-                else:
+                if failed:
+                    messages.error(request, _(u'The action failed on %(count)d %(objects)s: %(errors)s')
+                                                    % {'count': len(failed),
+                                                       'objects': advreport.verbose_name_plural if len(failed) != 1 else advreport.verbose_name,
+                                                       'errors': u'; '.join(u'%s: %s' % failure for failure in failed)})
+                elif count == 0:
                     messages.error(request, _(u'No selected %(object)s is applicable for this action.') % {'object': advreport.verbose_name})
                 if not advreport.internal_mode:
                     return _get_redirect(advreport, querystring=request.META['QUERY_STRING'])
@@ -75,51 +149,58 @@ def list(request, slug, ids=None, internal_mode=False, report_header_visible=Tru
         object_list, extra_context = advreport.get_object_list(request, ids=ids)
         context.update(extra_context)
 
-        # CSV?
-        if 'csv' in request.GET:
-            from cStringIO import StringIO
-            csv = StringIO()
-            header = u'%s\n' % u';'.join(c['verbose_name'] for c in advreport.column_headers)
-            lines = (u'%s\n' % u';'.join((c['html'] for c in o.advreport_column_values)) for o in object_list[:])
-            lines = (line.replace(u'&nbsp;', u' ') for line in lines)
-            lines = (line.replace(u'&euro;', u'€') for line in lines)
-            lines = (line.replace(u'<br/>', u' ') for line in lines)
-            lines = (strip_entities(line) for line in lines)
-            lines = (strip_tags(line).encode('utf-8') for line in lines)
-            csv.write(header)
-            csv.writelines(lines)
-            response = HttpResponse(csv.getvalue(), 'text/csv')
-            response['Content-Disposition'] = 'attachment; filename="%s.csv"' % advreport.slug
+        # Export?
+        if 'csv' in request.GET or 'export' in request.GET:
+            exporter = get_exporter('csv' if 'csv' in request.GET else request.GET['export'], advreport)
+            response = HttpResponse(advreport.iter_in_context(report_context, exporter.iter_export(object_list)),
+                                    exporter.content_type)
+            response['Content-Disposition'] = 'attachment; filename="%s"' % exporter.get_filename()
             return response
 
-        # Paginate
-        paginated = paginate(request, object_list, num_per_page=advreport.items_per_page, use_get_parameters=True)
+        # Only the rows that are not cached are enriched and rendered.
+        if advreport.row_cache:
+            object_list.row_cache = advreport.get_row_cache()
 
-        # Extra context?
-        context.update(advreport._extra_context(request))
+        def render():
+            # Paginate
+            paginated = _paginate(request, advreport, object_list)
 
-        # Render
-        context.update({'advreport': advreport,
-                        'paginated': paginated,
-                        'object_list': object_list})
+            # Extra context?
+            context.update(advreport._extra_context(request))
 
-        func = render_to_string if advreport.internal_mode else render_to_response
-        return func(advreport.get_template(), context, context_instance=RequestContext(request))
+            # Render
+            context.update({'advreport': advreport,
+                            'paginated': paginated,
+                            'object_list': object_list})
 
-    if advreport.decorate_views:
-        inner = advreport.get_decorator()(inner)
+            func = render_to_string if advreport.internal_mode else render_to_response
+            with timed('render'):
+                return func(advreport.get_template(), context, context_instance=RequestContext(request))
 
-    return inner(request, slug, ids)
+        # Pending messages must be shown, even when the items didn't change.
+        if advreport.internal_mode or len(messages.get_messages(request)):
+            return render()
+        return _conditional(request, advreport, object_list, render)
+
+    previous = advreport.activate(report_context)
+    try:
+        if advreport.decorate_views:
+            inner = advreport.get_decorator()(inner)
+
+        return inner(request, slug, ids)
+    finally:
+        advreport.activate(previous)
 
+@_report_view
 def action(request, slug, method, object_id):
     advreport = get_report_or_404(slug)
-    advreport.set_request(request)
 
     def inner(request, slug, method, object_id):
         next = request.GET.get('next', None)
 
-        object = advreport.get_item_for_id(object_id)
-        advreport.enrich_object(object, request=request)
+        with timed('fetch'):
+            object = advreport.get_item_for_id(object_id)
+        advreport.prepare_item(object, request=request)
 
         a = advreport.find_action(method)
 
@@ -147,14 +228,16 @@ def action(request, slug, method, object_id):
     return inner(request, slug, method, object_id)
 
 
+@instrument
 @transaction.autocommit
+@_report_view
 def ajax(request, slug, method, object_id):
     advreport = get_report_or_404(slug)
-    advreport.set_request(request)
 
     def inner(request, slug, method, object_id):
-        object = advreport.get_item_for_id(object_id)
-        advreport.enrich_object(object, request=request)
+        with timed('fetch'):
+            object = advreport.get_item_for_id(object_id)
+        advreport.prepare_item(object, request=request)
         a = advreport.find_object_action(object, method)
         if a is None:
             return HttpResponse(_(u'Unsupported action method "%s".' % method), status=404)
@@ -170,27 +253,28 @@ def ajax(request, slug, method, object_id):
 
                 if form.is_valid():
                     advreport.get_action_callable(a.method)(object, form)
-                    object = advreport.get_item_for_id(object_id)
+                    object = advreport.refresh_item(object, request=request)
                     context.update({'success': a.get_success_message()})
                 else:
                     context.update({'response_method': method, 'response_form': form})
                     if a.form_template:
                         context.update({'response_form_template': mark_safe(render_to_string(a.form_template, {'form': form}))})
+                    advreport.enrich_object(object, list=False, request=request)
 
-                advreport.enrich_object(object, request=request)
                 context.update({'object': object})
-                return render_to_response(advreport.item_template, context, context_instance=RequestContext(request))
+                with timed('render'):
+                    return render_to_response(advreport.item_template, context, context_instance=RequestContext(request))
 
             elif a.form is None:
                 advreport.get_action_callable(a.method)(object)
-                object = advreport.get_item_for_id(object_id)
-                advreport.enrich_object(object, request=request)
+                object = advreport.refresh_item(object, request=request)
                 context = {'object': object, 'advreport': advreport, 'success': a.get_success_message()}
                 context.update({'response_method': method, 'response_form': a.form})
                 if a.form_template:
                     context.update({'response_form_template': mark_safe(render_to_string(a.form_template, {'form': a.form}))})
-                
-                return render_to_response(advreport.item_template, context, context_instance=RequestContext(request))
+
+                with timed('render'):
+                    return render_to_response(advreport.item_template, context, context_instance=RequestContext(request))
 
         except ActionException, e:
             return HttpResponse(e.msg, status=404)
@@ -205,9 +289,9 @@ def ajax(request, slug, method, object_id):
 
 
 @transaction.autocommit
+@_report_view
 def count(request, slug):
     advreport = get_report_or_404(slug)
-    advreport.set_request(request)
 
     def inner(request, slug):
         return HttpResponse(unicode(advreport.get_item_count()))
@@ -218,14 +302,16 @@ def count(request, slug):
     return inner(request, slug)
 
 
+@instrument
 @transaction.autocommit
+@_report_view
 def ajax_form(request, slug, method, object_id, param=None):
     advreport = get_report_or_404(slug)
-    advreport.set_request(request)
 
     def inner(request, slug, method, object_id):
-        object = advreport.get_item_for_id(object_id)
-        advreport.enrich_object(object, request=request)
+        with timed('fetch'):
+            object = advreport.get_item_for_id(object_id)
+        advreport.prepare_item(object, request=request)
         a = advreport.find_object_action(object, method)
         if a is None:
             # No appropriate action found (maybe it was filtered out?)
@@ -241,8 +327,7 @@ def ajax_form(request, slug, method, object_id, param=None):
 
             if form.is_valid():
                 r = advreport.get_action_callable(a.method)(object, form)
-                object = advreport.get_item_for_id(object_id)
-                advreport.enrich_object(object, request=request)
+                object = advreport.refresh_item(object, request=request)
                 context.update({'success': a.get_success_message(), 'object': object, 'action': a})
                 response = render_to_string(advreport.item_template, context, context_instance=RequestContext(request))
                 return r or HttpResponse(simplejson.dumps({
@@ -258,18 +343,7 @@ def ajax_form(request, slug, method, object_id, param=None):
             return render_to_response('advanced_reports/ajax_form.html', context, context_instance=RequestContext(request))
 
         elif a.form:
-            a = a.copy_with_instanced_form(prefix=object_id, instance=a.get_form_instance(advreport.get_item_for_id(object_id), param=param))
-            context = {'object': object, 'advreport': advreport, 'success': a.get_success_message(), 'action': a}
-
-            context.update({'response_method': method, 'response_form': a.form})
-            if a.form_template:
-                context.update({'response_form_template': mark_safe(render_to_string(a.form_template, {'form': a.form}))})
-            
-            return render_to_response(
-                'advanced_reports/ajax_form.html',
-                context,
-                context_instance=RequestContext(request)
-            )
+            return HttpResponse(_render_action_form(request, advreport, object, object_id, a, param=param))
         else:
             raise Http404
 
@@ -281,6 +355,53 @@ def ajax_form(request, slug, method, object_id, param=None):
     return inner(request, slug, method, object_id)
 
 
+def _render_action_form(request, advreport, object, object_id, a, param=None):
+    a = a.copy_with_instanced_form(prefix=object_id, instance=a.get_form_instance(object, param=param))
+    context = {'object': object, 'advreport': advreport, 'success': a.get_success_message(), 'action': a}
+
+    context.update({'response_method': a.method, 'response_form': a.form})
+    if a.form_template:
+        context.update({'response_form_template': mark_safe(render_to_string(a.form_template, {'form': a.form}))})
+
+    return render_to_string('advanced_reports/ajax_form.html', context, context_instance=RequestContext(request))
+
+
+@transaction.autocommit
+@_report_view
+def ajax_forms(request, slug):
+    '''
+    Renders the forms of several items at once, for AdvancedReport.lazy_action_forms. The items are
+    given by the comma separated "ids" parameter. The optional "methods" parameter limits the actions.
+    Returns a JSON object that maps item ids to objects that map action methods to form html.
+    '''
+    advreport = get_report_or_404(slug)
+
+    def inner(request, slug):
+        object_ids = [object_id for object_id in request.GET.get('ids', '').split(',') if object_id]
+        methods = [method for method in request.GET.get('methods', '').split(',') if method]
+
+        objects = advreport.get_items_for_ids(object_ids)
+        advreport.enrich_list(objects)
+        advreport.prefetch_action_groups(objects)
+
+        forms = {}
+        for object_id, object in zip(object_ids, objects):
+            advreport.enrich_object(object, list=False, request=request)
+            forms[object_id] = {}
+            for a in advreport.item_actions:
+                if a.form is None or a.hidden or (methods and a.method not in methods):
+                    continue
+                if advreport.has_action_group(object, a.group):
+                    forms[object_id][a.method] = _render_action_form(request, advreport, object, object_id, a)
+
+        return _json_response(forms)
+
+    if advreport.decorate_views:
+        inner = advreport.get_decorator()(inner)
+
+    return inner(request, slug)
+
+
 from django.utils.translation import ugettext_lazy
 _proxy_type = type(ugettext_lazy(''))
 def _json_object_encoder(obj):
@@ -289,56 +410,230 @@ def _json_object_encoder(obj):
     else:
         return None
 
-def _action_dict(action):
+def _action_dict(action, advreport, o):
     d = action.attrs_dict
-    if action.form:
+    if action.lazy_form:
+        d['form'] = None
+        d['form_url'] = reverse('advanced_reports_form', kwargs={'slug': advreport.slug,
+                                                                 'method': action.method,
+                                                                 'object_id': advreport.get_item_id(o)})
+    elif action.form:
         d['form'] = action.form_template or action.form.as_table()
     return d
 
 
-def _item_values(o, advreport):
-    return {
+def _item_values(o, advreport, include=None):
+    values = {
         'values': o.advreport_column_values,
-        'extra_information': o.advreport_extra_information.replace('data-method="', 'ng-bind-html-unsafe="lazydiv__%s__' % advreport.get_item_id(o)),
-        'actions': [_action_dict(a) for a in o.advreport_actions],
         'item_id': advreport.get_item_id(o)
     }
-
-
+    if include is None or 'extra' in include:
+        values['extra_information'] = o.advreport_extra_information.replace('data-method="', 'ng-bind-html-unsafe="lazydiv__%s__' % advreport.get_item_id(o))
+    if include is None or 'actions' in include:
+        values['actions'] = [_action_dict(a, advreport, o) for a in o.advreport_actions]
+    return values
+
+def _compact_json(obj):
+    return simplejson.dumps(obj, separators=(',', ':'), default=_json_object_encoder)
+
+def _iter_compact_report(report, items, advreport, include):
+    '''
+    Yields the compact json of the report dict, followed by its items, which are encoded one by one.
+    '''
+    yield '{'
+    for key, value in report.items():
+        yield '%s:%s,' % (_compact_json(key), _compact_json(value))
+    yield '"items":['
+    for i, o in enumerate(items):
+        if i:
+            yield ','
+        yield _compact_json(_item_values(o, advreport, include))
+    yield ']}'
+
+def _iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _compact_response(request, report, items, advreport, include):
+    '''
+    Streams the report in compact json, compressed with gzip when the client accepts it.
+    '''
+    chunks = advreport.iter_in_context(advreport.get_context(), _iter_compact_report(report, items, advreport, include))
+    gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+    response = HttpResponse(_iter_gzip(chunks) if gzip else chunks, content_type='application/json')
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+@instrument
 @transaction.autocommit
+@_report_view
 def api_list(request, slug, ids=None):
     advreport = get_report_or_404(slug)
-    advreport.set_request(request)
 
     def inner(request, slug, ids):
         object_list, extra_context = advreport.get_object_list(request)
 
-        paginated = paginate(request, object_list, num_per_page=advreport.items_per_page, use_get_parameters=True)
-
-        report = {
-            'header': advreport.column_headers,
-            'extra': extra_context,
-            'items': [_item_values(o, advreport) for o in paginated.object_list[:]],
-            'items_per_page': advreport.items_per_page,
-            'item_count': len(object_list),
-            'searchable_columns': advreport.searchable_columns,
-            'search_fields': advreport.search_fields
-        }
-        return HttpResponse(simplejson.dumps(report, indent=2, default=_json_object_encoder))
+        # Compact mode: ?fields=a,b only computes these columns, ?include=actions,extra adds the
+        # actions and the extra information of the items.
+        compact = 'compact' in request.GET or 'fields' in request.GET or 'include' in request.GET
+        fields = include = None
+        if compact:
+            include = set(request.GET.get('include', '').split(',')) & set(['actions', 'extra'])
+            if request.GET.get('fields'):
+                fields = [f for f in request.GET['fields'].split(',') if f in advreport.fields]
+            context = advreport.get_context()
+            context.fields, context.include = fields, include
+
+        def render():
+            paginated = _paginate(request, advreport, object_list)
+
+            header = advreport.column_headers
+            if fields is not None:
+                # The name of a header is cut at "__", so match them by position.
+                by_field = dict(zip(advreport.fields, header))
+                header = [by_field[f] for f in fields]
+
+            report = {
+                'header': header,
+                'extra': extra_context,
+                'items_per_page': advreport.items_per_page,
+                'item_count': len(object_list),
+                'item_count_approximate': object_list.count_is_approximate,
+                'searchable_columns': advreport.searchable_columns,
+                'search_fields': advreport.search_fields
+            }
+            if getattr(paginated, 'keyset', False):
+                report.update({'next_cursor': paginated.next_cursor,
+                               'previous_cursor': paginated.previous_cursor})
+            if compact:
+                return _compact_response(request, report, paginated.object_list[:], advreport, include)
+            report['items'] = [_item_values(o, advreport) for o in paginated.object_list[:]]
+            with timed('render'):
+                return HttpResponse(simplejson.dumps(report, indent=2, default=_json_object_encoder))
+
+        return _conditional(request, advreport, object_list, render)
 
     if advreport.decorate_views:
         inner = advreport.get_decorator()(inner)
     return inner(request, slug, ids)
 
 
+def _query_dict(values):
+    '''
+    Returns a mutable QueryDict with the values of a json dict. Lists become multiple values.
+    '''
+    query = QueryDict('', mutable=True)
+    for key, value in values.items():
+        if isinstance(value, (tuple, type([]))):
+            query.setlist(key, [unicode(v) for v in value])
+        else:
+            query[key] = unicode(value)
+    return query
+
+def _batch_request(request, spec):
+    '''
+    Builds the GET request of a single report of a batch, sharing the user and the session of the
+    batch request.
+    '''
+    query = _query_dict(spec.get('filters') or {})
+    if spec.get('page'):
+        query['page'] = unicode(spec['page'])
+    for key in ('fields', 'include'):
+        value = spec.get(key)
+        if value is not None:
+            query[key] = value if isinstance(value, basestring) else u','.join(value)
+
+    subrequest = copy.copy(request)
+    subrequest.method = 'GET'
+    subrequest.GET = query
+    subrequest.path = reverse('advanced_reports_count' if spec.get('count') else 'advanced_reports_api_list',
+                              kwargs={'slug': spec['slug']})
+    subrequest.META = dict((k, v) for k, v in request.META.items()
+                           if k not in ('HTTP_ACCEPT_ENCODING', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE'))
+    subrequest.META['QUERY_STRING'] = query.urlencode()
+    return subrequest
+
+def _run_batch_spec(request, spec, language):
+    previous = translation.get_language()
+    translation.activate(language)
+    try:
+        view = count if spec.get('count') else api_list
+        try:
+            response = view(_batch_request(request, spec), spec['slug'])
+        except Http404:
+            return 404, None
+        except NoReverseMatch:
+            # The slug isn't a valid slug.
+            return 400, None
+        except Exception:
+            # One failing report doesn't fail the others.
+            logger.exception('Report %s of a batch failed', spec['slug'])
+            return 500, None
+        if response.status_code != 200:
+            return response.status_code, None
+        return 200, response.content
+    finally:
+        translation.activate(previous)
+
+def _is_batch_spec(spec):
+    return (isinstance(spec, dict)
+            and isinstance(spec.get('slug'), basestring)
+            and (spec.get('filters') is None or isinstance(spec['filters'], dict)))
+
+@transaction.autocommit
+def api_batch(request):
+    '''
+    Returns the pages of several reports at once, for dashboards. Takes a json list of specs, as the
+    body of a POST or in the "specs" GET parameter. A spec looks like:
+
+        {"slug": "orders", "filters": {"q": "foo"}, "page": 2, "fields": ["reference"], "include": ["actions"]}
+
+    or {"slug": "orders", "count": true} for the count of a report. Returns a list with a
+    {"slug": ..., "status": ..., "data": ...} dict per spec, where data is what api_list or count
+    return. A spec that fails gets the status 400 when its slug is invalid, 404 when the report
+    doesn't exist and 500 when the report raised an error, without failing the other specs.
+    The reports are fetched by ADVANCED_REPORTS_BATCH_WORKERS threads, unless one of the
+    databases is SQLite.
+    '''
+    try:
+        specs = simplejson.loads(request.raw_post_data if request.method == 'POST' else request.GET.get('specs', ''))
+        if not isinstance(specs, type([])) or [spec for spec in specs if not _is_batch_spec(spec)]:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest(_(u'Expected a list of report specs.'))
+
+    workers = BATCH_WORKERS
+    if [alias for alias in connections if connections[alias].vendor == 'sqlite']:
+        workers = 1
+    language = translation.get_language()
+    results = parallel_map(lambda spec: _run_batch_spec(request, spec, language), specs, workers)
+
+    parts = []
+    for spec, (status, content) in zip(specs, results):
+        part = '{"slug":%s,"status":%d' % (simplejson.dumps(spec['slug']), status)
+        if content is not None:
+            part += ',"data":%s' % content
+        parts.append(part + '}')
+    return HttpResponse('[%s]' % ','.join(parts), content_type='application/json')
+
+
+@instrument
 @transaction.autocommit
+@_report_view
 def api_action(request, slug, method, object_id):
     advreport = get_report_or_404(slug)
-    advreport.set_request(request)
 
     def inner(request, slug, method, object_id):
-        object = advreport.get_item_for_id(object_id)
-        advreport.enrich_object(object, request=request)
+        with timed('fetch'):
+            object = advreport.get_item_for_id(object_id)
+        advreport.prepare_item(object, request=request)
         a = advreport.find_object_action(object, method)
         if a is None:
             return HttpResponse(_(u'Unsupported action method "%s".' % method), status=404)
@@ -353,21 +648,20 @@ def api_action(request, slug, method, object_id):
 
                 if form.is_valid():
                     advreport.get_action_callable(a.method)(object, form)
-                    object = advreport.get_item_for_id(object_id)
+                    object = advreport.refresh_item(object, request=request)
                     context.update({'success': a.get_success_message()})
                 else:
                     context.update({'response_method': method, 'response_form': form.as_table()})
                     if a.form_template:
                         context.update({'response_form_template': mark_safe(render_to_string(a.form_template, {'form': form}))})
+                    advreport.enrich_object(object, list=False, request=request)
 
-                advreport.enrich_object(object, request=request)
                 context.update({'item': _item_values(object, advreport)})
                 return HttpResponse(simplejson.dumps(context, indent=2, default=_json_object_encoder))
 
             elif a.form is None:
                 advreport.get_action_callable(a.method)(object)
-                object = advreport.get_item_for_id(object_id)
-                advreport.enrich_object(object, request=request)
+                object = advreport.refresh_item(object, request=request)
                 context = {'item': _item_values(object, advreport), 'success': a.get_success_message()}
                 return HttpResponse(simplejson.dumps(context, indent=2, default=_json_object_encoder))
 
@@ -381,3 +675,200 @@ def api_action(request, slug, method, object_id):
         inner = advreport.get_decorator()(inner)
 
     return inner(request, slug, method, object_id)
+
+
+def _find_items(advreport, item_ids):
+    '''
+    Returns a dict with the items of the given ids that exist, by id. Items can be gone, for
+    example because an action deleted them, or not be visible in the report.
+    '''
+    item_ids = [unicode(item_id) for item_id in item_ids]
+    try:
+        return dict(zip(item_ids, advreport.get_items_for_ids(item_ids)))
+    except Http404:
+        items = {}
+        for item_id in item_ids:
+            if item_id in items:
+                continue
+            try:
+                items[item_id] = advreport.get_item_for_id(item_id)
+            except Http404:
+                pass
+        return items
+
+def _refetch_items(advreport, item_ids):
+    items = _find_items(advreport, item_ids)
+    return [items[unicode(item_id)] for item_id in item_ids if unicode(item_id) in items]
+
+@transaction.autocommit
+@_report_view
+def api_actions(request, slug):
+    '''
+    Runs actions on many items at once. Takes a json list of entries as the body of a POST, like:
+
+        [{"item_id": "12", "method": "pay"}, {"item_id": "13", "method": "note", "data": {"note": "..."}}]
+
+    where data is the form data of actions with a form, without prefix. The items are loaded and
+    enriched together, and so are the items that changed afterwards. Returns a "results" list with
+    a dict per entry, with either a "success" message, an "error" message or the form "errors", and
+    an "items" list with the changed items, like api_action. Deleted items are left out.
+
+    Every entry runs in its own transaction, so an entry that fails, or of which the item isn't
+    found, gets an "error" and doesn't affect the others.
+    '''
+    advreport = get_report_or_404(slug)
+
+    def inner(request, slug):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        try:
+            entries = simplejson.loads(request.raw_post_data)
+            if not isinstance(entries, type([])) or [e for e in entries if not isinstance(e, dict) or 'item_id' not in e or 'method' not in e
+                                                     or not isinstance(e.get('data') or {}, dict)]:
+                raise ValueError
+        except ValueError:
+            return HttpResponseBadRequest(_(u'Expected a list of actions.'))
+
+        found = _find_items(advreport, [e['item_id'] for e in entries])
+        objects = []
+        for entry in entries:
+            object = found.get(unicode(entry['item_id']))
+            if object is not None and object not in objects:
+                objects.append(object)
+        advreport.enrich_list(objects)
+        advreport.prefetch_action_groups(objects)
+        for object in objects:
+            advreport.enrich_object(object, list=False, request=request)
+
+        results = []
+        changed = []
+        for entry in entries:
+            object = found.get(unicode(entry['item_id']))
+            if object is None:
+                results.append({'item_id': unicode(entry['item_id']), 'method': entry['method'],
+                                'error': _(u'No %s found for %s.') % (advreport.verbose_name, entry['item_id'])})
+                continue
+            object_id = advreport.get_item_id(object)
+            result = {'item_id': object_id, 'method': entry['method']}
+            results.append(result)
+            a = advreport.find_object_action(object, entry['method'])
+            if a is None:
+                result['error'] = _(u'Unsupported action method "%s".') % entry['method']
+                continue
+            try:
+                if a.form is not None:
+                    data = _query_dict(entry.get('data') or {})
+                    if issubclass(a.form, forms.ModelForm):
+                        form = a.form(data, instance=a.get_form_instance(object))
+                    else:
+                        form = a.form(data)
+                    if not form.is_valid():
+                        result['errors'] = form.errors
+                        continue
+                    transaction.commit_on_success(advreport.get_action_callable(a.method))(object, form)
+                else:
+                    transaction.commit_on_success(advreport.get_action_callable(a.method))(object)
+            except ActionException, e:
+                result['error'] = e.msg
+                continue
+            except Exception:
+                # The entries that succeeded are committed already, so this entry is only reported.
+                logger.exception('Action %s failed on item %s of report %s', entry['method'], object_id, slug)
+                result['error'] = _(u'An unexpected error occurred.')
+                continue
+            result['success'] = a.get_success_message()
+            if object_id not in changed:
+                changed.append(object_id)
+
+        items = _refetch_items(advreport, changed)
+        advreport.enrich_list(items)
+        advreport.prefetch_action_groups(items)
+        for item in items:
+            advreport.enrich_object(item, list=False, request=request)
+        return _json_response({'results': results, 'items': [_item_values(item, advreport) for item in items]})
+
+    if advreport.decorate_views:
+        inner = advreport.get_decorator()(inner)
+
+    return inner(request, slug)
+
+
+def _json_response(data, status=200):
+    return HttpResponse(simplejson.dumps(data, default=_json_object_encoder), mimetype='application/json', status=status)
+
+
+def _get_export_job(request, slug, job_id):
+    job = ExportJob.load(job_id)
+    if job is None or job.slug != slug:
+        raise Http404
+    user = getattr(request, 'user', None)
+    user_id = user.pk if user is not None and user.is_authenticated() else None
+    if job.user_id != user_id:
+        raise Http404
+    return job
+
+
+def _export_job_dict(advreport, job):
+    d = job.as_dict()
+    d['status_url'] = reverse('advanced_reports_export_status', kwargs={'slug': advreport.slug, 'job_id': job.id})
+    if job.status == ExportJob.DONE:
+        d['download_url'] = reverse('advanced_reports_export_download', kwargs={'slug': advreport.slug, 'job_id': job.id})
+    return d
+
+
+@instrument
+@transaction.autocommit
+@_report_view
+def export(request, slug):
+    advreport = get_report_or_404(slug)
+
+    def inner(request, slug):
+        if request.method != 'POST':
+            return HttpResponse(_(u'Unsupported request method.'), status=405)
+
+        format = request.POST.get('format', request.GET.get('export', 'csv'))
+        get_exporter(format, advreport)
+        job = start_export_job(advreport, request, format)
+        return _json_response(_export_job_dict(advreport, job), status=202)
+
+    if advreport.decorate_views:
+        inner = advreport.get_decorator()(inner)
+
+    return inner(request, slug)
+
+
+@_report_view
+def export_status(request, slug, job_id):
+    advreport = get_report_or_404(slug)
+
+    def inner(request, slug, job_id):
+        job = _get_export_job(request, slug, job_id)
+        return _json_response(_export_job_dict(advreport, job))
+
+    if advreport.decorate_views:
+        inner = advreport.get_decorator()(inner)
+
+    return inner(request, slug, job_id)
+
+
+@_report_view
+def export_download(request, slug, job_id):
+    advreport = get_report_or_404(slug)
+
+    def inner(request, slug, job_id):
+        job = _get_export_job(request, slug, job_id)
+        if job.status != ExportJob.DONE:
+            return _json_response(_export_job_dict(advreport, job), status=409)
+        try:
+            f = open(job.file_path, 'rb')
+        except IOError:
+            raise Http404
+        response = HttpResponse(FileWrapper(f), job.content_type)
+        response['Content-Length'] = os.path.getsize(job.file_path)
+        response['Content-Disposition'] = 'attachment; filename="%s"' % job.filename
+        return response
+
+    if advreport.decorate_views:
+        inner = advreport.get_decorator()(inner)
+
+    return inner(request, slug, job_id)
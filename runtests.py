@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+'''
+Runs the tests of advanced_reports against an in-memory SQLite database:
+
+    python runtests.py
+    python runtests.py advanced_reports.ActionQueryCountTest
+'''
+import os
+import sys
+
+from django.conf import settings
+
+
+def main(labels):
+    settings.configure(
+        DEBUG=False,
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        INSTALLED_APPS=('django.contrib.contenttypes',
+                        'django.contrib.auth',
+                        'django.contrib.sessions',
+                        'django.contrib.messages',
+                        'django_ajax',
+                        'advanced_reports',
+                        'advanced_reports.search_index',
+                        'advanced_reports.benchmarks'),
+        MIDDLEWARE_CLASSES=('django.contrib.sessions.middleware.SessionMiddleware',
+                            'django.contrib.auth.middleware.AuthenticationMiddleware',
+                            'django.contrib.messages.middleware.MessageMiddleware'),
+        TEMPLATE_CONTEXT_PROCESSORS=('django.contrib.auth.context_processors.auth',
+                                     'django.core.context_processors.request',
+                                     'django.contrib.messages.context_processors.messages'),
+        ROOT_URLCONF='advanced_reports.benchmarks.urls',
+        SECRET_KEY='advanced_reports.tests',
+        ADVANCED_REPORTS_QUERY_BUDGET_RAISE=True,
+    )
+    from django.test.simple import DjangoTestSuiteRunner
+    failures = DjangoTestSuiteRunner(verbosity=1, interactive=False).run_tests(labels or ['advanced_reports'])
+    sys.exit(bool(failures))
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main(sys.argv[1:])
@@ -4,21 +4,25 @@ import advanced_reports
 
 setup(
     name="django-advanced-reports",
-    version=advanced_reports.__version__,
+    version=advanced_reports.get_git_version(),
     url='https://github.com/citylive/django-advanced-reports',
     license='BSD',
     description="Advanced reports for Django",
     long_description=open('README.rst', 'r').read(),
     author='Jef Geskens, City Live nv',
-    packages=['advanced_reports'],
+    packages=find_packages(),
     package_data = {'advanced_reports': [
                 'static/*.js', 'static/*/*.js', 'static/*/*/*.js',
                 'static/*.css', 'static/*/*.css', 'static/*/*/*.css',
                 'static/*.png', 'static/*/*.png', 'static/*/*/*.png', 'static/*/*/*/*.png',
                 'templates/*.html', 'templates/*/*.html', 'templates/*/*/*.html', 'templates/*/*/*/*.html',
+                'benchmarks/templates/*/*.html',
                 ],},
     zip_safe=False, # Don't create egg files, Django cannot find templates in egg files.
     include_package_data=True,
+    extras_require={
+        'xlsx': ['XlsxWriter'],
+    },
     classifiers=[
         'Intended Audience :: Developers',
         'Programming Language :: Python',